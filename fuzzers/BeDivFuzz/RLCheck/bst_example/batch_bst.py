@@ -0,0 +1,100 @@
+import numpy as np
+from bst import BinarySearchTree
+
+MAX_DEPTH = 4
+VALUES = range(0, 11)
+BATCH_SIZE = 10000
+
+
+class TreeBatch:
+    """
+    A batch of binary trees of depth at most max_depth in heap layout: slot 0 is the root and
+    slot i has children 2i+1 (left) and 2i+2 (right). `present` and `values` are (trees x slots).
+    """
+
+    def __init__(self, present, values, max_depth=MAX_DEPTH):
+        self.present = present
+        self.values = values
+        self.max_depth = max_depth
+
+    @staticmethod
+    def generate(n, rng=None, max_depth=MAX_DEPTH, values=VALUES):
+        """
+        Samples n trees the way bst_fuzz.generate_tree does with a MockOracle: every node takes a
+        uniform value from `values`, and nodes above max_depth have a left and a right child with
+        probability 1/2 each.
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        slots = 2 ** (max_depth + 1) - 1
+        internal = 2 ** max_depth - 1
+        domain = np.asarray(values)
+        node_values = domain[rng.integers(len(domain), size=(n, slots))]
+        flags = rng.random((n, internal, 2)) < 0.5
+        present = np.zeros((n, slots), dtype=bool)
+        present[:, 0] = True
+        for level in range(max_depth):
+            parents = np.arange(2 ** level - 1, 2 ** (level + 1) - 1)
+            present[:, 2 * parents + 1] = present[:, parents] & flags[:, parents, 0]
+            present[:, 2 * parents + 2] = present[:, parents] & flags[:, parents, 1]
+        return TreeBatch(present, node_values, max_depth)
+
+    def __len__(self):
+        return len(self.present)
+
+    def is_bst(self):
+        """
+        BinarySearchTree.is_bst of every tree: each node must be strictly between the values of the
+        ancestors it is in the right (lower bound) and left (upper bound) subtree of.
+        Bounds are propagated one level at a time for the whole batch.
+        """
+        low = np.full(self.values.shape, -np.inf)
+        high = np.full(self.values.shape, np.inf)
+        for level in range(self.max_depth):
+            parents = np.arange(2 ** level - 1, 2 ** (level + 1) - 1)
+            parent_values = self.values[:, parents]
+            low[:, 2 * parents + 1] = low[:, parents]
+            high[:, 2 * parents + 1] = parent_values
+            low[:, 2 * parents + 2] = parent_values
+            high[:, 2 * parents + 2] = high[:, parents]
+        in_bounds = (self.values > low) & (self.values < high)
+        return (in_bounds | ~self.present).all(axis=1)
+
+    def sizes(self):
+        return self.present.sum(axis=1)
+
+    def depths(self):
+        levels = np.floor(np.log2(np.arange(1, self.present.shape[1] + 1))).astype(np.int64)
+        return np.where(self.present, levels, 0).max(axis=1)
+
+    def codes(self):
+        """Canonical encoding of every tree: one byte per slot, value + 1 if present, else 0."""
+        return np.where(self.present, self.values + 1, 0).astype(np.uint8)
+
+    def tree(self, i):
+        def build(slot):
+            if slot >= self.present.shape[1] or not self.present[i, slot]:
+                return None
+            node = BinarySearchTree(self.values[i, slot].item())
+            node.left = build(2 * slot + 1)
+            node.right = build(2 * slot + 2)
+            return node
+        return build(0)
+
+
+def random_baseline(trials, batch_size=BATCH_SIZE, rng=None, max_depth=MAX_DEPTH, values=VALUES):
+    """
+    Random generation of `trials` trees in batches. Returns the number of valid BSTs and a dict
+    from the encoding of every unique valid BST to its size, as bst_fuzz.run_trials does.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    valids = 0
+    valid_set = {}
+    for start in range(0, trials, batch_size):
+        batch = TreeBatch.generate(min(batch_size, trials - start), rng, max_depth, values)
+        valid = batch.is_bst()
+        valids += int(valid.sum())
+        codes, first = np.unique(batch.codes()[valid], axis=0, return_index=True)
+        sizes = batch.sizes()[valid][first]
+        for code, size in zip(codes, sizes.tolist()):
+            valid_set.setdefault(code.tobytes(), size)
+    return valids, valid_set
@@ -1,60 +1,165 @@
+import argparse
+import functools
 import random
 import sys
+from batch_bst import random_baseline
 from bst import BinarySearchTree
 from collections import Counter
 from oracles import MockOracle, Oracle
+from parallel_fuzz import fuzz_parallel
+from pipelined_fuzz import fuzz_pipelined
 from state_abstraction import parent_state_ngram_fn, left_right_parent_state_ngram_fn, sequence_ngram_fn
 
 
 MAX_DEPTH = 4
+TRIALS = 100000
+TECHNIQUES = ["Random", "Sequence", "Tree", "Tree L/R"]
 
-def generate_tree(oracle, depth=0):
+class TreeRecord:
+    """
+    A generated tree with what the fuzzing loop needs to know about it, recorded during generation:
+    a canonical preorder encoding (value + 1 per node, 0 per missing child), the number of nodes,
+    the maximum node depth and whether it is a BST.
+    """
+    __slots__ = ("tree", "code", "size", "depth", "valid")
+
+    def __init__(self):
+        self.tree = None
+        self.code = bytearray()
+        self.size = 0
+        self.depth = 0
+        self.valid = True
+
+    def is_bst(self):
+        return self.valid
+
+def generate_tree(oracle, depth=0, record=None, low=None, high=None):
     value = oracle.Select(range(0, 11), 1)
     tree = BinarySearchTree(value) 
+    if record is not None:
+        record.code.append(value + 1)
+        record.size += 1
+        record.depth = max(record.depth, depth)
+        # Left subtrees must hold smaller values and right subtrees larger ones than every ancestor
+        if (low is not None and value <= low) or (high is not None and value >= high):
+            record.valid = False
     if depth < MAX_DEPTH and \
             oracle.Select([True, False], 2):
-        tree.left = generate_tree(oracle, depth+1)
+        tree.left = generate_tree(oracle, depth+1, record, low, value)
+    elif record is not None:
+        record.code.append(0)
     if depth < MAX_DEPTH and \
             oracle.Select([True, False], 3):
-        tree.right = generate_tree(oracle, depth+1) 
+        tree.right = generate_tree(oracle, depth+1, record, value, high) 
+    elif record is not None:
+        record.code.append(0)
     return tree 
 
+def generate_tree_record(oracle):
+    record = TreeRecord()
+    record.tree = generate_tree(oracle, record=record)
+    record.code = bytes(record.code)
+    return record
+
 def is_BST(tree):
     return tree.is_bst()
 
-def fuzz(oracle, validity_fn):
+def make_oracle(technique):
+    if technique == "Random":
+        return MockOracle()
+    elif technique == "Sequence":
+        return Oracle(sequence_ngram_fn(4), epsilon=0.25)
+    elif technique == "Tree":
+        return Oracle(parent_state_ngram_fn(4, MAX_DEPTH), epsilon=0.25)
+    elif technique == "Tree L/R":
+        return Oracle(left_right_parent_state_ngram_fn(4, MAX_DEPTH), epsilon=0.25)
+    raise ValueError("Unknown technique {}".format(technique))
+
+def run_trials(oracle, validity_fn, trials, valid_set, found=None):
+    """
+    Generates and rewards `trials` trees, adding the encodings of unique valid trees to
+    the valid_set dict (encoding -> size) and to found, if given. validity_fn is called on
+    the TreeRecord. Returns the number of valid trees.
+    """
     valids = 0
- #   print("Starting!", file=sys.stderr)
-    valid_set = set()
-    trials = 100000
     for i in range(trials):
 #        print("{} trials, {} valids, {} unique valids             ".format(i+1, valids, len(valid_set)), end ='\r', file=sys.stderr)
-        tree = generate_tree(oracle)
-        is_valid = validity_fn(tree)
+        record = generate_tree_record(oracle)
+        is_valid = validity_fn(record)
         if is_valid:
             valids += 1
-            if tree.__repr__() not in valid_set:
-                valid_set.add(tree.__repr__())
+            if record.code not in valid_set:
+                valid_set[record.code] = record.size
+                if found is not None:
+                    found.append((record.code, record.size))
                 oracle.reward(20)
             else:
                 oracle.reward(0)
         else:
             oracle.reward(-1)
-    sizes = [valid_tree.count("(") for valid_tree in valid_set]
+    return valids
+
+def run_trials_pipelined(oracle, validity_fn, trials, valid_set, depth):
+    """
+    run_trials with up to `depth` trees generated ahead of their validity check and reward.
+    Returns the number of valid trees and the PipelineStats of the run.
+    """
+    valids = 0
+
+    def execute(records):
+        return [validity_fn(record) for record in records]
+
+    def score(episode_id, record, is_valid):
+        nonlocal valids
+        if not is_valid:
+            return -1
+        valids += 1
+        if record.code in valid_set:
+            return 0
+        valid_set[record.code] = record.size
+        return 20
+
+    stats = fuzz_pipelined(oracle, generate_tree_record, execute, score, trials, depth)
+    return valids, stats
+
+def report(trials, valids, valid_set):
     print("{} trials, {} valids, {} unique valids".format(trials, valids, len(valid_set)), end ='\r')
   #  print("\ndone!", file=sys.stderr)
-    print(Counter(sizes))
+    print(Counter(valid_set.values()))
+
+def fuzz(oracle, validity_fn, trials=TRIALS):
+ #   print("Starting!", file=sys.stderr)
+    valid_set = {}
+    valids = run_trials(oracle, validity_fn, trials, valid_set)
+    report(trials, valids, valid_set)
 
 if __name__ == '__main__':
-    print("====Random====")
-    mo = MockOracle()
-    fuzz(mo, is_BST)
-    print("====Sequence====")
-    oracle_s = Oracle(sequence_ngram_fn(4), epsilon=0.25)
-    fuzz(oracle_s, is_BST)
-    print("====Tree====")
-    oracle_t = Oracle(parent_state_ngram_fn(4, MAX_DEPTH), epsilon=0.25)
-    fuzz(oracle_t, is_BST)
-    print("====Tree L/R====")
-    oracle_lrt = Oracle(left_right_parent_state_ngram_fn(4, MAX_DEPTH), epsilon=0.25)
-    fuzz(oracle_lrt, is_BST)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1,
+                        help="fuzz each technique with this many processes, merging their learners periodically")
+    parser.add_argument("--sync-every", type=int, default=1000,
+                        help="trials per worker between merges")
+    parser.add_argument("--trials", type=int, default=TRIALS)
+    parser.add_argument("--batch-random", action="store_true",
+                        help="generate the Random technique's trees in NumPy batches (same distribution)")
+    parser.add_argument("--pipeline-depth", type=int, default=0,
+                        help="generate up to this many trees ahead of their check and reward; "
+                             "pipeline stats go to stderr")
+    args = parser.parse_args()
+    for technique in TECHNIQUES:
+        print("===={}====".format(technique))
+        if technique == "Random" and args.batch_random:
+            valids, valid_set = random_baseline(args.trials)
+            report(args.trials, valids, valid_set)
+        elif args.workers > 1:
+            valids, valid_set = fuzz_parallel(functools.partial(make_oracle, technique), run_trials, is_BST,
+                                              args.trials, args.workers, args.sync_every)
+            report(args.trials, valids, valid_set)
+        elif args.pipeline_depth > 0:
+            valid_set = {}
+            valids, stats = run_trials_pipelined(make_oracle(technique), is_BST, args.trials, valid_set,
+                                                 args.pipeline_depth)
+            report(args.trials, valids, valid_set)
+            print(stats.report(), file=sys.stderr)
+        else:
+            fuzz(make_oracle(technique), is_BST, args.trials)
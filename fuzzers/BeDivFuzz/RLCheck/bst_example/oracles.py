@@ -1,82 +1,220 @@
 import random
 import numpy as np
 from numpy.random import binomial
-from collections import defaultdict
+
+# Exploration coin flips are drawn from NumPy's global generator this many at a time;
+# the flips are the same as drawing them one per Select
+FLIP_BLOCK = 4096
+# Episodes at least this long are updated with array operations; shorter ones are cheaper in a Python loop
+VECTOR_MIN_EPISODE = 32
 
 class MockOracle:
     def Select(self, domain,idx):
         return random.choice(domain)
 
-    def reward(self, r):
+    def end_episode(self):
+        return None
+
+    def reward(self, r, episode=None):
         pass
 
 class Oracle:
     def Select(self, domain, idx):
-        abstract_state = self.abstract_state_fn(self.choice_sequence)
-        if not idx in self.learners:
-            self.learners[idx] = Learner(self.epsilon, self.gamma, self.initial_val)
-        choice = self.learners[idx].policy(domain, abstract_state)
+        if self.incremental:
+            abstract_state = self.abstract_state_fn.abstract()
+        else:
+            abstract_state = self.abstract_state_fn(self.choice_sequence)
+        if not self.flips:
+            self.flips = binomial(1, self.epsilon, FLIP_BLOCK).tolist()
+            self.flips.reverse()
+        learner = self.learners.get(idx)
+        if learner is None:
+            learner = self.learner(idx)
+        choice = learner.policy(domain, abstract_state, self.flips.pop())
         self.choice_sequence.append(choice)
+        if self.incremental:
+            self.abstract_state_fn.append(choice)
         return choice
 
     def __init__(self, abstract_state_fn, epsilon=0.25, gamma=1.0, initial_val=0):
         self.abstract_state_fn = abstract_state_fn
+        # Incremental abstractions (e.g. ParentStateNgram) follow the choices as they are made
+        # instead of re-reading the whole choice sequence on every Select
+        self.incremental = hasattr(abstract_state_fn, "append")
         self.learners = {}
         self.choice_sequence = []
         self.epsilon = epsilon
         self.gamma = gamma
         self.initial_val = initial_val
+        self.flips = []
 
-    # updates upon full episodes
-    def reward(self, reward):
-        for learner in self.learners.values():
-            learner.reward(reward)
+    def learner(self, idx):
+        if not idx in self.learners:
+            self.learners[idx] = Learner(self.epsilon, self.gamma, self.initial_val)
+        return self.learners[idx]
+
+    def end_episode(self):
+        """
+        Detaches the choices of the current episode from the learners, so that the next
+        episode can start before this one is rewarded. Pass the result to reward().
+        """
+        episode = {idx: learner.end_episode() for idx, learner in self.learners.items()}
         self.choice_sequence = []
+        if self.incremental:
+            self.abstract_state_fn.reset()
+        return episode
+
+    # updates upon full episodes
+    def reward(self, reward, episode=None):
+        if episode is None:
+            episode = self.end_episode()
+        for idx, choices in episode.items():
+            self.learners[idx].reward(reward, choices)
 
 class Learner:
+    """
+    Monte-Carlo learner over (abstract state, action) pairs. Abstract states and actions are
+    interned to dense integer ids, and Q and C live in 2D arrays (state id x action id) that
+    grow as new states and actions show up.
+    """
 
     def __init__(self,  epsilon=0.25, gamma=1.0, initial_val=0):
         self.epsilon = epsilon
         self.gamma = gamma
-        self.choice_state_sequence = []
         self.initial_val = initial_val
-        self.Q_table = defaultdict(dict)
-        self.C_table = defaultdict(dict)
+        self.state_ids = {}
+        self.action_ids = {}
+        self.domains = {}
+        self.Q_table = np.full((64, 16), initial_val, dtype=np.float64)
+        self.C_table = np.full((64, 16), initial_val, dtype=np.float64)
+        self.episode = []
 
-    # updates upon full episodes
-    def reward(self, reward):
-         # reward the last choice
-         self.choice_state_sequence[-1][2] = reward
-         T = len(self.choice_state_sequence)
-         G = 0
-         W = 1
-         for i in range(T):
-             s, a, r = self.choice_state_sequence[T - i - 1] # ranges from T-1, T-2, ... 0.
-             G = self.gamma*G + r
-             self.C_table[s][a] = self.C(s, a) + W
-             self.Q_table[s][a] = self.Q(s, a) + (W/self.C(s, a)) * (G - self.Q(s, a))
-         self.choice_state_sequence = []
+    def _grow(self):
+        rows, cols = self.Q_table.shape
+        if len(self.state_ids) <= rows and len(self.action_ids) <= cols:
+            return
+        while rows < len(self.state_ids):
+            rows *= 2
+        while cols < len(self.action_ids):
+            cols *= 2
+        for name in ("Q_table", "C_table"):
+            old = getattr(self, name)
+            new = np.full((rows, cols), self.initial_val, dtype=np.float64)
+            new[:old.shape[0], :old.shape[1]] = old
+            setattr(self, name, new)
+
+    def state_id(self, s):
+        sid = self.state_ids.get(s)
+        if sid is None:
+            sid = self.state_ids[s] = len(self.state_ids)
+            self._grow()
+        return sid
+
+    def action_id(self, a):
+        aid = self.action_ids.get(a)
+        if aid is None:
+            aid = self.action_ids[a] = len(self.action_ids)
+            self._grow()
+        return aid
+
+    def domain_ids(self, domain):
+        """
+        The domain as a list and the columns of its actions, cached per domain.
+        Columns are a slice when the actions have consecutive ids (the usual case), else an index array.
+        """
+        key = domain if isinstance(domain, range) else tuple(domain)
+        cached = self.domains.get(key)
+        if cached is None:
+            domain = list(domain)
+            ids = [self.action_id(a) for a in domain]
+            if ids == list(range(ids[0], ids[0] + len(ids))):
+                columns = slice(ids[0], ids[0] + len(ids))
+            else:
+                columns = np.array(ids, dtype=np.intp)
+            cached = self.domains[key] = (domain, ids, columns)
+        return cached
+
+    def end_episode(self):
+        episode = self.episode
+        self.episode = []
+        return episode
+
+    # updates upon full episodes, by default the current one
+    def reward(self, reward, episode=None):
+        if episode is None:
+            episode = self.end_episode()
+        if not episode:
+            return
+        T = len(episode)
+        width = self.Q_table.shape[1]
+        Q = self.Q_table.reshape(-1)
+        C = self.C_table.reshape(-1)
+        # Only the last choice is rewarded; returns are listed from the last choice backwards
+        if self.gamma == 1:
+            returns = [reward] * T
+        else:
+            returns = [reward]
+            for _ in range(T - 1):
+                returns.append(self.gamma * returns[-1])
+        cells = [s * width + a for s, a in reversed(episode)]
+        if T >= VECTOR_MIN_EPISODE and len(set(cells)) == T:
+            cells = np.array(cells, dtype=np.intp)
+            C[cells] += 1
+            q = Q[cells]
+            Q[cells] = q + (1 / C[cells]) * (np.array(returns, dtype=np.float64) - q)
+        else:
+            # In order, so a pair chosen more than once sees the updates of its later occurrences first
+            for cell, G in zip(cells, returns):
+                c = C.item(cell) + 1
+                C[cell] = c
+                q = Q.item(cell)
+                Q[cell] = q + (1 / c) * (G - q)
+
+    def tables(self):
+        """States and actions in id order, with copies of their Q and C tables."""
+        Q = self.Q_table[:len(self.state_ids), :len(self.action_ids)].copy()
+        C = self.C_table[:len(self.state_ids), :len(self.action_ids)].copy()
+        return list(self.state_ids), list(self.action_ids), Q, C
+
+    def load_tables(self, states, actions, Q, C):
+        """Replaces the learned values with the given tables, in the format of tables()."""
+        self.state_ids = {s: i for i, s in enumerate(states)}
+        self.action_ids = {a: i for i, a in enumerate(actions)}
+        self.domains = {}
+        self.Q_table = np.full((64, 16), self.initial_val, dtype=np.float64)
+        self.C_table = np.full((64, 16), self.initial_val, dtype=np.float64)
+        self._grow()
+        self.Q_table[:len(states), :len(actions)] = Q
+        self.C_table[:len(states), :len(actions)] = C
+        self.episode = []
 
     def Q(self, s: str, a: str):
-        try:
-            return self.Q_table[s][a]
-        except KeyError:
+        if s not in self.state_ids or a not in self.action_ids:
             return self.initial_val
+        return self.Q_table[self.state_ids[s], self.action_ids[a]]
 
     def C(self, s: str, a: str):
-        try:
-            return self.C_table[s][a]
-        except KeyError:
+        if s not in self.state_ids or a not in self.action_ids:
             return self.initial_val
+        return self.C_table[self.state_ids[s], self.action_ids[a]]
 
-    def policy(self, domain, state):
-        domain = list(domain)
-        # Epsilon-greedy strategy
-        if binomial(1, self.epsilon):
-            choice = random.choice(domain)
+    def policy(self, domain, state, explore=None):
+        """Epsilon-greedy choice from domain in state. explore is the coin flip, drawn here if not given."""
+        cached = self.domains.get(domain if type(domain) is range else tuple(domain))
+        domain, ids, columns = self.domain_ids(domain) if cached is None else cached
+        sid = self.state_ids.get(state)
+        if sid is None:
+            sid = self.state_id(state)
+        if explore is None:
+            explore = binomial(1, self.epsilon)
+        if explore:
+            action_idx = random.randrange(len(domain))
         else:
-            self.action_values = np.array([self.Q(state, a) for a in domain])
-            action_idx = random.choice(np.flatnonzero(self.action_values == self.action_values.max())) # break ties randomly
-            choice = domain[action_idx]
-        self.choice_state_sequence.append([state, choice, 0])
-        return choice
+            # Domains are small, so a Python scan of the row beats NumPy reductions here
+            values = self.Q_table[sid, columns].tolist()
+            best = max(values)
+            action_idx = values.index(best)
+            if values.count(best) > 1:
+                action_idx = random.choice([i for i, v in enumerate(values) if v == best]) # break ties randomly
+        self.episode.append((sid, ids[action_idx]))
+        return domain[action_idx]
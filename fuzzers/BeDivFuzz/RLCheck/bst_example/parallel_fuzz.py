@@ -0,0 +1,184 @@
+import multiprocessing
+import random
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+
+class MergedTable:
+    """
+    Learned values of one learner (one Select idx) merged over all workers.
+    Keeps C and S = Q * C: every Monte-Carlo update adds 1 to C and the return to S,
+    so the updates of different workers merge by adding their count-weighted deltas.
+    """
+
+    def __init__(self, initial_val):
+        self.initial_val = initial_val
+        self.states = []
+        self.state_ids = {}
+        self.actions = []
+        self.action_ids = {}
+        self.C = np.zeros((0, 0))
+        self.S = np.zeros((0, 0))
+        self.published = 0
+
+    def _intern(self, names, ids, values):
+        for v in values:
+            if v not in ids:
+                ids[v] = len(names)
+                names.append(v)
+        return [ids[v] for v in values]
+
+    def add(self, states, actions, dC, dS):
+        rows = self._intern(self.states, self.state_ids, states)
+        cols = self._intern(self.actions, self.action_ids, actions)
+        shape = (len(self.states), len(self.actions))
+        if shape != self.C.shape:
+            pad = ((0, shape[0] - self.C.shape[0]), (0, shape[1] - self.C.shape[1]))
+            self.C = np.pad(self.C, pad, constant_values=self.initial_val)
+            self.S = np.pad(self.S, pad, constant_values=self.initial_val * self.initial_val)
+        self.C[np.ix_(rows, cols)] += dC
+        self.S[np.ix_(rows, cols)] += dS
+
+    def Q(self):
+        Q = np.full(self.C.shape, self.initial_val, dtype=np.float64)
+        return np.divide(self.S, self.C, out=Q, where=self.C != 0)
+
+
+class SharedModel:
+    """
+    Merged tables of every learner, published to the workers through one shared memory
+    block per learner holding [Q, C]. Workers only receive the states added since the last publish.
+    """
+
+    def __init__(self, initial_val):
+        self.initial_val = initial_val
+        self.tables = {}
+        self.blocks = []
+
+    def add(self, idx, states, actions, dC, dS):
+        if idx not in self.tables:
+            self.tables[idx] = MergedTable(self.initial_val)
+        self.tables[idx].add(states, actions, dC, dS)
+
+    def publish(self):
+        message = {}
+        for idx, table in self.tables.items():
+            shape = table.C.shape
+            block = shared_memory.SharedMemory(create=True, size=max(1, 2 * table.C.size * 8))
+            arrays = np.ndarray((2,) + shape, dtype=np.float64, buffer=block.buf)
+            arrays[0] = table.Q()
+            arrays[1] = table.C
+            del arrays
+            self.blocks.append(block)
+            message[idx] = (table.states[table.published:], list(table.actions), block.name, shape)
+            table.published = len(table.states)
+        return message
+
+    def release(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def table_delta(learner, base):
+    """Rows of the learner's C and S = Q * C that changed since the tables in base were loaded."""
+    states, actions, Q, C = learner.tables()
+    Q0 = np.full(Q.shape, learner.initial_val, dtype=np.float64)
+    C0 = np.full(C.shape, learner.initial_val, dtype=np.float64)
+    if base is not None:
+        base_Q, base_C = base
+        Q0[:base_Q.shape[0], :base_Q.shape[1]] = base_Q
+        C0[:base_C.shape[0], :base_C.shape[1]] = base_C
+    dC = C - C0
+    dS = Q * C - Q0 * C0
+    rows = np.flatnonzero((dC != 0).any(axis=1))
+    return [states[r] for r in rows], actions, dC[rows], dS[rows]
+
+
+def worker(conn, make_oracle, run_trials, validity_fn, seed):
+    random.seed(seed)
+    np.random.seed(seed % 2**32)
+    oracle = make_oracle()
+    valid_set = {}
+    vocab = {}
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        trials, model, new_valids = message
+        valid_set.update(new_valids)
+        base = {}
+        for idx, (added_states, actions, block_name, shape) in model.items():
+            states = vocab.setdefault(idx, [])
+            states.extend(added_states)
+            block = shared_memory.SharedMemory(name=block_name)
+            arrays = np.ndarray((2,) + shape, dtype=np.float64, buffer=block.buf)
+            base[idx] = (arrays[0].copy(), arrays[1].copy())
+            del arrays
+            block.close()
+            oracle.learner(idx).load_tables(states, actions, *base[idx])
+        found = []
+        valids = run_trials(oracle, validity_fn, trials, valid_set, found)
+        deltas = {idx: table_delta(learner, base.get(idx))
+                  for idx, learner in getattr(oracle, "learners", {}).items()}
+        conn.send((valids, found, deltas))
+    conn.close()
+
+
+def fuzz_parallel(make_oracle, run_trials, validity_fn, trials, workers, sync_every=1000, seed=None):
+    """
+    Runs `trials` trials of run_trials(oracle, validity_fn, n, valid_set, found) over `workers`
+    processes, each with its own oracle from make_oracle(). run_trials records unique valid inputs
+    as keys of valid_set, and appends (key, value) pairs of new ones to found.
+    Every `sync_every` trials per worker, the learners of all workers are merged and every worker
+    continues from the merged model and the merged unique valid inputs.
+    Returns the number of valid inputs and the merged valid_set.
+    """
+    if seed is None:
+        seed = random.randrange(2**32)
+    model = SharedModel(getattr(make_oracle(), "initial_val", 0))
+    # Workers must share this process's resource tracker: one of their own would unlink
+    # the published blocks when the worker exits
+    resource_tracker.ensure_running()
+    conns = []
+    processes = []
+    for i in range(workers):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=worker,
+                                          args=(child_conn, make_oracle, run_trials, validity_fn, seed + i))
+        process.start()
+        child_conn.close()
+        conns.append(parent_conn)
+        processes.append(process)
+
+    valids = 0
+    valid_set = {}
+    new_valids = []
+    remaining = trials
+    try:
+        while remaining > 0:
+            round_trials = min(remaining, sync_every * workers)
+            message = model.publish()
+            for i, conn in enumerate(conns):
+                conn.send((round_trials // workers + (i < round_trials % workers), message, new_valids))
+            results = [conn.recv() for conn in conns]
+            model.release()
+            new_valids = []
+            for worker_valids, found, deltas in results:
+                valids += worker_valids
+                for key, value in found:
+                    if key not in valid_set:
+                        valid_set[key] = value
+                        new_valids.append((key, value))
+                for idx, delta in deltas.items():
+                    model.add(idx, *delta)
+            remaining -= round_trials
+    finally:
+        model.release()
+        for conn in conns:
+            conn.send(None)
+            conn.close()
+        for process in processes:
+            process.join()
+    return valids, valid_set
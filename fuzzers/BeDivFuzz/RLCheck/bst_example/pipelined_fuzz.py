@@ -0,0 +1,118 @@
+import asyncio
+import math
+import time
+from collections import Counter
+
+STAGES = ["generate", "wait", "execute", "reward"]
+
+
+class LatencyHistogram:
+    """Latencies in power-of-two microsecond buckets: bucket b holds latencies in [2^(b-1), 2^b) us."""
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        us = seconds * 1e6
+        self.buckets[0 if us < 1 else int(math.log2(us)) + 1] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, p):
+        """Upper bound in seconds of the bucket holding the p-th percentile."""
+        if self.count == 0:
+            return 0.0
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= p / 100 * self.count:
+                return 2 ** bucket / 1e6
+        return 2 ** max(self.buckets) / 1e6
+
+    def __str__(self):
+        if self.count == 0:
+            return "no samples"
+        return "n={} mean={:.1f}us p50<{:.0f}us p99<{:.0f}us".format(
+            self.count, self.total / self.count * 1e6, self.percentile(50) * 1e6, self.percentile(99) * 1e6)
+
+
+class PipelineStats:
+    """
+    Per-stage latency histograms of the inputs of a pipelined run (generate, wait for the executor,
+    execute, reward) and a histogram of the in-flight depth seen by every new input.
+    """
+
+    def __init__(self):
+        self.latency = {stage: LatencyHistogram() for stage in STAGES}
+        self.depth = Counter()
+        self.batches = Counter()
+
+    def report(self):
+        lines = ["{:>8}: {}".format(stage, self.latency[stage]) for stage in STAGES]
+        lines.append("in-flight depth: {}".format(dict(sorted(self.depth.items()))))
+        lines.append("batch sizes: {}".format(dict(sorted(self.batches.items()))))
+        return "\n".join(lines)
+
+
+async def _fuzz_pipelined(oracle, generate, execute, score, trials, depth, max_batch, executor, stats):
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(depth)
+    queue = asyncio.Queue()
+    in_flight = 0
+
+    async def produce():
+        nonlocal in_flight
+        for episode_id in range(trials):
+            await slots.acquire()
+            stats.depth[in_flight] += 1
+            in_flight += 1
+            start = time.perf_counter()
+            generated = generate(oracle)
+            episode = oracle.end_episode()
+            submitted = time.perf_counter()
+            stats.latency["generate"].record(submitted - start)
+            queue.put_nowait((episode_id, generated, episode, submitted))
+            # Let the consumer pick up results before generating more
+            await asyncio.sleep(0)
+
+    async def consume():
+        nonlocal in_flight
+        done = 0
+        while done < trials:
+            batch = [await queue.get()]
+            while len(batch) < max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            start = time.perf_counter()
+            results = await loop.run_in_executor(executor, execute, [generated for _, generated, _, _ in batch])
+            end = time.perf_counter()
+            stats.batches[len(batch)] += 1
+            for (episode_id, generated, episode, submitted), result in zip(batch, results):
+                stats.latency["wait"].record(start - submitted)
+                stats.latency["execute"].record(end - start)
+                reward_start = time.perf_counter()
+                # Credit goes to the choices that generated this input, whatever was generated since
+                oracle.reward(score(episode_id, generated, result), episode)
+                stats.latency["reward"].record(time.perf_counter() - reward_start)
+                in_flight -= 1
+                slots.release()
+            done += len(batch)
+
+    await asyncio.gather(produce(), consume())
+
+
+def fuzz_pipelined(oracle, generate, execute, score, trials, depth=16, max_batch=8, executor=None):
+    """
+    Runs `trials` episodes of generate(oracle) -> execute -> oracle.reward with generation running
+    ahead of execution, so the generator keeps working while inputs execute.
+    At most `depth` inputs are in flight (generated but not yet rewarded). The executor thread
+    calls execute(inputs) on batches of up to `max_batch` queued inputs; it must return one result
+    per input, and should release the GIL while it waits (e.g. on afl_proxy.JQFProgram.run_batch).
+    The reward of an input is score(episode_id, input, result), applied to the choices detached
+    from the oracle right after generating it, in submission order.
+    Returns the PipelineStats of the run.
+    """
+    stats = PipelineStats()
+    asyncio.run(_fuzz_pipelined(oracle, generate, execute, score, trials, depth, max_batch, executor, stats))
+    return stats
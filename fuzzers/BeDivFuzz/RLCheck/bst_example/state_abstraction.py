@@ -7,13 +7,171 @@ def ngram_abstraction_fn(k):
     return ngram_abstractor
 
 def sequence_ngram_fn(k):
-    return lambda state: ngram_abstraction_fn(k)(state)
+    return SequenceNgram(k)
 
 def parent_state_ngram_fn(k, max_depth):
-    return lambda state: ngram_abstraction_fn(k)(parent_state(state, max_depth))
+    return ParentStateNgram(k, max_depth)
 
 def left_right_parent_state_ngram_fn(k, max_depth):
-    return lambda state: ngram_abstraction_fn(k)(left_right_parent_state(state, max_depth))
+    return ParentStateNgram(k, max_depth, left_right=True)
+
+
+class SequenceNgram:
+    """
+    n-gram over the last k choices, kept up to date as choices are appended. Calling it on a
+    full sequence gives the same result as ngram_abstraction_fn(k).
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.last = []
+
+    def reset(self):
+        self.last = []
+
+    def append(self, choice):
+        self.last.append(str(choice))
+        if self.k and len(self.last) > self.k:
+            del self.last[0]
+
+    def abstract(self):
+        return "->".join(self.last)
+
+    def __call__(self, state):
+        return ngram_abstraction_fn(self.k)(state)
+
+
+class ParentStateNgram:
+    """
+    n-gram over parent_state (or left_right_parent_state) of a choice sequence, kept up to date
+    as choices are appended so each abstraction costs O(k). Calling it on a full sequence
+    gives the same result as the non-incremental abstraction.
+    """
+
+    def __init__(self, k, max_depth, left_right=False):
+        self.k = k
+        self.max_depth = max_depth
+        self.left_right = left_right
+        self.tracker = TreeChoiceTracker(max_depth)
+
+    def reset(self):
+        self.tracker.reset()
+
+    def append(self, choice):
+        self.tracker.append(choice)
+
+    def abstract(self):
+        return "->".join([str(e) for e in self.tracker.path(self.left_right, self.k)])
+
+    def __call__(self, state):
+        tracker = TreeChoiceTracker(self.max_depth)
+        for e in state:
+            tracker.append(e)
+        return "->".join([str(e) for e in tracker.path(self.left_right, self.k)])
+
+
+_VALUE_TYPES = {}
+
+def is_value(e):
+    """Node values are ints (of any int type), everything else is a child flag."""
+    t = type(e)
+    value = _VALUE_TYPES.get(t)
+    if value is None:
+        value = _VALUE_TYPES[t] = 'int' in str(t)
+    return value
+
+
+class TreeChoiceTracker:
+    """
+    Incremental get_trees_max_depth. Stack entries are [start, left flag, right flag, link],
+    where link is the position of the parent flag leading to the subtree (None for a root).
+    """
+
+    def __init__(self, max_depth):
+        self.max_depth = max_depth
+        self.reset()
+
+    def reset(self):
+        self.state = []
+        self.parent_stack = []
+        self.full_trees = []
+        self.finished = set()
+
+    def append(self, e):
+        i = len(self.state)
+        self.state.append(e)
+        parent_stack = self.parent_stack
+        if is_value(e):
+            if len(parent_stack) < self.max_depth:
+                link = None
+                if parent_stack and i - 1 in (parent_stack[-1][1], parent_stack[-1][2]):
+                    link = i - 1
+                parent_stack.append([i, -1, -1, link])
+            else:
+                self.finish((i, False, False))
+        else:
+            parent = parent_stack[-1]
+            if parent[1] == -1:
+                parent[1] = i
+            elif parent[2] == -1:
+                parent[2] = i
+                if not e:
+                    parent_stack.pop()
+                    self.finish((parent[0], parent[1], parent[2]))
+
+    def finish(self, tree):
+        """Records a finished tree, then every parent whose children are now all finished."""
+        self.full_trees.append(tree)
+        self.finished.add(tree[0])
+        state = self.state
+        while self.parent_stack:
+            start, left, right, _ = self.parent_stack[-1]
+            if left == -1 or right == -1:
+                break
+            if state[left] and left + 1 not in self.finished:
+                break
+            if state[right] and right + 1 not in self.finished:
+                break
+            self.parent_stack.pop()
+            self.full_trees.append((start, left, right))
+            self.finished.add(start)
+
+    def trees(self):
+        return [tuple(posns[:3]) for posns in self.parent_stack], list(self.full_trees)
+
+    def path(self, left_right=False, k=0):
+        """
+        The last k elements (all if k is 0) of parent_state, or of left_right_parent_state
+        if left_right, of the choices so far.
+        """
+        parent_stack = self.parent_stack
+        state = self.state
+        if not parent_stack:
+            return []
+        limit = k if k > 0 else len(state)
+        path = []
+        if state[-1] is True:
+            last_posn = len(state) - 1
+            top = parent_stack[-1]
+            if left_right and last_posn == top[1]:
+                path.append('LEFT')
+            elif left_right and last_posn == top[2]:
+                path.append('RIGHT')
+            else:
+                path.append(True)
+        for j in reversed(range(len(parent_stack))):
+            if len(path) >= limit:
+                break
+            start, _, _, link = parent_stack[j]
+            path.append(state[start])
+            if link is None:
+                break
+            if left_right:
+                path.append('LEFT' if link == parent_stack[j - 1][1] else 'RIGHT')
+            else:
+                path.append(state[link])
+        path.reverse()
+        return path[-limit:]
 
 
 def parent_state(state, max_depth):
@@ -42,24 +200,10 @@ def parent_state(state, max_depth):
     """
     if len(state) == 0:
         return state
-    parent_trees, full_trees = get_trees_max_depth(state, max_depth)
-    if len(parent_trees) == 0:
-        return []
-    last_tree_start = parent_trees[-1][0]
-    my_posns = [last_tree_start]
-    for tree_posns in reversed(parent_trees[:-1]):
-        if tree_posns[1] == last_tree_start -1:
-            my_posns.append(tree_posns[1])
-            last_tree_start = tree_posns[0]
-        elif tree_posns[2] == last_tree_start -1:
-            my_posns.append(tree_posns[2])
-            last_tree_start = tree_posns[0] 
-        else:
-            print("is this even possible??", state, parent_tres)
-        my_posns.append(last_tree_start)
-    if state[-1] is True:
-        my_posns.append(len(state)-1)
-    return [state[i] for i in range(len(state)) if i in my_posns]
+    tracker = TreeChoiceTracker(max_depth)
+    for e in state:
+        tracker.append(e)
+    return tracker.path()
 
 def left_right_parent_state(state, max_depth):
     """
@@ -85,35 +229,10 @@ def left_right_parent_state(state, max_depth):
     >>> left_right_parent_state(s, 2)
     [-10, 'RIGHT']
     """
-    state = state[:]
-    parent_trees, full_trees = get_trees_max_depth(state, max_depth)
-    if len(parent_trees) == 0:
-        return []
-    last_tree_start = parent_trees[-1][0]
-    my_posns = [last_tree_start]
-    for tree_posns in reversed(parent_trees[:-1]):
-        if tree_posns[1] == last_tree_start -1:
-            my_posns.append(tree_posns[1])
-            state[tree_posns[1]]= "LEFT"
-            last_tree_start = tree_posns[0]
-        elif tree_posns[2] == last_tree_start -1:
-            my_posns.append(tree_posns[2])
-            state[tree_posns[2]]= "RIGHT"
-            last_tree_start = tree_posns[0] 
-        else:
-            print(tree_posns, last_tree_start)
-            print("is this even possible??", state, parent_trees)
-        my_posns.append(last_tree_start)
-    if state[-1] is True:
-        last_posn = len(state) - 1
-        if last_posn == parent_trees[-1][1]:
-            state[last_posn] = 'LEFT'
-        elif last_posn == parent_trees[-1][2]:
-            state[last_posn] = 'RIGHT'
-        else:
-            print("is this even possible?? (2)", state, parent_trees[-1], parent_trees, full_trees)
-        my_posns.append(len(state)-1)
-    return [state[i] for i in range(len(state)) if i in my_posns]
+    tracker = TreeChoiceTracker(max_depth)
+    for e in state:
+        tracker.append(e)
+    return tracker.path(left_right=True)
 
 def get_trees_max_depth(state, max_depth):
     """
@@ -135,41 +254,8 @@ def get_trees_max_depth(state, max_depth):
     >>> get_trees_max_depth([-10, True, 9, False, True, -8, True], 2)
     ([(0, 1, 6)], [(5, False, False), (2, 3, 4)])
     """
-    parent_stack = []
-    full_trees = []
-    
-    # Utility function which puts parents in full_trees if all their children are in full_trees
-    def pop_finished_parents():
-        for i in reversed(range(len(parent_stack))):
-            positions = parent_stack[i]
-            if -1 in positions:
-                break
-            children_positions = [pos[0] for pos in full_trees]
-            left_child_pos = positions[1] + 1
-            right_child_pos = positions[2] + 1
-            if state[positions[1]] and left_child_pos not in children_positions:
-                break
-            if state[positions[2]] and right_child_pos not in children_positions:
-                break
-            full_trees.append(positions)
-            parent_stack.pop(i)
-    
-    for i in range(len(state)):
-        e = state[i]
-        if 'int' in str(type(e)):
-            if len(parent_stack) < max_depth:
-                parent_stack.append((i, -1, -1))
-            else:
-                full_trees.append((i, False, False))
-                pop_finished_parents()
-        else:
-            parent = parent_stack[-1]
-            if parent[1] == -1:
-                parent_stack[-1] = (parent[0], i, -1)
-            elif parent[2] == -1:
-                parent_stack[-1] = (parent[0], parent[1], i)
-                if not e:
-                    full_trees.append(parent_stack.pop())
-                    pop_finished_parents()
-    parent_stack = [posns for posns in parent_stack if posns not in full_trees]
-    return  parent_stack , full_trees
+    tracker = TreeChoiceTracker(max_depth)
+    for e in state:
+        tracker.append(e)
+    return tracker.trees()
+
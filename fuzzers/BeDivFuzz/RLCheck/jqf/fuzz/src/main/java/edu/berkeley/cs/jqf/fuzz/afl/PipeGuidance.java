@@ -0,0 +1,217 @@
+/*
+ * Copyright (c) 2017-2018 The Regents of the University of California
+ *
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ * 1. Redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer.
+ *
+ * 2. Redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+package edu.berkeley.cs.jqf.fuzz.afl;
+
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayInputStream;
+import java.io.DataInputStream;
+import java.io.DataOutputStream;
+import java.io.EOFException;
+import java.io.File;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.RandomAccessFile;
+import java.nio.MappedByteBuffer;
+import java.nio.channels.FileChannel;
+import java.util.function.Consumer;
+
+import edu.berkeley.cs.jqf.fuzz.guidance.Guidance;
+import edu.berkeley.cs.jqf.fuzz.guidance.GuidanceException;
+import edu.berkeley.cs.jqf.fuzz.guidance.Result;
+import edu.berkeley.cs.jqf.fuzz.util.Coverage;
+import edu.berkeley.cs.jqf.instrument.tracing.events.TraceEvent;
+
+/**
+ * A front-end that receives inputs from an external fuzzer over a pair of pipes.
+ *
+ * <p>Inputs arrive in batches. A batch is a big-endian 32-bit count followed by
+ * that many frames, each a 32-bit length followed by the input bytes; a count
+ * of zero stops fuzzing. Input <tt>i</tt> of a batch writes its coverage map,
+ * one saturated hit count per byte, to slot <tt>i</tt> of a memory-mapped
+ * coverage file. Once the whole batch has run, the status of every input is
+ * written back as a 32-bit AFL-style status code.</p>
+ *
+ * @author Caroline Lemieux
+ */
+public class PipeGuidance implements Guidance {
+
+    /** The size of one coverage slot in the coverage file. */
+    public static final int COVERAGE_SLOT_SIZE = 1 << 16;
+
+    /** Status codes reported for each result, as in the AFL proxy. */
+    private static final int STATUS_SUCCESS = 0;
+    private static final int STATUS_INVALID = 1 << 8;
+    private static final int STATUS_TIMEOUT = 9;
+    private static final int STATUS_FAILURE = 6;
+
+    private static final byte[] EMPTY_SLOT = new byte[COVERAGE_SLOT_SIZE];
+
+    private final DataInputStream proxyInput;
+    private final DataOutputStream proxyOutput;
+    private final MappedByteBuffer coverageFile;
+    private final int maxBatch;
+    private final Coverage runCoverage = new Coverage();
+
+    private int[] statuses = new int[0];
+    private int batchSize = 0;
+    private int batchIdx = 0;
+    private byte[] currentInput;
+    private boolean stopped = false;
+
+    /**
+     * Creates a guidance that reads inputs from and writes results to
+     * the given pipes.
+     *
+     * <p>The pipe to Java is opened first, then the pipe from Java; the
+     * proxy must open them in the same order.</p>
+     *
+     * @param toJava the pipe the proxy writes input batches to
+     * @param fromJava the pipe the proxy reads statuses from
+     * @param coverageFile the coverage file, sized to a whole number of slots
+     * @throws IOException if the pipes or the coverage file cannot be opened
+     */
+    public PipeGuidance(File toJava, File fromJava, File coverageFile) throws IOException {
+        this.proxyInput = new DataInputStream(new BufferedInputStream(new FileInputStream(toJava)));
+        this.proxyOutput = new DataOutputStream(new BufferedOutputStream(new FileOutputStream(fromJava)));
+        try (RandomAccessFile file = new RandomAccessFile(coverageFile, "rw")) {
+            this.coverageFile = file.getChannel().map(FileChannel.MapMode.READ_WRITE, 0, file.length());
+        }
+        this.maxBatch = (int) (this.coverageFile.capacity() / COVERAGE_SLOT_SIZE);
+    }
+
+    /**
+     * Returns the current input of the batch.
+     *
+     * @return a stream over the bytes of the current input
+     */
+    @Override
+    public InputStream getInput() {
+        runCoverage.clear();
+        return new ByteArrayInputStream(currentInput);
+    }
+
+    /**
+     * Reads the next input, first reporting the statuses of the batch
+     * that just finished and reading the next batch if needed.
+     *
+     * @return <tt>false</tt> once the proxy sends an empty batch or
+     *         closes the pipe
+     */
+    @Override
+    public boolean hasInput() {
+        if (stopped) {
+            return false;
+        }
+        try {
+            if (batchIdx == batchSize) {
+                if (batchSize > 0) {
+                    writeStatuses();
+                }
+                if (!readBatchHeader()) {
+                    stopped = true;
+                    return false;
+                }
+            }
+            currentInput = new byte[proxyInput.readInt()];
+            proxyInput.readFully(currentInput);
+            return true;
+        } catch (IOException e) {
+            throw new GuidanceException(e);
+        }
+    }
+
+    private boolean readBatchHeader() throws IOException {
+        try {
+            batchSize = proxyInput.readInt();
+        } catch (EOFException e) {
+            return false;
+        }
+        if (batchSize > maxBatch) {
+            throw new GuidanceException(String.format("Batch of %d inputs does not fit %d coverage slots",
+                    batchSize, maxBatch));
+        }
+        if (statuses.length < batchSize) {
+            statuses = new int[batchSize];
+        }
+        batchIdx = 0;
+        return batchSize > 0;
+    }
+
+    private void writeStatuses() throws IOException {
+        for (int i = 0; i < batchSize; i++) {
+            proxyOutput.writeInt(statuses[i]);
+        }
+        proxyOutput.flush();
+    }
+
+    /**
+     * Records the status and the coverage of the current input.
+     *
+     * @param result   the result of the fuzzing trial
+     * @param error    the error thrown during the trial, or <tt>null</tt>
+     */
+    @Override
+    public void handleResult(Result result, Throwable error) {
+        switch (result) {
+            case SUCCESS:
+                statuses[batchIdx] = STATUS_SUCCESS;
+                break;
+            case INVALID:
+                statuses[batchIdx] = STATUS_INVALID;
+                break;
+            case TIMEOUT:
+                statuses[batchIdx] = STATUS_TIMEOUT;
+                break;
+            default:
+                statuses[batchIdx] = STATUS_FAILURE;
+        }
+
+        int base = batchIdx * COVERAGE_SLOT_SIZE;
+        coverageFile.position(base);
+        coverageFile.put(EMPTY_SLOT);
+        for (int idx : runCoverage.getCovered()) {
+            coverageFile.put(base + idx, (byte) Math.min(runCoverage.getCountAtIndex(idx), 255));
+        }
+        batchIdx++;
+    }
+
+    /**
+     * Returns a callback that collects the coverage of the current run.
+     *
+     * @param thread the thread whose events to handle
+     * @return a callback that updates the coverage of the current run
+     */
+    @Override
+    public Consumer<TraceEvent> generateCallBack(Thread thread) {
+        return runCoverage::handleEvent;
+    }
+}
@@ -115,6 +115,16 @@ public class Coverage implements TraceEventVisitor {
         return counter.getNonZeroIndices();
     }
 
+    /**
+     * Returns the hit count of an edge.
+     *
+     * @param idx the index of the edge in the coverage map
+     * @return the number of times the edge was hit
+     */
+    public int getCountAtIndex(int idx) {
+        return counter.getAtIndex(idx);
+    }
+
 
     public Collection<?> computeNewCoverage(Coverage baseline) {
         Collection<Integer> newCoverage = new ArrayList<>();
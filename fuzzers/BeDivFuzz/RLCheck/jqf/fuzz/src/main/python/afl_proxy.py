@@ -25,74 +25,221 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-# Proxy between a python fuzzer and JQF. Communicates to 
-# both via pipes -- those launched by the fuzzer and two whose names
-# are given as command line args and must be created before 
-# launching the proxy. 
+# Proxy between a python fuzzer and JQF. Starts a persistent JQF
+# PipeDriver and talks to it through two FIFOs in a temporary
+# directory, plus a coverage file both processes map into memory.
 #
-# This proxy is general and can be used to exchange information
-# from any external utility writing in the command-line pipes.
+# Protocol (all integers are big-endian u32):
+#   python -> java: a batch count N, then N frames of input length + bytes.
+#                   A count of 0 stops the driver.
+#   java -> python: once the whole batch has run, N status codes.
+# The coverage map of input i of a batch is written by Java to slot i
+# of the coverage file, one saturated hit count per byte.
+# CoverageTracker turns those maps into AFL-style new-coverage feedback.
 #
 # author: Caroline Lemieux
 
-import sys
+import errno
+import logging
+import mmap
 import os
+import struct
+import subprocess
 import tempfile
-import logging
+import time
+
+import numpy as np
+
+# Note: this must be consistent with the Java PipeGuidance COVERAGE_SLOT_SIZE
+COVERAGE_MAP_SIZE = 1 << 16
+
+STATUSES = {0: "VALID", 1 << 8: "INVALID", 9: "TIMEOUT", 6: "FAILURE"}
+
+DRIVER_CLASS = "edu.berkeley.cs.jqf.fuzz.afl.PipeDriver"
+DEFAULT_JQF_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", ".."))
 
 
 class JQFProgram:
-    # test_class and test_method are the class and methods to test with JQF
-    def __init__(self, test_class, test_method, jqf_dir):
-        #TODO: maybe perform a pilot run to check you haven't messed up test_class and method and jqf_dir
-        # Note: this must be consistent with the Java AFLGuidance COVERAGE_MAP_SIZE
-        self.coverage_map_size =  1 << 16
-        # set up temporaries: p2j and j2p FIFOs and shared input file
-        self.temp_dir_name = tempfile.TemporaryDirectory()
-        to_java_name = os.path.join(self.temp_dir_name, "p2j")
-        from_java_name = os.path.join(self.temp_dir_name, "j2p")
+    # test_class and test_method are the class and methods to test with JQF.
+    # At most max_batch inputs are sent per round trip. command overrides the
+    # driver command line; the FIFO and coverage file names are appended to it.
+    def __init__(self, test_class, test_method, jqf_dir=None, max_batch=64, command=None):
+        self.max_batch = max_batch
+        # set up temporaries: p2j and j2p FIFOs and shared coverage file
+        self.temp_dir = tempfile.TemporaryDirectory()
+        to_java_name = os.path.join(self.temp_dir.name, "p2j")
+        from_java_name = os.path.join(self.temp_dir.name, "j2p")
+        coverage_name = os.path.join(self.temp_dir.name, "coverage")
         # If these throw exceptions we shouldn't go on
         os.mkfifo(to_java_name)
         os.mkfifo(from_java_name)
-        self.p2j = open(to_java_name, 'wb')
-        self.j2p = open(from_java_name, 'rb')
-        self.cur_input_name = os.path.join(self.temp_dir_name, ".cur_input")
-        # start up JQF
-        script_name = os.path.join(jqf_dir, "scripts/jqf-driver.sh")        
-        # not storing this anywhere makes sure this runs in the background
-        subprocess.Popen(script_name, "edu.berkeley.cs.jqf.fuzz.afl.AFLDriver", test_class, test_method, self.cur_input_name, to_java_name, from_java_name)
-        # but let's just be safe and make sure we're not stalled...
-        logging.debug("[JQF.py LOG] Done initializing JQF on %s.%s!" % (test_class, test_method))        
-
-
-    def run_on_input(input_str):
-        # write the input to file for JQF
-        with open(self.cur_input_name, "w") as input_file:
-            input_file.write(input_str)
-        # Tell JQF we're ready to run
-        if (self.p2j.write(b"HELO") < 4):
-            raise Exception("Failed to say hello to JAVA in run_on_input")
+        with open(coverage_name, "wb") as coverage_file:
+            coverage_file.truncate(max_batch * COVERAGE_MAP_SIZE)
+        with open(coverage_name, "r+b") as coverage_file:
+            self.coverage_mmap = mmap.mmap(coverage_file.fileno(), 0)
+        # Zero-copy view of the coverage slots: row i is the map of input i of the last batch
+        self.coverage = np.ndarray((max_batch, COVERAGE_MAP_SIZE), dtype=np.uint8, buffer=self.coverage_mmap)
+
+        # start up JQF before opening the FIFOs, which wait for it to open the other ends
+        if command is None:
+            jqf_dir = DEFAULT_JQF_DIR if jqf_dir is None else jqf_dir
+            command = [os.path.join(jqf_dir, "scripts", "jqf-driver.sh"), DRIVER_CLASS, test_class, test_method]
+        self.proc = subprocess.Popen(list(command) + [to_java_name, from_java_name, coverage_name])
+        self.p2j = self._open_to_java(to_java_name)
+        self.j2p = self._open_from_java(from_java_name)
+        logging.debug("[JQF.py LOG] Done initializing JQF on %s.%s!" % (test_class, test_method))
+
+    def _open_to_java(self, name):
+        # Opening the write end without a reader fails with ENXIO in non-blocking
+        # mode; poll so that a driver that dies at startup doesn't stall us
+        while True:
+            try:
+                fd = os.open(name, os.O_WRONLY | os.O_NONBLOCK)
+                break
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+            if self.proc.poll() is not None:
+                raise Exception("JQF driver exited with status %d during startup" % self.proc.returncode)
+            time.sleep(0.01)
+        os.set_blocking(fd, True)
+        return open(fd, "wb")
+
+    def _open_from_java(self, name):
+        # Opening the read end in non-blocking mode succeeds at once, but reads
+        # return EOF until the driver opens the write end and EAGAIN after; the
+        # driver writes nothing before the first batch
+        fd = os.open(name, os.O_RDONLY | os.O_NONBLOCK)
+        while True:
+            try:
+                data = os.read(fd, 1)
+            except BlockingIOError:
+                break
+            if data or self.proc.poll() is not None:
+                os.close(fd)
+                if data:
+                    raise Exception("JQF driver wrote to %s before the first batch" % name)
+                raise Exception("JQF driver exited with status %d during startup" % self.proc.returncode)
+            time.sleep(0.01)
+        os.set_blocking(fd, True)
+        return open(fd, "rb")
+
+    def _read_exactly(self, size, what):
+        data = self.j2p.read(size)
+        if len(data) < size:
+            raise Exception("Didn't get enough bytes in Java %s (only got %d)" % (what, len(data)))
+        return data
+
+    def run_batch(self, inputs):
+        # Runs every input (bytes or str) and returns their statuses and an
+        # (inputs x COVERAGE_MAP_SIZE) view of their coverage maps. The view
+        # aliases the shared coverage file and is overwritten by the next batch.
+        if len(inputs) > self.max_batch:
+            raise Exception("Batch of %d inputs exceeds max_batch %d" % (len(inputs), self.max_batch))
+        if len(inputs) == 0:
+            return [], self.coverage[:0]
+        frames = [struct.pack(">I", len(inputs))]
+        for data in inputs:
+            if isinstance(data, str):
+                data = data.encode()
+            frames.append(struct.pack(">I", len(data)))
+            frames.append(data)
+        self.p2j.write(b"".join(frames))
         # need to flush the pipe
         self.p2j.flush()
-        logging.debug("[JQF.py LOG] Done initializing JQF on %s.%s!" % (test_class, test_method))        
-        return_status = self.j2p.read(4)
-        if len(return_status) < 4:
-            raise Exception("Didn't get enough bytes in Java return status (only got %d)" % len(return_status))
-
-        coverage_map = self.j2p.read(coverage_map_size)        
-        if len(coverage_map_size) < coverage_map_size:
-            raise Exception("Didn't get enough bytes in Java coverage map size (only got %d)" % len(coverage_map_size))
-        #TODO: could use the coverage map to get coverage data, discarding it for now.
-
-        if int.from_bytes(return_status) == 0:
-            ret_status = "VALID"
-        elif int.from_bytes(return_status) == (1 << 8):
-            ret_status = "INVALID"
-        elif int.from_bytes(return_status) == 9:
-            ret_status = "TIMEOUT"
-        elif int.from_bytes(return_status) == 6:
-            ret_status = "FAILURE"
-        else:
-            raise Exception("Unexpected return status %d" % int.from_bytes(return_status))
-        
-        return ret_status
+
+        codes = struct.unpack(">%dI" % len(inputs), self._read_exactly(4 * len(inputs), "return statuses"))
+        statuses = []
+        for code in codes:
+            if code not in STATUSES:
+                raise Exception("Unexpected return status %d" % code)
+            statuses.append(STATUSES[code])
+        return statuses, self.coverage[:len(inputs)]
+
+    def run_on_input(self, input_str):
+        statuses, _ = self.run_batch([input_str])
+        return statuses[0]
+
+    def close(self):
+        if self.proc is None:
+            return
+        try:
+            self.p2j.write(struct.pack(">I", 0))
+            self.p2j.flush()
+        except BrokenPipeError:
+            pass
+        self.p2j.close()
+        self.j2p.close()
+        self.proc.wait()
+        self.proc = None
+        del self.coverage
+        self.coverage_mmap.close()
+        self.temp_dir.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# AFL's hit-count buckets: 0, 1, 2, 3, 4-7, 8-15, 16-31, 32-127, 128-255 -> one bit each
+COUNT_CLASS_LOOKUP = np.zeros(256, dtype=np.uint8)
+for _low, _high, _bucket in [(1, 1, 1), (2, 2, 2), (3, 3, 4), (4, 7, 8), (8, 15, 16),
+                             (16, 31, 32), (32, 127, 64), (128, 255, 128)]:
+    COUNT_CLASS_LOOKUP[_low:_high + 1] = _bucket
+
+NO_NEW_COVERAGE = 0
+NEW_HIT_COUNT = 1
+NEW_EDGE = 2
+
+
+class CoverageTracker:
+    # AFL-style novelty detection over coverage maps. The virgin map has a bit
+    # set for every (edge, hit-count bucket) not seen yet; an input is novel if
+    # its bucketed map hits a virgin bit. As in AFL's has_new_bits, inputs
+    # report NEW_EDGE if they hit an edge never hit before, and NEW_HIT_COUNT
+    # if they only hit a new bucket of a known edge.
+    def __init__(self, map_size=COVERAGE_MAP_SIZE):
+        self.virgin = np.full(map_size, 0xFF, dtype=np.uint8)
+
+    def update(self, coverage):
+        # coverage is a (inputs x map_size) array of hit counts, e.g. from
+        # JQFProgram.run_batch. Inputs are treated in order, so an input is
+        # only novel if no earlier input of the batch had the same coverage.
+        # Returns one of NO_NEW_COVERAGE, NEW_HIT_COUNT, NEW_EDGE per input.
+        coverage = np.atleast_2d(coverage)
+        flags = np.zeros(len(coverage), dtype=np.uint8)
+        # Only look at edges some input of the batch hits; maps are sparse
+        hit = np.flatnonzero(coverage.any(axis=0))
+        if len(hit) == 0:
+            return flags
+        classified = COUNT_CLASS_LOOKUP[coverage[:, hit]]
+        # Bits each input sees as virgin: those not hit by any earlier input of the batch
+        seen = np.bitwise_or.accumulate(classified, axis=0)
+        virgin_before = np.empty_like(classified)
+        virgin_before[0] = self.virgin[hit]
+        virgin_before[1:] = self.virgin[hit] & ~seen[:-1]
+        new_bits = (classified & virgin_before).any(axis=1)
+        new_edges = ((classified != 0) & (virgin_before == 0xFF)).any(axis=1)
+        flags[new_bits] = NEW_HIT_COUNT
+        flags[new_edges] = NEW_EDGE
+        self.virgin[hit] &= ~seen[-1]
+        return flags
+
+    def has_new_bits(self, coverage):
+        # Novelty of a single coverage map, updating the virgin map
+        return int(self.update(coverage)[0])
+
+    def covered_edges(self):
+        return int(np.count_nonzero(self.virgin != 0xFF))
+
+    def save(self, path):
+        # Writes the virgin map as raw bytes, like AFL's fuzz_bitmap
+        self.virgin.tofile(path)
+
+    def restore(self, path):
+        virgin = np.fromfile(path, dtype=np.uint8)
+        if virgin.shape != self.virgin.shape:
+            raise Exception("Virgin map in %s has %d bytes, expected %d" % (path, len(virgin), len(self.virgin)))
+        self.virgin = virgin
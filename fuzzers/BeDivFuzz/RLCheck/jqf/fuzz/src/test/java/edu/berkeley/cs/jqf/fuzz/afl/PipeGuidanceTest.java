@@ -0,0 +1,169 @@
+/*
+ * Copyright (c) 2017-2018 The Regents of the University of California
+ *
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ * 1. Redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer.
+ *
+ * 2. Redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+package edu.berkeley.cs.jqf.fuzz.afl;
+
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.DataInputStream;
+import java.io.DataOutputStream;
+import java.io.File;
+import java.io.IOException;
+import java.nio.file.Files;
+import java.util.Arrays;
+
+import edu.berkeley.cs.jqf.fuzz.Fuzz;
+import edu.berkeley.cs.jqf.fuzz.JQF;
+import edu.berkeley.cs.jqf.fuzz.junit.GuidedFuzzing;
+import org.junit.Assert;
+import org.junit.Assume;
+import org.junit.Rule;
+import org.junit.Test;
+import org.junit.rules.TemporaryFolder;
+import org.junit.runner.RunWith;
+import org.junit.runners.JUnit4;
+
+/**
+ * Runs {@link PipeGuidance} on batches written to a file, in the wire
+ * format of the Python AFL proxy, and checks the statuses and coverage
+ * slots it writes back.
+ */
+@RunWith(JUnit4.class)
+public class PipeGuidanceTest {
+
+    @RunWith(JQF.class)
+    public static class PipeGuidanceTestFuzzer {
+        @Fuzz
+        public void success(int x) {
+            Assert.assertTrue(true);
+        }
+
+        @Fuzz
+        public void assumptionViolated(int x) {
+            Assume.assumeTrue(false);
+        }
+
+        @Fuzz
+        public void uncaughtException(int x) {
+            throw new RuntimeException();
+        }
+    }
+
+    private static final int SLOTS = 4;
+
+    @Rule
+    public TemporaryFolder folder = new TemporaryFolder();
+
+    /** Encodes batches of inputs, optionally followed by the stop batch. */
+    private static byte[] encode(byte[][][] batches, boolean stop) throws IOException {
+        ByteArrayOutputStream bytes = new ByteArrayOutputStream();
+        DataOutputStream out = new DataOutputStream(bytes);
+        for (byte[][] batch : batches) {
+            out.writeInt(batch.length);
+            for (byte[] input : batch) {
+                out.writeInt(input.length);
+                out.write(input);
+            }
+        }
+        if (stop) {
+            out.writeInt(0);
+        }
+        return bytes.toByteArray();
+    }
+
+    private File toJava;
+    private File fromJava;
+    private File coverageFile;
+
+    /** Runs the test method on the encoded batches and returns the statuses written back. */
+    private int[] run(String method, byte[] batches) throws Exception {
+        toJava = folder.newFile("p2j");
+        fromJava = folder.newFile("j2p");
+        coverageFile = folder.newFile("coverage");
+        Files.write(toJava.toPath(), batches);
+        byte[] slots = new byte[SLOTS * PipeGuidance.COVERAGE_SLOT_SIZE];
+        Arrays.fill(slots, (byte) 0xFF);
+        Files.write(coverageFile.toPath(), slots);
+
+        GuidedFuzzing.run(PipeGuidanceTestFuzzer.class, method,
+                new PipeGuidance(toJava, fromJava, coverageFile), null);
+
+        byte[] written = Files.readAllBytes(fromJava.toPath());
+        int[] statuses = new int[written.length / 4];
+        DataInputStream in = new DataInputStream(new ByteArrayInputStream(written));
+        for (int i = 0; i < statuses.length; i++) {
+            statuses[i] = in.readInt();
+        }
+        return statuses;
+    }
+
+    private static byte[][] inputs(int count) {
+        byte[][] inputs = new byte[count][];
+        for (int i = 0; i < count; i++) {
+            inputs[i] = new byte[]{(byte) i, 1, 2, 3, 4, 5, 6, 7};
+        }
+        return inputs;
+    }
+
+    @Test
+    public void reportsStatusesPerBatch() throws Exception {
+        int[] statuses = run("success", encode(new byte[][][]{inputs(2), inputs(3)}, true));
+        Assert.assertArrayEquals(new int[]{0, 0, 0, 0, 0}, statuses);
+    }
+
+    @Test
+    public void mapsResultsToAflStatuses() throws Exception {
+        Assert.assertArrayEquals(new int[]{1 << 8},
+                run("assumptionViolated", encode(new byte[][][]{inputs(1)}, true)));
+    }
+
+    @Test
+    public void mapsFailuresToAflStatuses() throws Exception {
+        Assert.assertArrayEquals(new int[]{6, 6},
+                run("uncaughtException", encode(new byte[][][]{inputs(2)}, true)));
+    }
+
+    @Test
+    public void stopsWhenThePipeCloses() throws Exception {
+        Assert.assertArrayEquals(new int[]{0, 0},
+                run("success", encode(new byte[][][]{inputs(2)}, false)));
+    }
+
+    @Test
+    public void clearsTheCoverageSlotsOfTheBatch() throws Exception {
+        run("success", encode(new byte[][][]{inputs(2)}, true));
+        byte[] slots = Files.readAllBytes(coverageFile.toPath());
+        int size = PipeGuidance.COVERAGE_SLOT_SIZE;
+        // Without the instrumentation agent no edges are hit, so used slots are all zero
+        for (int i = 0; i < 2 * size; i++) {
+            Assert.assertEquals(0, slots[i]);
+        }
+        Assert.assertEquals((byte) 0xFF, slots[2 * size]);
+        Assert.assertEquals((byte) 0xFF, slots[SLOTS * size - 1]);
+    }
+}
@@ -1,4 +1,4 @@
-#!/usr/bin/env pypy
+#!/usr/bin/env python3
 """
  Copyright (c) 2017, University of California, Berkeley
 
@@ -30,22 +30,16 @@
 import argparse
 from collections import defaultdict
 import operator
-import re
+import trace_reader
 import travioli
 
-# Global constants
-REGEXP_BRANCH = re.compile("^\s*BRANCH\((\d+),(-?\d+),(\d+)\)$")
-REGEXP_CALL   = re.compile("^\s*CALL\((\d+),(\d+),(.*)\)$")
-REGEXP_ALLOC   = re.compile("^\s*ALLOC\((\d+),(\d+),(\d+)\)$")
-REGEXP_RET    = re.compile("^\s*RET")
-REGEXP_HEAPLOAD = re.compile("^\s*HEAPLOAD\((-?\d+),(\d+),(\d+),(.*)\)$")
-REGEXP_END = re.compile("^# End (.*)$")
-
 def main():	
 	# Command-line arguments
 	parser = argparse.ArgumentParser(description='Determine inputs that maximize individual branches')
 	parser.add_argument('--input', type=str, dest='trace_file', default='main.log', 
 		help='Name of trace file containing event log')
+	parser.add_argument('--mmap', action='store_true', dest='use_mmap',
+		help='Read the trace file through mmap instead of buffered reads')
 
 
 	# Parse arguments
@@ -55,13 +49,13 @@ def main():
 	analysis = TraceAnalysis()
 
 	# Process trace file
-	analysis.process_trace(args.trace_file)
+	analysis.process_trace(args.trace_file, args.use_mmap)
 
 	# Print inputs and maximizing branches
 	maximizing_inputs = analysis.get_maximizing_inputs()
 	sorted_counts = sorted(maximizing_inputs.items(), key=lambda p: p[1][1], reverse=True)
 	for (iid, arm), (input, count) in sorted_counts:
-		print count, analysis.src_map[iid] + '.' + str(arm), input
+		print(count, analysis.src_map[iid] + '.' + str(arm), input)
 
 
 class TraceAnalysis(object):
@@ -69,61 +63,13 @@ class TraceAnalysis(object):
 	def __init__(self):
 		self.src_map = {}       # INT -> STR     // Maps IIDs to source locations
 
-	def process_trace(self, trace_file_name):
+	def process_trace(self, trace_file_name, use_mmap=False):
 		self.call_stack = []         # [(STR, INT)]   // Call stack of (Method, IID)
 		self.branch_counts = defaultdict(int) # INT x INT -> INT // Map of (IID, Arm) to counts for this input
-		self.inputs_to_branch_counts = {}     # STR -> ((INT x INT) -> INT) // Map of inputs to branch counts
-		with open(trace_file_name) as trace_file:
-			while True:
-				# Read line from file
-				line = trace_file.readline()
-				# End-of-file is empty line
-				if not line:
-					break
-
-				# Try to match BRANCH(iid, arm, line)
-				match_branch = REGEXP_BRANCH.match(line)
-				if match_branch:
-					self.handle_branch(int(match_branch.group(1)), int(match_branch.group(2)), int(match_branch.group(3)))
-					continue
-
-				# Try to match HEAPLOAD(iid, line, objectId, field)
-				match_heapload = REGEXP_HEAPLOAD.match(line)
-				if match_heapload:
-					self.handle_heapload(int(match_heapload.group(1)), int(match_heapload.group(2)),
-						int(match_heapload.group(3)), match_heapload.group(4))
-					continue
-
-				# Try to match CALL(iid, line, method)
-				match_call = REGEXP_CALL.match(line)
-				if match_call:
-					self.handle_call(int(match_call.group(1)), int(match_call.group(2)), match_call.group(3))
-					continue
-
-				# Try to match RET
-				match_ret = REGEXP_RET.match(line)
-				if match_ret:
-					self.handle_ret()
-					continue
-				
-
-				# Try to match ALLOC(iid, line, size)
-				match_alloc = REGEXP_ALLOC.match(line)
-				if match_alloc:
-					self.handle_alloc(int(match_alloc.group(1)), int(match_alloc.group(2)), int(match_alloc.group(3)))
-					continue
-
-
-				# Try to match end-of-input
-				match_end = REGEXP_END.match(line)
-				if match_end:
-					self.handle_end(match_end.group(1))
-					continue
-
-
-
-				# Otherwise, error
-				raise Exception("Cannot parse trace line: " + line)
+		self.branch_ids = {}         # INT x INT -> INT // Interned (IID, Arm) of every branch seen so far
+		self.max_counts = []         # [INT]          // Maximum count of each branch id over finished inputs
+		self.max_inputs = []         # [STR]          // First input reaching that maximum
+		trace_reader.process_trace(trace_file_name, self, use_mmap=use_mmap)
 
 
 	def handle_branch(self, iid, arm, line):
@@ -160,21 +106,25 @@ class TraceAnalysis(object):
 		# Do not do anything else for now
 
 	def handle_end(self, input):
-		# Save current counts to map
-		self.inputs_to_branch_counts[input] = self.branch_counts
+		# Fold current counts into the running maxima
+		branch_ids = self.branch_ids
+		max_counts = self.max_counts
+		max_inputs = self.max_inputs
+		for branch, count in self.branch_counts.items():
+			branch_id = branch_ids.get(branch)
+			if branch_id is None:
+				branch_id = branch_ids[branch] = len(max_counts)
+				max_counts.append(count)
+				max_inputs.append(input)
+			elif count > max_counts[branch_id]:
+				max_counts[branch_id] = count
+				max_inputs[branch_id] = input
 		# Reset branch counts
 		self.branch_counts = defaultdict(int)
 
 	def get_maximizing_inputs(self):
-		max_branch_counts = defaultdict(int)
-		maximizing_inputs = {}
-		for input, branch_counts in self.inputs_to_branch_counts.iteritems():
-			for branch, count in branch_counts.iteritems():
-				if count > max_branch_counts[branch]:
-					max_branch_counts[branch] = count
-					maximizing_inputs[branch] = (input, count)
-
-		return maximizing_inputs
+		return {branch: (self.max_inputs[branch_id], self.max_counts[branch_id])
+			for branch, branch_id in self.branch_ids.items()}
 
 
 
@@ -1,4 +1,4 @@
-#!/usr/bin/env pypy
+#!/usr/bin/env python3
 """
  Copyright (c) 2017, University of California, Berkeley
 
@@ -30,17 +30,11 @@
 import argparse
 from collections import defaultdict
 import operator
-import re
 import pickle
 
+import trace_reader
 import travioli
 
-# Global constants
-REGEXP_BRANCH = re.compile("^\s*BRANCH\((\d+),(-?\d+),(\d+)\)$")
-REGEXP_CALL   = re.compile("^\s*CALL\((\d+),(\d+),(.*)\)$")
-REGEXP_RET    = re.compile("^\s*RET")
-REGEXP_HEAPLOAD = re.compile("^\s*HEAPLOAD\((-?\d+),(\d+),(\d+),(.*)\)$")
-
 def main():	
 	# Command-line arguments
 	parser = argparse.ArgumentParser(description='Collect AECs from a trace and count them')
@@ -48,6 +42,8 @@ def main():
 		help='Name of trace file containing event log')
 	parser.add_argument('--serialize', type=str, dest='serialize', default=None,
 		help='Optional name of pickle file to serialize cycle counts')
+	parser.add_argument('--mmap', action='store_true', dest='use_mmap',
+		help='Read the trace file through mmap instead of buffered reads')
 
 
 	# Parse arguments
@@ -57,7 +53,7 @@ def main():
 	analysis = DynamicAnalysis()
 
 	# Process trace file
-	analysis.process_trace(args.trace_file)
+	analysis.process_trace(args.trace_file, args.use_mmap)
 
 	# Print AEC counts
 	# print_aec_counts(aec_counts, line_numbers)
@@ -85,46 +81,10 @@ class DynamicAnalysis(object):
 		                                                                     # map of memory location counts, where SEQ is an 
 		                                                                     # AEC and MEM is INT x STRING
 
-	def process_trace(self, trace_file_name):
+	def process_trace(self, trace_file_name, use_mmap=False):
 		self.call_stack = []         # [(STR, INT)]   // Call stack of (Method, IID)
-		with open(trace_file_name) as trace_file:
-			while True:
-				# Read line from file
-				line = trace_file.readline()
-				# End-of-file is empty line
-				if not line:
-					break
-        # Ignore comments
-				if line.startswith("#"):
-					continue
-
-				# Try to match BRANCH(iid, arm, line)
-				match_branch = REGEXP_BRANCH.match(line)
-				if match_branch:
-					self.handle_branch(int(match_branch.group(1)), int(match_branch.group(2)), int(match_branch.group(3)))
-					continue
-
-				# Try to match HEAPLOAD(iid, line, objectId, field)
-				match_heapload = REGEXP_HEAPLOAD.match(line)
-				if match_heapload:
-					self.handle_heapload(int(match_heapload.group(1)), int(match_heapload.group(2)),
-						int(match_heapload.group(3)), match_heapload.group(4))
-					continue
-
-				# Try to match CALL(iid, line)
-				match_call = REGEXP_CALL.match(line)
-				if match_call:
-					self.handle_call(int(match_call.group(1)), int(match_call.group(2)), match_call.group(3))
-					continue
-
-				# Try to match RET
-				match_ret = REGEXP_RET.match(line)
-				if match_ret:
-					self.handle_ret()
-					continue
-				
-				# Otherwise, error
-				raise Exception("Cannot parse trace line: " + line)
+		# Comment lines have no handler and are ignored
+		trace_reader.process_trace(trace_file_name, self, use_mmap=use_mmap)
 
 
 	def handle_branch(self, iid, arm, line): # XXX: ARM ID is ignored ???
@@ -162,7 +122,7 @@ class DynamicAnalysis(object):
 
 	def compute_redundancies(self):
 		aec_redundancies = defaultdict(lambda: (0.0, []))
-		for aec, mem_counts in self.aec_mems.iteritems():
+		for aec, mem_counts in self.aec_mems.items():
 			sorted_counts = sorted(mem_counts.values())
 			aec_redundancies[aec] = compute_redundancy_score(sorted_counts), sorted_counts
 		return aec_redundancies
@@ -185,22 +145,23 @@ def print_aec_counts(aec_counts, line_map):
 	for aec, count in sorted(aec_counts.items(), key=operator.itemgetter(1)):
 		if count == 1:
 			continue
-		print "Count = " + str(count)
+		print("Count = " + str(count))
 		travioli.print_aec(aec, line_map)
 
-	print str(len(aec_counts)) + " distinct AECs found."
+	print(str(len(aec_counts)) + " distinct AECs found.")
 
 def print_aec_redundancies(aec_redundancies, line_map):
 	for aec, (red, counts) in sorted(aec_redundancies.items(), key=lambda x: x[1][0]):
 		if red < 0.0001:
 			continue # Ignore non-redundant
-		print "Redundancy = " + str(red) + " " + str(counts)
+		print("Redundancy = " + str(red) + " " + str(counts))
 		travioli.print_aec(aec, line_map)
 
 
 def serialize_data(pickle_file_name, data, line_numbers):
 	with open(pickle_file_name, 'wb') as pickle_file:
-		pickle.dump((data, line_numbers), pickle_file)
+		# A plain dict, since the default factory of the defaultdict cannot be pickled
+		pickle.dump((dict(data), line_numbers), pickle_file)
 
 if __name__ == "__main__":
 	main()
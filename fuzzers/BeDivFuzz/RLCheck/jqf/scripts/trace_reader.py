@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+ Copyright (c) 2017, University of California, Berkeley
+
+ All rights reserved.
+
+ Redistribution and use in source and binary forms, with or without
+ modification, are permitted provided that the following conditions are
+ met:
+
+ 1. Redistributions of source code must retain the above copyright
+ notice, this list of conditions and the following disclaimer.
+
+ 2. Redistributions in binary form must reproduce the above copyright
+ notice, this list of conditions and the following disclaimer in the
+ documentation and/or other materials provided with the distribution.
+
+ THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+# Streaming reader for JQF/Janala trace logs.
+#
+# The file is read in large blocks (or through mmap). Each line is dispatched
+# on its first character, its event keyword is checked and its fields are split
+# once. process_trace() passes the fields straight to the handle_* callbacks of
+# an analysis; read_events() yields them as compact typed events instead.
+
+from collections import namedtuple
+from functools import partial
+import mmap
+
+BLOCK_SIZE = 1 << 20
+
+# Trace events
+Branch = namedtuple('Branch', 'iid arm line')                    # BRANCH(iid,arm,line)
+Call = namedtuple('Call', 'iid line method')                     # CALL(iid,line,method)
+Ret = namedtuple('Ret', '')                                      # RET...
+HeapLoad = namedtuple('HeapLoad', 'iid line object_id field')    # HEAPLOAD(iid,line,objectId,field)
+Alloc = namedtuple('Alloc', 'iid line size')                     # ALLOC(iid,line,size)
+End = namedtuple('End', 'input')                                 # # End input
+Comment = namedtuple('Comment', 'text')                          # # anything else
+
+RET = Ret()
+
+# Callback of an analysis for each event, in the argument order of parse_lines.
+# Analyses without handle_end or handle_comment skip those lines; any other
+# missing callback is an error once its event shows up.
+HANDLERS = [(Branch, 'handle_branch'), (Call, 'handle_call'), (Ret, 'handle_ret'),
+	(HeapLoad, 'handle_heapload'), (Alloc, 'handle_alloc'), (End, 'handle_end'), (Comment, 'handle_comment')]
+OPTIONAL_EVENTS = (End, Comment)
+
+
+def parse_lines(lines, branch, call, ret, heapload, alloc, end, comment):
+	"""Calls the callback of the event of each trace line (without its newline) with the event's fields."""
+	for line in lines:
+		text = line.lstrip()
+		kind = text[:1]
+		try:
+			if kind == 'B':
+				if text[:7] != 'BRANCH(' or text[-1] != ')':
+					raise ValueError
+				iid, arm, line_number = text[7:-1].split(',')
+				branch(int(iid), int(arm), int(line_number))
+			elif kind == 'H':
+				if text[:9] != 'HEAPLOAD(' or text[-1] != ')':
+					raise ValueError
+				iid, line_number, object_id, field = text[9:-1].split(',', 3)
+				heapload(int(iid), int(line_number), int(object_id), field)
+			elif kind == 'C':
+				if text[:5] != 'CALL(' or text[-1] != ')':
+					raise ValueError
+				iid, line_number, method = text[5:-1].split(',', 2)
+				call(int(iid), int(line_number), method)
+			elif kind == 'R':
+				if text[:3] != 'RET':
+					raise ValueError
+				ret()
+			elif kind == 'A':
+				if text[:6] != 'ALLOC(' or text[-1] != ')':
+					raise ValueError
+				iid, line_number, size = text[6:-1].split(',')
+				alloc(int(iid), int(line_number), int(size))
+			elif kind == '#':
+				# Only unindented lines mark the end of an input
+				if line[:6] == '# End ':
+					end(line[6:])
+				else:
+					comment(line)
+			else:
+				raise ValueError
+		except ValueError:
+			raise Exception("Cannot parse trace line: " + line)
+
+
+def _event_collector(events):
+	# Callbacks for parse_lines that append typed events to a list
+	new = tuple.__new__
+	append = events.append
+	def collector(event_type):
+		if event_type is Ret:
+			return lambda: append(RET)
+		return lambda *fields: append(new(event_type, fields))
+	return [collector(event_type) for event_type, _ in HANDLERS]
+
+
+def parse_line(line):
+	"""Parses one trace line (without its newline) into an event."""
+	events = []
+	parse_lines([line], *_event_collector(events))
+	return events[0]
+
+
+def read_blocks(trace_file_name, block_size=BLOCK_SIZE, use_mmap=False):
+	"""Yields the lines of a trace file without newlines, in lists of the lines of every block_size bytes."""
+	with open(trace_file_name, 'rb') as trace_file:
+		if use_mmap:
+			try:
+				trace_map = mmap.mmap(trace_file.fileno(), 0, access=mmap.ACCESS_READ)
+			except ValueError:
+				return # Empty files cannot be mapped
+			with trace_map:
+				yield from _split_blocks(trace_map.read, block_size)
+		else:
+			yield from _split_blocks(trace_file.read, block_size)
+
+def _split_blocks(read, block_size):
+	rest = b''
+	for block in iter(partial(read, block_size), b''):
+		# Only decode whole lines, so that no character is split between blocks
+		end = block.rfind(b'\n') + 1
+		if end == 0:
+			rest += block
+			continue
+		lines = (rest + block[:end]).decode().split('\n')
+		lines.pop()
+		yield lines
+		rest = block[end:]
+	if rest:
+		yield [rest.decode()]
+
+
+def read_lines(trace_file_name, block_size=BLOCK_SIZE, use_mmap=False):
+	"""Yields the lines of a trace file without newlines."""
+	for lines in read_blocks(trace_file_name, block_size, use_mmap):
+		yield from lines
+
+
+def read_events(trace_file_name, block_size=BLOCK_SIZE, use_mmap=False):
+	"""Yields the events of a trace file."""
+	events = []
+	callbacks = _event_collector(events)
+	for lines in read_blocks(trace_file_name, block_size, use_mmap):
+		parse_lines(lines, *callbacks)
+		yield from events
+		events.clear()
+
+
+def _missing_handler(name):
+	def fail(*fields):
+		raise Exception("Trace has events for " + name + ", which the analysis does not define")
+	return fail
+
+def _skip(*fields):
+	pass
+
+def process_trace(trace_file_name, analysis, block_size=BLOCK_SIZE, use_mmap=False):
+	"""Calls the handle_* callback of the analysis for every event of the trace, with the event's fields."""
+	handlers = []
+	for event_type, name in HANDLERS:
+		handler = getattr(analysis, name, None)
+		if handler is None:
+			handler = _skip if event_type in OPTIONAL_EVENTS else _missing_handler(name)
+		handlers.append(handler)
+	for lines in read_blocks(trace_file_name, block_size, use_mmap):
+		parse_lines(lines, *handlers)
@@ -1,4 +1,4 @@
-#!/usr/bin/env pypy
+#!/usr/bin/env python3
 """
  Copyright (c) 2017, University of California, Berkeley
 
@@ -79,4 +79,4 @@ def str_method_line(method, line_number):
 def print_aec(aec, line_map):
 	for (method, iid) in reversed(aec):
 		line_number = line_map[iid]
-		print str_method_line(method, line_number)
+		print(str_method_line(method, line_number))
@@ -1,12 +1,13 @@
 #!/bin/bash
 
-if [ "$#" -ne 2 ]; then
-        echo "Usage: $0 out_dir num_reps"
+if [ "$#" -ne 2 ] && [ "$#" -ne 3 ]; then
+        echo "Usage: $0 out_dir num_reps [num_workers]"
         exit 1
 fi
 
 OUT_DIR=$1/python-data
 NUM_REPS=$2
+NUM_WORKERS=${3:-1}
 mkdir -p $OUT_DIR
 
 SCRIPT_DIRNAME="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
@@ -20,7 +21,7 @@ for REP in $(seq 0 $((NUM_REPS - 1 ))); do
 	if [ -f $RES_FILE ]; then
 		echo "Result file $RES_FILE already exists. skipping this rep. Remove results file to force re-run."
 	else
-		python3 $PYTHON_FILE > $RES_FILE
+		python3 $PYTHON_FILE --workers $NUM_WORKERS > $RES_FILE
 		echo "Done rep $REP; results in $RES_FILE"
 	fi
 done
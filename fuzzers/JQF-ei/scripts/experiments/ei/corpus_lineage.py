@@ -0,0 +1,134 @@
+import functools
+import os
+import re
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from scipy.sparse import csr_matrix
+from coverage_matrix import MATRIX_FILE_NAME, BranchDictionary, CoverageMatrix, load_npz
+
+LINEAGE_FILE_NAME = "corpus_lineage.npz"
+SAVED_PATTERN = re.compile(r"\[(\d+)\] Saved.*corpus/(id_\d+) (?:src:(\d+),)?")
+
+
+def encode_names(names: List[str]) -> np.ndarray:
+    return np.frombuffer("\n".join(names).encode("utf-8"), dtype=np.uint8)
+
+
+def decode_names(blob: np.ndarray) -> List[str]:
+    text = bytes(blob).decode("utf-8")
+    return text.split("\n") if text else []
+
+
+class CorpusLineage:
+    """
+    Parent links and save times of the corpus inputs of a campaign, parsed from `fuzz.log`.
+    `parents[name]` is missing for inputs saved without a `src:` (e.g. seeds).
+    """
+
+    def __init__(self, times: Dict[str, int], parents: Dict[str, str]):
+        self.times = times
+        self.parents = parents
+
+    @staticmethod
+    def parse(path: str) -> "CorpusLineage":
+        times = {}
+        parents = {}
+        with open(os.path.join(path, "fuzz.log")) as f:
+            for line in f:
+                result = SAVED_PATTERN.match(line)
+                if result:
+                    times[result.group(2)] = int(result.group(1))
+                    if result.group(3) is not None:
+                        parents[result.group(2)] = "id_" + result.group(3)
+        return CorpusLineage(times, parents)
+
+    def save(self, path: str):
+        names = list(self.times.keys())
+        np.savez(path,
+                 names=encode_names(names),
+                 times=np.array([self.times[name] for name in names], dtype=np.int64),
+                 parents=encode_names([self.parents.get(name, "") for name in names]))
+
+    @staticmethod
+    def load(path: str) -> "CorpusLineage":
+        arrays = load_npz(path, mmap=False)
+        names = decode_names(arrays["names"])
+        parents = decode_names(arrays["parents"])
+        times = {name: int(time) for name, time in zip(names, arrays["times"])}
+        return CorpusLineage(times, {name: parent for name, parent in zip(names, parents) if parent})
+
+    def parent(self, name: str) -> Optional[str]:
+        return self.parents.get(name)
+
+    def time(self, name: str) -> int:
+        return self.times[name]
+
+
+@functools.lru_cache(maxsize=None)
+def load_lineage(path: str) -> CorpusLineage:
+    """Parses `fuzz.log` of a campaign once and persists the result next to it."""
+    lineage_path = os.path.join(path, LINEAGE_FILE_NAME)
+    log_path = os.path.join(path, "fuzz.log")
+    if os.path.exists(lineage_path) and os.path.getmtime(lineage_path) >= os.path.getmtime(log_path):
+        return CorpusLineage.load(lineage_path)
+    lineage = CorpusLineage.parse(path)
+    lineage.save(lineage_path)
+    return lineage
+
+
+@functools.lru_cache(maxsize=16)
+def load_coverage(path: str) -> CoverageMatrix:
+    """Per-input coverage of a campaign, read from `corpus_coverage` once and persisted as a matrix."""
+    matrix_path = os.path.join(path, MATRIX_FILE_NAME)
+    if os.path.exists(matrix_path):
+        return CoverageMatrix.load(matrix_path)
+    matrix = CoverageMatrix.from_coverage_dir(os.path.join(path, "corpus_coverage"))
+    matrix.save(matrix_path)
+    return matrix
+
+
+def branch_mask(branches: BranchDictionary, names: Iterable[str]) -> np.ndarray:
+    mask = np.zeros(len(branches), dtype=bool)
+    ids = [branches.get(name) for name in names]
+    mask[[i for i in ids if i >= 0]] = True
+    return mask
+
+
+def new_branches_from_parents(matrix: CoverageMatrix, lineage: CorpusLineage,
+                              mask: Optional[np.ndarray] = None) -> Tuple[List[str], List[str], csr_matrix]:
+    """
+    For every input whose parent is also covered, the branches it covers that its parent does not,
+    restricted to the branches in `mask`. Returns (children, parents, children x branches matrix).
+    """
+    children = []
+    child_rows = []
+    parent_rows = []
+    for name in matrix.inputs:
+        parent = lineage.parent(name)
+        if parent is None or parent not in matrix.input_ids:
+            continue
+        children.append(name)
+        child_rows.append(matrix.input_ids[name])
+        parent_rows.append(matrix.input_ids[parent])
+    coverage = matrix.matrix.astype(np.int8)
+    child = coverage[child_rows]
+    diff = child - child.multiply(coverage[parent_rows])
+    if mask is not None:
+        diff = diff.multiply(mask.astype(np.int8)[np.newaxis, :])
+    diff = csr_matrix(diff)
+    diff.eliminate_zeros()
+    return children, [lineage.parent(name) for name in children], diff
+
+
+def build(base_path: str):
+    for name in sorted(os.listdir(base_path)):
+        path = os.path.join(base_path, name)
+        if not os.path.exists(os.path.join(path, "fuzz.log")):
+            continue
+        lineage = load_lineage(path)
+        print(name, len(lineage.times), len(lineage.parents))
+
+
+if __name__ == "__main__":
+    build(sys.argv[1])
@@ -0,0 +1,117 @@
+import functools
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+from coverage_matrix import COV_PREFIX, BranchDictionary, format_cov_line, parse_cov_line
+
+
+JQF_DIR = os.path.realpath(os.path.join(Path(__file__).resolve().parent, "../../.."))
+STDERR_TAIL_LINES = 20
+
+
+class ReproError(Exception):
+    """A replay exited with a non-zero status. `command[-1]` is the replayed input."""
+
+    def __init__(self, command: List[str], returncode: Optional[int], stderr: List[str], reason: str = None):
+        self.command = command
+        self.returncode = returncode
+        self.stderr = stderr
+        reason = reason or f"exited with status {returncode}"
+        super().__init__(f"Replay of {command[-1]} {reason}:\n" + "".join(stderr))
+
+
+class ReproTimeout(ReproError):
+    """A replay was killed after running longer than the timeout."""
+
+    def __init__(self, command: List[str], timeout: float, stderr: List[str]):
+        self.timeout = timeout
+        super().__init__(command, None, stderr, f"timed out after {timeout}s")
+
+
+@functools.lru_cache(maxsize=None)
+def examples_classpath(jqf_dir: str = JQF_DIR) -> str:
+    return subprocess.check_output([os.path.join(jqf_dir, "scripts", "examples_classpath.sh")]).decode("utf-8").strip()
+
+
+def repro_args(test_class: str, test_method: str, input_path: str, jqf_dir: str = JQF_DIR) -> List[str]:
+    return [os.path.join(jqf_dir, "bin", "jqf-repro"), "-i", "-c", examples_classpath(jqf_dir),
+            test_class, test_method, input_path]
+
+
+def repro_env(jvm_opts: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["JVM_OPTS"] = jvm_opts
+    return env
+
+
+def write_atomic(path: str, content: str):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def collect_coverage(args: List[str], output_path: Optional[str] = None, cwd: Optional[str] = None,
+                     env: Optional[Dict[str, str]] = None, timeout: Optional[float] = None,
+                     branches: Optional[BranchDictionary] = None) -> Set[int]:
+    """
+    Runs a replay and collects the unique `# Cov` lines of its stdout as it is produced.
+    Replaces `... 2>/dev/null | grep "^# Cov" | sort | uniq > output_path`: the sorted
+    lines are written to `output_path` atomically, and only once the replay succeeded.
+    Raises ReproTimeout or ReproError instead of silently leaving a truncated file.
+    """
+    branches = branches if branches is not None else BranchDictionary()
+    process = subprocess.Popen(args, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               start_new_session=True)
+    # Keep the end of stderr for error reports; draining it also keeps the JVM from blocking
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    stderr_reader = threading.Thread(target=lambda: stderr_tail.extend(
+        line.decode("utf-8", errors="replace") for line in process.stderr), daemon=True)
+    stderr_reader.start()
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        # jqf-repro is a shell script, so kill the JVM it started as well
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.start()
+    covered = set()
+    prefix = COV_PREFIX.encode("utf-8")
+    try:
+        for line in process.stdout:
+            if line.startswith(prefix):
+                covered.add(branches.intern(parse_cov_line(line.decode("utf-8", errors="replace"))))
+        process.wait()
+    finally:
+        if timer:
+            timer.cancel()
+        process.stdout.close()
+        stderr_reader.join()
+        process.stderr.close()
+    if timed_out.is_set():
+        raise ReproTimeout(args, timeout, list(stderr_tail))
+    if process.returncode != 0:
+        raise ReproError(args, process.returncode, list(stderr_tail))
+    if output_path is not None:
+        write_atomic(output_path, "".join(sorted(format_cov_line(branches[i]) for i in covered)))
+    return covered
+
+
+if __name__ == "__main__":
+    collect_coverage(sys.argv[2:], sys.argv[1])
@@ -0,0 +1,250 @@
+import os
+import re
+import struct
+import sys
+import zipfile
+from typing import Dict, Iterable, List, Tuple, Union
+import numpy as np
+from scipy.sparse import csc_matrix, csr_matrix
+
+COV_PREFIX = "# Cov"
+COVERED_PREFIX = "# Covered: "
+MATRIX_FILE_NAME = "corpus_coverage.npz"
+INDEX_FILE_NAME = "corpus_branch_index.npz"
+
+Input = Union[str, int]
+
+
+def parse_cov_line(line: str) -> str:
+    line = line.rstrip("\n")
+    if line.startswith(COVERED_PREFIX):
+        return line[len(COVERED_PREFIX):]
+    return line
+
+
+def format_cov_line(branch: str) -> str:
+    return COVERED_PREFIX + branch + "\n"
+
+
+class BranchDictionary:
+    """Interns branch names (the part after `# Covered: `) to dense integer ids."""
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        for name in names:
+            self.intern(name)
+
+    def intern(self, name: str) -> int:
+        branch_id = self.ids.get(name)
+        if branch_id is None:
+            branch_id = len(self.names)
+            self.ids[name] = branch_id
+            self.names.append(name)
+        return branch_id
+
+    def get(self, name: str) -> int:
+        return self.ids.get(name, -1)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, branch_id: int) -> str:
+        return self.names[branch_id]
+
+    def to_array(self) -> np.ndarray:
+        return np.frombuffer("\n".join(self.names).encode("utf-8"), dtype=np.uint8)
+
+    @staticmethod
+    def from_array(blob: np.ndarray) -> "BranchDictionary":
+        text = bytes(blob).decode("utf-8")
+        return BranchDictionary(text.split("\n") if text else [])
+
+
+class CoverageMatrix:
+    """
+    Input x branch coverage of a campaign stored as a boolean CSR matrix.
+    Row i holds the sorted branch ids covered by `inputs[i]`.
+    """
+
+    def __init__(self, inputs: List[str], branches: BranchDictionary, matrix: csr_matrix):
+        self.inputs = inputs
+        self.input_ids = {name: i for i, name in enumerate(inputs)}
+        self.branches = branches
+        self.matrix = matrix
+
+    @staticmethod
+    def from_coverage_dir(path: str, branches: BranchDictionary = None) -> "CoverageMatrix":
+        branches = branches if branches is not None else BranchDictionary()
+        inputs = []
+        rows = []
+        for file_name in sorted(os.listdir(path)):
+            if not file_name.endswith(".txt"):
+                continue
+            with open(os.path.join(path, file_name)) as f:
+                ids = [branches.intern(parse_cov_line(line)) for line in f if line.startswith(COV_PREFIX)]
+            inputs.append(file_name[:-len(".txt")])
+            rows.append(np.unique(np.array(ids, dtype=np.int32)))
+        return CoverageMatrix.from_rows(inputs, branches, rows)
+
+    @staticmethod
+    def from_rows(inputs: List[str], branches: BranchDictionary, rows: List[np.ndarray]) -> "CoverageMatrix":
+        indptr = np.zeros(len(rows) + 1, dtype=np.int32)
+        np.cumsum([len(row) for row in rows], out=indptr[1:])
+        indices = np.concatenate(rows).astype(np.int32) if rows else np.zeros(0, dtype=np.int32)
+        matrix = csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr),
+                            shape=(len(inputs), len(branches)))
+        return CoverageMatrix(inputs, branches, matrix)
+
+    def save(self, path: str):
+        np.savez(path,
+                 indptr=self.matrix.indptr,
+                 indices=self.matrix.indices,
+                 shape=np.array(self.matrix.shape, dtype=np.int64),
+                 inputs=np.frombuffer("\n".join(self.inputs).encode("utf-8"), dtype=np.uint8),
+                 branches=self.branches.to_array())
+
+    @staticmethod
+    def load(path: str, mmap: bool = True) -> "CoverageMatrix":
+        arrays = load_npz(path, mmap)
+        shape = tuple(int(v) for v in arrays["shape"])
+        inputs = bytes(arrays["inputs"]).decode("utf-8")
+        matrix = csr_matrix((np.ones(len(arrays["indices"]), dtype=bool), arrays["indices"], arrays["indptr"]),
+                            shape=shape)
+        return CoverageMatrix(inputs.split("\n") if inputs else [],
+                              BranchDictionary.from_array(arrays["branches"]), matrix)
+
+    def row(self, input: Input) -> int:
+        return self.input_ids[input] if isinstance(input, str) else input
+
+    def coverage_of(self, input: Input) -> np.ndarray:
+        i = self.row(input)
+        return self.matrix.indices[self.matrix.indptr[i]:self.matrix.indptr[i + 1]]
+
+    def inputs_covering(self, branch: Union[str, int]) -> List[str]:
+        if isinstance(branch, str):
+            branch = self.branches.get(branch)
+            if branch < 0:
+                return []
+        rows = self.matrix[:, branch].nonzero()[0]
+        return [self.inputs[i] for i in rows]
+
+    def new_branches(self, child: Input, parent: Input) -> np.ndarray:
+        return np.setdiff1d(self.coverage_of(child), self.coverage_of(parent), assume_unique=True)
+
+    def union(self, inputs: Iterable[Input]) -> np.ndarray:
+        rows = [self.coverage_of(input) for input in inputs]
+        return np.unique(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int32)
+
+    def branch_names(self, branch_ids: Iterable[int]) -> List[str]:
+        return [self.branches[i] for i in branch_ids]
+
+
+class BranchIndex:
+    """
+    Branch -> covering inputs index of a campaign, i.e. the coverage matrix in CSC form.
+    Column j holds the ids of the inputs covering branch j; `sizes` holds the corpus file sizes.
+    """
+
+    def __init__(self, inputs: List[str], branches: BranchDictionary, index: csc_matrix, sizes: np.ndarray):
+        self.inputs = inputs
+        self.branches = branches
+        self.index = index
+        self.sizes = sizes
+
+    @staticmethod
+    def from_matrix(matrix: CoverageMatrix, corpus_dir: str) -> "BranchIndex":
+        # Inputs missing from the corpus get size 0
+        paths = [os.path.join(corpus_dir, name) for name in matrix.inputs]
+        sizes = np.array([os.path.getsize(path) if os.path.exists(path) else 0 for path in paths], dtype=np.int64)
+        index = matrix.matrix.tocsc()
+        index.indptr = index.indptr.astype(np.int32)
+        index.indices = index.indices.astype(np.int32)
+        return BranchIndex(matrix.inputs, matrix.branches, index, sizes)
+
+    def save(self, path: str):
+        np.savez(path,
+                 indptr=self.index.indptr,
+                 indices=self.index.indices,
+                 shape=np.array(self.index.shape, dtype=np.int64),
+                 sizes=self.sizes,
+                 inputs=np.frombuffer("\n".join(self.inputs).encode("utf-8"), dtype=np.uint8),
+                 branches=self.branches.to_array())
+
+    @staticmethod
+    def load(path: str, mmap: bool = True) -> "BranchIndex":
+        arrays = load_npz(path, mmap)
+        shape = tuple(int(v) for v in arrays["shape"])
+        inputs = bytes(arrays["inputs"]).decode("utf-8")
+        index = csc_matrix((np.ones(len(arrays["indices"]), dtype=bool), arrays["indices"], arrays["indptr"]),
+                           shape=shape)
+        return BranchIndex(inputs.split("\n") if inputs else [],
+                           BranchDictionary.from_array(arrays["branches"]), index, arrays["sizes"])
+
+    def match_branches(self, pattern: str, regex: bool = False) -> np.ndarray:
+        """Ids of the branches whose name contains `pattern`, or matches it with `regex`."""
+        if regex:
+            compiled = re.compile(pattern)
+            return np.array([i for i, name in enumerate(self.branches.names) if compiled.search(name)],
+                            dtype=np.int32)
+        return np.array([i for i, name in enumerate(self.branches.names) if pattern in name], dtype=np.int32)
+
+    def inputs_covering(self, branch_ids: np.ndarray) -> List[Tuple[str, int, int]]:
+        """
+        Inputs covering any of `branch_ids` as (input, size, #branches covered) tuples,
+        smallest input first.
+        """
+        counts = np.zeros(len(self.inputs), dtype=np.int64)
+        for branch_id in branch_ids:
+            counts[self.index.indices[self.index.indptr[branch_id]:self.index.indptr[branch_id + 1]]] += 1
+        rows = np.nonzero(counts)[0]
+        rows = rows[np.lexsort((-counts[rows], self.sizes[rows]))]
+        return [(self.inputs[i], int(self.sizes[i]), int(counts[i])) for i in rows]
+
+
+def load_npz(path: str, mmap: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Loads every array of an uncompressed .npz archive.
+    With `mmap`, arrays are memory-mapped in place instead of being read,
+    which works because np.savez stores its members without compression.
+    """
+    if not mmap:
+        with np.load(path) as archive:
+            return {name: archive[name] for name in archive.files}
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                return load_npz(path, mmap=False)
+            # Skip the local file header to reach the .npy payload
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len(".npy")]
+            if np.prod(shape) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", shape=shape, offset=f.tell(),
+                                         order="F" if fortran_order else "C")
+    return arrays
+
+
+def build(base_path: str):
+    for name in sorted(os.listdir(base_path)):
+        coverage_dir = os.path.join(base_path, name, "corpus_coverage")
+        if not os.path.isdir(coverage_dir):
+            continue
+        matrix = CoverageMatrix.from_coverage_dir(coverage_dir)
+        matrix.save(os.path.join(base_path, name, MATRIX_FILE_NAME))
+        BranchIndex.from_matrix(matrix, os.path.join(base_path, name, "corpus")) \
+            .save(os.path.join(base_path, name, INDEX_FILE_NAME))
+        print(name, matrix.matrix.shape, matrix.matrix.nnz)
+
+
+if __name__ == "__main__":
+    build(sys.argv[1])
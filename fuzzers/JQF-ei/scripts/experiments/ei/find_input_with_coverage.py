@@ -1,35 +1,40 @@
-from doctest import Example
-import subprocess
-from configs import *
-import sys
 import os
-from pathlib import Path
-from typing import List
-from multiprocessing import Pool
-import glob
+import argparse
+from coverage_matrix import INDEX_FILE_NAME, MATRIX_FILE_NAME, BranchIndex, CoverageMatrix
 
 
-EXAMPLES_DIR = os.path.join(Path(__file__).resolve().parent, "../../../examples")
+def load_index(base_path: str) -> BranchIndex:
+    index_path = os.path.join(base_path, INDEX_FILE_NAME)
+    matrix_path = os.path.join(base_path, MATRIX_FILE_NAME)
+    if os.path.exists(index_path):
+        # Rebuild an index saved before the matrix was last rewritten
+        if not os.path.exists(matrix_path) or os.path.getmtime(index_path) >= os.path.getmtime(matrix_path):
+            return BranchIndex.load(index_path)
+    if os.path.exists(matrix_path):
+        matrix = CoverageMatrix.load(matrix_path)
+    else:
+        # Per-input coverage is produced by `reconstruct_cov.py <path> cov`
+        matrix = CoverageMatrix.from_coverage_dir(os.path.join(base_path, "corpus_coverage"))
+        matrix.save(matrix_path)
+    index = BranchIndex.from_matrix(matrix, os.path.join(base_path, "corpus"))
+    index.save(index_path)
+    return index
 
 
-def run(base_path: str):
+def run(base_path: str, pattern: str, regex: bool = False, limit: int = 10):
+    index = load_index(base_path)
+    branch_ids = index.match_branches(pattern, regex)
+    print(f"{len(branch_ids)} branches match {pattern}")
     corpus_dir = os.path.join(base_path, "corpus")
-    for f in glob.glob(os.path.join(corpus_dir, "id_*")):
-        args = f"JVM_OPTS=\"-Djqf.repro.logUniqueBranches=true -Djqf.repro.traceDir=.\" " + \
-                f"{EXAMPLES_DIR}/../bin/jqf-repro -i -c $({EXAMPLES_DIR}/../scripts/experiments/../../scripts/examples_classpath.sh) " + \
-                f"{DATASET_TEST_CLASS_MAPPING['rhino']} testWithGenerator " + \
-                f"{f}"
-        print(args)
-        out = subprocess.check_output(args, cwd=EXAMPLES_DIR, shell=True).decode("utf-8")
-        if "visitDotQuery" in out:
-            print(f)
-            break
-                    #  yield "-Djqf.repro.logUniqueBranches=true"
-                    #  yield ["mvn", "jqf:repro", "-Dengine=repro",
-                            #  f"-Dclass={DATASET_TEST_CLASS_MAPPING[dataset]}",
-                            #  "-Dmethod=testWithGenerator", f"-Dinput={corpus_dir}",
-                            #  f"-DtraceDir={path}", f"-DlogCoverage={corpus_dir}/../tmp.log"]
+    for name, size, count in index.inputs_covering(branch_ids)[:limit]:
+        print(os.path.join(corpus_dir, name), size, count)
 
 
 if __name__ == "__main__":
-    run(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Find the corpus inputs covering a branch or method.")
+    parser.add_argument("campaign")
+    parser.add_argument("pattern", nargs="?", default="visitDotQuery")
+    parser.add_argument("--regex", action="store_true")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+    run(args.campaign, args.pattern, args.regex, args.limit)
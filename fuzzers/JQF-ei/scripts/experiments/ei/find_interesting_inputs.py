@@ -1,49 +1,45 @@
 import os
-from typing import Optional
+from typing import Optional, Tuple
+from multiprocessing import Pool
 from configs import *
 from visualize import *
-import re
+from coverage_matrix import format_cov_line, parse_cov_line
+from corpus_lineage import branch_mask, load_coverage, load_lineage, new_branches_from_parents
 
 def build_corpus_map(path: str) -> Dict[str, str]:
-    pattern = re.compile(r"\[\d+\] Saved.*corpus/(id_\d+) src:(\d+),.*")
-    mapping = {}
-    with open(os.path.join(path, "fuzz.log")) as f:
-        for line in f:
-            result = pattern.match(line)
-            if result:
-                mapping[result.group(1)] = "id_" + result.group(2)
-    return mapping
+    return dict(load_lineage(path).parents)
+
+def find_interesting(path: str, only_algo_cov: List[str], threshold: int = 10) -> List[Tuple[str, str, List[str]]]:
+    matrix = load_coverage(path)
+    children, parents, diff = new_branches_from_parents(
+        matrix, load_lineage(path), branch_mask(matrix.branches, only_algo_cov))
+    counts = diff.getnnz(axis=1)
+    return [(children[i], parents[i], matrix.branch_names(diff.indices[diff.indptr[i]:diff.indptr[i + 1]]))
+            for i in np.nonzero(counts > threshold)[0]]
 
 def process(base_dir: str):
     DATASET = ['rhino']
     for dataset in DATASET:
-        only_algo_cov_data = set([item[11:] for item in process_cov_data(os.path.join(base_dir, "processed", f"{dataset}-only-zest-fast-cov-all.txt"))])
+        only_algo_cov_data = [parse_cov_line(item) for item in process_cov_data(os.path.join(base_dir, "processed", f"{dataset}-only-zest-fast-cov-all.txt"))]
+        folders = []
         for i in range(10):
             expreiment_folder = os.path.join(
                 base_dir, f"{dataset}-zest-fast-results-{i}")
-            corpus_coverage_folder = os.path.join(expreiment_folder, "corpus_coverage")
-            if not os.path.exists(corpus_coverage_folder):
-                continue
-
-            mapping = build_corpus_map(expreiment_folder)
-            for item in sorted(os.listdir(corpus_coverage_folder)):
-                index = item.split(".")[0]
-                if index not in mapping:
-                    continue
+            if os.path.exists(os.path.join(expreiment_folder, "corpus_coverage")):
+                folders.append(expreiment_folder)
 
-                cov_data = process_cov_data(os.path.join(corpus_coverage_folder, item))
-                parent_cov_data = process_cov_data(os.path.join(corpus_coverage_folder, mapping[index] + ".txt"))
-                intersection = cov_data.intersection(only_algo_cov_data) - parent_cov_data
-                if len(intersection) > 10:
-                    print("=======================")
-                    print(corpus_coverage_folder)
-                    print("Index: ", index)
-                    print("Parent: ", mapping[index])
-                    print(len(intersection))
-                    print("".join(intersection))
-                    print("=======================")
+        with Pool(min(len(folders), os.cpu_count()) or 1) as pool:
+            results = pool.starmap(find_interesting, [(folder, only_algo_cov_data) for folder in folders])
+        for folder, interesting in zip(folders, results):
+            for index, parent, branches in interesting:
+                print("=======================")
+                print(os.path.join(folder, "corpus_coverage"))
+                print("Index: ", index)
+                print("Parent: ", parent)
+                print(len(branches))
+                print("".join(format_cov_line(branch) for branch in branches))
+                print("=======================")
 
 
 if __name__ == "__main__":
     process(sys.argv[1])
-
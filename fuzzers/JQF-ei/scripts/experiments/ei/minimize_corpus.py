@@ -0,0 +1,105 @@
+import argparse
+import heapq
+import os
+import shutil
+from typing import Dict, List
+import numpy as np
+from coverage_matrix import CoverageMatrix
+from corpus_lineage import load_coverage
+
+MANIFEST_FILE_NAME = "corpus_min.txt"
+MIN_CORPUS_DIR_NAME = "corpus_min"
+
+
+def load_exec_times(path: str) -> Dict[str, float]:
+    """Execution time of every input in `results.csv` (case, result, class, cov, time)."""
+    times = {}
+    with open(os.path.join(path, "results.csv")) as f:
+        for line in f:
+            fields = line.strip().split(",")
+            if len(fields) < 5 or not fields[0].startswith("id_"):
+                continue
+            try:
+                times[fields[0]] = float(fields[4])
+            except ValueError:
+                continue
+    return times
+
+
+def input_costs(path: str, matrix: CoverageMatrix, cost: str) -> np.ndarray:
+    if cost == "time":
+        times = load_exec_times(path)
+        # Inputs without a measurement are never preferred over measured ones
+        default = max(times.values(), default=1.0)
+        return np.array([times.get(name, default) for name in matrix.inputs], dtype=np.float64)
+    corpus_dir = os.path.join(path, "corpus")
+    return np.array([os.path.getsize(os.path.join(corpus_dir, name)) for name in matrix.inputs], dtype=np.float64)
+
+
+def greedy_set_cover(matrix: CoverageMatrix, costs: np.ndarray, weighted: bool = True) -> List[int]:
+    """
+    Lazy greedy set cover over the rows of the coverage matrix.
+    Picks the input covering the most uncovered branches (per unit of cost if `weighted`),
+    breaking ties by the lower cost. The result covers every branch the corpus covers.
+    """
+    indptr = matrix.matrix.indptr
+    indices = matrix.matrix.indices
+    uncovered = np.zeros(matrix.matrix.shape[1], dtype=bool)
+    uncovered[indices] = True
+    # Costs of 0 (e.g. empty inputs) would make every ratio infinite
+    costs = np.maximum(costs, 1e-9)
+
+    def priority(row: int, gain: int):
+        return (-(gain / costs[row] if weighted else gain), costs[row], row)
+
+    heap = [priority(row, indptr[row + 1] - indptr[row]) for row in range(len(matrix.inputs))]
+    heapq.heapify(heap)
+    selected = []
+    remaining = int(uncovered.sum())
+    while remaining and heap:
+        _, _, row = heapq.heappop(heap)
+        gain = int(uncovered[indices[indptr[row]:indptr[row + 1]]].sum())
+        if gain == 0:
+            continue
+        # Gains only shrink, so the popped entry is the best one if it is still up to date
+        if heap and priority(row, gain) > heap[0]:
+            heapq.heappush(heap, priority(row, gain))
+            continue
+        uncovered[indices[indptr[row]:indptr[row + 1]]] = False
+        remaining -= gain
+        selected.append(row)
+    return selected
+
+
+def minimize(path: str, cost: str = "size", weighted: bool = True, link: bool = False) -> List[str]:
+    matrix = load_coverage(path)
+    selected = greedy_set_cover(matrix, input_costs(path, matrix, cost), weighted)
+    names = sorted(matrix.inputs[row] for row in selected)
+    with open(os.path.join(path, MANIFEST_FILE_NAME), "w") as f:
+        f.write("".join(name + "\n" for name in names))
+    if link:
+        min_corpus_dir = os.path.join(path, MIN_CORPUS_DIR_NAME)
+        shutil.rmtree(min_corpus_dir, ignore_errors=True)
+        os.mkdir(min_corpus_dir)
+        for name in names:
+            os.symlink(os.path.realpath(os.path.join(path, "corpus", name)), os.path.join(min_corpus_dir, name))
+    return names
+
+
+def run(base_path: str, cost: str, weighted: bool, link: bool):
+    for name in sorted(os.listdir(base_path)):
+        path = os.path.join(base_path, name)
+        if not os.path.isdir(os.path.join(path, "corpus_coverage")):
+            continue
+        names = minimize(path, cost, weighted, link)
+        print(name, f"{len(names)}/{len(load_coverage(path).inputs)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a coverage-preserving minimized corpus manifest per campaign.")
+    parser.add_argument("base_path")
+    parser.add_argument("--cost", choices=["size", "time"], default="size")
+    parser.add_argument("--unweighted", action="store_true", help="maximize new branches, use cost only for ties")
+    parser.add_argument("--link", action="store_true", help=f"also create {MIN_CORPUS_DIR_NAME}/ with symlinks")
+    args = parser.parse_args()
+    run(args.base_path, args.cost, not args.unweighted, args.link)
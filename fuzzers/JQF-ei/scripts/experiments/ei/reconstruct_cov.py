@@ -6,24 +6,37 @@ import os
 from pathlib import Path
 from typing import List
 from multiprocessing import Pool
+from coverage_collector import ReproError, collect_coverage, repro_args, repro_env
+from minimize_corpus import MIN_CORPUS_DIR_NAME
 
 
 EXAMPLES_DIR = os.path.join(Path(__file__).resolve().parent, "../../../examples")
+# Trace directory of minimized perf replays, so they don't overwrite the full replay's results.csv
+MIN_PERF_DIR_NAME = "perf_min"
 
 def call(args: List[str]):
-    print(args)
-    if isinstance(args, str):
-        subprocess.check_call(args, cwd=EXAMPLES_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, shell=True)
+    if isinstance(args, tuple):
+        args, output_path = args
+        print(output_path)
+        try:
+            collect_coverage(args, output_path, cwd=EXAMPLES_DIR,
+                             env=repro_env("-Djqf.repro.logUniqueBranches=true -Xmx16g"))
+        except ReproError as e:
+            print(e)
     else:
+        print(args)
         subprocess.check_call(args, cwd=EXAMPLES_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
-def run(path: str, task: str):
+def run(path: str, task: str, minimized: bool = False):
+    # Coverage replays produce the per-input coverage the manifest is chosen from, so they always use the full corpus
+    if minimized and task != "perf":
+        raise SystemExit("Only perf replays can use the minimized corpus")
     cpu = 1 if task == "perf" else 10
     with Pool(cpu) as pool:
-        pool.map(call, generate_tasks(path, task))
+        pool.map(call, generate_tasks(path, task, minimized))
 
 
-def generate_tasks(base_path: str, mode: str):
+def generate_tasks(base_path: str, mode: str, minimized: bool = False):
     for dataset in DATASET:
         for algorithm in ALGORITHM:
             for idx in range(0, 10):
@@ -32,12 +45,20 @@ def generate_tasks(base_path: str, mode: str):
                     break
                 corpus_dir = os.path.join(path, "corpus")
                 if mode == "perf":
-                    if os.path.exists(os.path.join(path, "results.csv")):
+                    trace_dir = path
+                    # Replay only the inputs kept by `minimize_corpus.py --link`, tracing to perf_min/
+                    if minimized:
+                        corpus_dir = os.path.join(path, MIN_CORPUS_DIR_NAME)
+                        if not os.path.isdir(corpus_dir):
+                            raise FileNotFoundError(f"{corpus_dir} is missing, run minimize_corpus.py --link first")
+                        trace_dir = os.path.join(path, MIN_PERF_DIR_NAME)
+                        os.makedirs(trace_dir, exist_ok=True)
+                    if os.path.exists(os.path.join(trace_dir, "results.csv")):
                         continue
                     yield ["mvn", "jqf:repro", "-Dengine=repro",
                             f"-Dclass={DATASET_TEST_CLASS_MAPPING[dataset]}",
                             "-Dmethod=testWithGenerator", f"-Dinput={corpus_dir}",
-                            f"-DtraceDir={path}", "-DuseFastNonCollidingCoverageInstrumentation=true"]
+                            f"-DtraceDir={trace_dir}", "-DuseFastNonCollidingCoverageInstrumentation=true"]
                 else:
                     output_dir = os.path.join(path, "corpus_coverage")
                     if not os.path.exists(output_dir):
@@ -47,10 +68,8 @@ def generate_tasks(base_path: str, mode: str):
                         output_path = os.path.realpath(os.path.join(output_dir, file_name + '.txt'))
                         #  if os.path.exists(output_path):
                             #  continue
-                        yield f"JVM_OPTS=\"-Djqf.repro.logUniqueBranches=true -Xmx16g\" ../bin/jqf-repro -i " + \
-                        f"-c $({EXAMPLES_DIR}/../scripts/examples_classpath.sh) {DATASET_TEST_CLASS_MAPPING[dataset]} " + \
-                        f"testWithGenerator {input_path} 2>/dev/null | grep \"^# Cov\" | sort | uniq > {output_path}"
+                        yield repro_args(DATASET_TEST_CLASS_MAPPING[dataset], "testWithGenerator", input_path), output_path
 
 
 if __name__ == "__main__":
-    run(sys.argv[1], sys.argv[2])
+    run(sys.argv[1], sys.argv[2], len(sys.argv) > 3 and sys.argv[3] == "min")
@@ -1,4 +1,3 @@
-from doctest import Example
 import subprocess
 from configs import *
 import sys
@@ -6,14 +5,23 @@ import os
 from pathlib import Path
 from typing import List
 from multiprocessing import Pool
+from coverage_collector import ReproError, collect_coverage, repro_args, repro_env
 
 
 EXAMPLES_DIR = os.path.join(Path(__file__).resolve().parent, "../../../examples")
 
-def call(args: List[str]):
+def call(args: List[tuple]):
     for command in args:
-        print(command)
-        subprocess.check_call(command[0], cwd=command[1], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, shell=True)
+        if len(command) == 4:
+            repro, cwd, output_path, jvm_opts = command
+            print(output_path)
+            try:
+                collect_coverage(repro, output_path, cwd=cwd, env=repro_env(jvm_opts))
+            except ReproError as e:
+                print(e)
+        else:
+            shell_command, cwd = command
+            subprocess.check_call(shell_command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, shell=True)
 
 def run(path: str, task: str):
     cpu = 1 if task == "perf" else 20
@@ -32,10 +40,8 @@ def generate_tasks(base_path: str, mode: str):
                         if not os.path.exists(path):
                             continue
                         corpus_dir = os.path.join(path, "corpus")
-                        yield f"JVM_OPTS=\"-Djqf.repro.logUniqueBranches=true -Djqf.repro.traceDir={path}\" " + \
-                                f"{EXAMPLES_DIR}/../bin/jqf-repro -i -c $({EXAMPLES_DIR}/../scripts/experiments/../../scripts/examples_classpath.sh) " + \
-                                f"{DATASET_TEST_CLASS_MAPPING[dataset]} {generator} " + \
-                                f"{corpus_dir} 2> /dev/null | grep \"^# Cov\" | sort | uniq > {path}/cov-all.log"
+                        yield [(repro_args(DATASET_TEST_CLASS_MAPPING[dataset], generator, corpus_dir), EXAMPLES_DIR,
+                                f"{path}/cov-all.log", f"-Djqf.repro.logUniqueBranches=true -Djqf.repro.traceDir={path}")]
                     path = os.path.join(base_path, f"{dataset}-{algorithm}-{generator}-results-{idx}")
                     if not os.path.exists(path):
                         continue
@@ -56,11 +62,8 @@ def generate_tasks(base_path: str, mode: str):
                         corpus_dir = os.path.join(path, "corpus")
                         cov_generator = generator
                     commands.append(
-                        (f"JVM_OPTS=\"-Djqf.repro.logUniqueBranches=true -Djqf.repro.traceDir={path}\" " + \
-                            f"{EXAMPLES_DIR}/../bin/jqf-repro -i -c $({EXAMPLES_DIR}/../scripts/experiments/../../scripts/examples_classpath.sh) " + \
-                            f"{DATASET_TEST_CLASS_MAPPING[dataset]} {cov_generator} " + \
-                            f"{corpus_dir} 2> /dev/null | grep -a \"^# Cov\" | sort | uniq > {path}/cov-all.log", EXAMPLES_DIR
-                         )
+                        (repro_args(DATASET_TEST_CLASS_MAPPING[dataset], cov_generator, corpus_dir), EXAMPLES_DIR,
+                         f"{path}/cov-all.log", f"-Djqf.repro.logUniqueBranches=true -Djqf.repro.traceDir={path}")
                     )
                     yield commands
                     #  yield "-Djqf.repro.logUniqueBranches=true"
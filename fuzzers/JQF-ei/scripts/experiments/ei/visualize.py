@@ -4,9 +4,9 @@ from typing import Dict, Iterator, List, Any, Set
 import numpy as np
 import pandas as pd
 import seaborn as sns
-import re
 import sns_configs
 from find_interesting_inputs import build_corpus_map
+from corpus_lineage import load_lineage
 from matplotlib.patches import Patch
 import matplotlib.pyplot as plt
 
@@ -27,14 +27,7 @@ def name_converter(value: str) -> int:
     return int(value.split("_")[1])
 
 def build_corpus_time_map(path: str) -> Dict[str, int]:
-    pattern = re.compile(r"\[(\d+)\] Saved.*corpus/(id_\d+) .*")
-    mapping = {}
-    with open(os.path.join(path, "fuzz.log")) as f:
-        for line in f:
-            result = pattern.match(line)
-            if result:
-                mapping[result.group(2)] = int(result.group(1))
-    return mapping
+    return dict(load_lineage(path).times)
 
 def name_to_time_mapping(corpus_map: Dict[str, str], value: str) -> int:
     key = "id_" + value.split("_")[1]
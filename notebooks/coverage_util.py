@@ -1,9 +1,11 @@
+import hashlib
 import os
 import pathlib
 import sys
 
 import matplotlib.colors as mcolors
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 
 from tabulate import tabulate
@@ -12,6 +14,11 @@ import pandas as pd
 import argparse
 import scipy
 
+sys.path.append(os.path.join(pathlib.Path(__file__).resolve().parent.parent, "scripts"))
+from report_util import get_stats_cache
+
+COVERAGE_KINDS = ['trial_bound_coverage', 'time_bound_coverage', 'normalized_coverage']
+
 fuzzer_map = {
     'BeDiv-Struct': 'BeDivFuzz',
     'Zeugma-Link': 'Zeugma',
@@ -36,7 +43,64 @@ def compute_sig_level(treatments, alpha=0.05):
     return alpha / number_of_comparisons
 
 def mann_whitney(values1, values2):
-    return scipy.stats.mannwhitneyu(values1, values2, alternative='two-sided', use_continuity=True)[1]
+    return get_stats_cache().compute(
+        'mann_whitney',
+        lambda v1, v2: scipy.stats.mannwhitneyu(v1, v2, alternative='two-sided', use_continuity=True)[1],
+        [np.asarray(values1, dtype=float), np.asarray(values2, dtype=float)])
+
+def mann_whitney_sorted(values1, values2):
+    """U statistic of values1 against values2 and two-sided p-value for two sorted samples, matching mann_whitney."""
+    n1, n2 = len(values1), len(values2)
+    if n1 == 0 or n2 == 0:
+        return np.nan, np.nan
+    less = np.searchsorted(values2, values1, side='left')
+    u = less.sum() + 0.5 * (np.searchsorted(values2, values1, side='right') - less).sum()
+    _, ties = np.unique(np.concatenate([values1, values2]), return_counts=True)
+    if (n1 <= 8 or n2 <= 8) and len(ties) == n1 + n2:
+        return u, scipy.stats.mannwhitneyu(values1, values2, alternative='two-sided', use_continuity=True)[1]
+    n = n1 + n2
+    s = np.sqrt(n1 * n2 / 12 * ((n + 1) - (ties ** 3 - ties).sum() / (n * (n - 1))))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (max(u, n1 * n2 - u) - n1 * n2 / 2 - 0.5) / s
+    return u, np.clip(2 * scipy.stats.norm.sf(z), 0, 1)
+
+def mann_whitney_against(baseline, samples):
+    """
+    Two-sided Mann-Whitney U test p-values of every sample against the baseline, matching mann_whitney.
+    The baseline is sorted once and U statistics are read off with binary searches.
+    """
+    baseline = np.sort(np.asarray(baseline, dtype=float))
+    return np.array([get_stats_cache().compute('mann_whitney_sorted', mann_whitney_sorted,
+                                               [baseline, np.sort(np.asarray(values, dtype=float))])[1]
+                     for values in samples])
+
+BOOTSTRAP_RESAMPLES = 10000
+BOOTSTRAP_SEED = 0
+CONFIDENCE_LEVEL = 0.95
+
+def batch_median(values):
+    return np.median(values, axis=-1)
+
+def batch_a12(values1, values2):
+    greater = (values1[..., :, np.newaxis] > values2[..., np.newaxis, :]).mean(axis=(-2, -1))
+    equal = (values1[..., :, np.newaxis] == values2[..., np.newaxis, :]).mean(axis=(-2, -1))
+    return greater + 0.5 * equal
+
+def group_rng(*key):
+    """Bootstrap generator seeded from BOOTSTRAP_SEED and the group key, independent of the other groups."""
+    digest = hashlib.sha1('\0'.join(str(k) for k in key).encode('utf-8')).digest()
+    return np.random.default_rng([BOOTSTRAP_SEED, int.from_bytes(digest[:8], 'little')])
+
+def bootstrap_ci(samples, statistic, resamples=BOOTSTRAP_RESAMPLES, confidence_level=CONFIDENCE_LEVEL, rng=None):
+    """Percentile bootstrap interval of a batched statistic, resampling every sample with one index matrix."""
+    rng = rng if rng is not None else np.random.default_rng(BOOTSTRAP_SEED)
+    samples = [np.asarray(sample, dtype=float) for sample in samples]
+    if any(len(sample) == 0 for sample in samples):
+        return np.nan, np.nan
+    batch = [sample[rng.integers(0, len(sample), size=(resamples, len(sample)))] for sample in samples]
+    alpha = (1 - confidence_level) / 2
+    low, high = np.quantile(statistic(*batch), [alpha, 1 - alpha])
+    return low, high
 
 def plot_coverage(data, subject, cmap=None):
     # Define the specific order and colors
@@ -128,26 +192,45 @@ def create_coverage_over_time_plots(data, output_dir):
         plot_coverage(data, subject, cmap)
 
 
-def get_closest_covered_branches_at(time_df, campaign_id, time_to_execution_limit):
-    campaign_time_data = time_df[time_df['campaign_id'] == campaign_id]
-    if len(campaign_time_data) == 0:
-        return 0
-            # Filter to only include times less than or equal to the execution limit
-    valid_times = campaign_time_data[campaign_time_data['time'] <= time_to_execution_limit]
-
-    if len(valid_times) == 0:
-        # If no valid times found (all times are after the limit)
-        return 0
-
-    # Get the maximum time that's still within the limit
-    max_valid_time = valid_times['time'].max()
-
-    # Get the row with that time
-    row_at_max_valid_time = valid_times[valid_times['time'] == max_valid_time]
-
-    # Return the covered branches at that time
-    return row_at_max_valid_time['covered_branches'].iloc[0]
-
+class CoverageTimeIndex:
+    """
+    Coverage time series of all campaigns, sorted once by (campaign_id, time).
+    Answers as-of queries for many (campaign, time) pairs with one searchsorted call.
+    """
+
+    def __init__(self, time_df, value='covered_branches'):
+        codes, self.campaigns = pd.factorize(time_df['campaign_id'])
+        times = pd.to_timedelta(time_df['time']).to_numpy().astype(np.int64)
+        order = np.lexsort((times, codes))
+        self.codes = {campaign: code for code, campaign in enumerate(self.campaigns)}
+        self.min_time = times.min() if len(times) > 0 else 0
+        self.span = (times.max() - self.min_time + 1) if len(times) > 0 else 1
+        if len(self.campaigns) * float(self.span) >= 2 ** 62:
+            raise ValueError('Time range too large to index')
+        # Keys grow with (campaign, time), so one sorted array covers every campaign
+        self.keys = codes[order] * self.span + (times[order] - self.min_time)
+        self.offsets = np.searchsorted(codes[order], np.arange(len(self.campaigns) + 1))
+        self.values = time_df[value].to_numpy()[order]
+
+    def at(self, campaign_ids, times, default=0):
+        """
+        Returns the value of every campaign at the latest time at or before the matching time,
+        or default if the campaign has no data by then or the time is missing (NaT).
+        Ties take the first row of the original frame.
+        """
+        codes = np.array([self.codes.get(campaign, -1) for campaign in campaign_ids], dtype=np.int64)
+        times = pd.to_timedelta(pd.Series(times))
+        known = (codes >= 0) & times.notna().to_numpy()
+        # NaT is int64-min, so drop it before subtracting min_time would overflow it
+        times = np.where(known, times.to_numpy().astype(np.int64), self.min_time) - self.min_time
+        keys = np.maximum(codes, 0) * self.span + np.clip(times, -1, self.span - 1)
+        positions = np.searchsorted(self.keys, keys, side='right') - 1
+        found = known & (positions >= self.offsets[np.maximum(codes, 0)])
+        positions = np.searchsorted(self.keys, self.keys[np.maximum(positions, 0)], side='left') \
+            if len(self.keys) > 0 else positions
+        result = np.full(len(codes), default, dtype=np.result_type(self.values.dtype, type(default)))
+        result[found] = self.values[positions[found]]
+        return result
 
 
 def process_cov_data(corpus_size_df, time_df):
@@ -158,20 +241,16 @@ def process_cov_data(corpus_size_df, time_df):
 
     corpus_size_df['time_to_execution_limit'] = pd.to_timedelta(corpus_size_df['time_to_execution_limit'], unit='s')
     corpus_size_df['normalized_execution_time'] = pd.to_timedelta(corpus_size_df['normalized_execution_time'], unit='s')
-    rows = []
-
-    for _, row in corpus_size_df.iterrows():
-        campaign_id = row['campaign_id']
-
-        rows.append({
-            'subject': row['subject'],
-            'fuzzer': convert_id_to_fuzzer(campaign_id),
-            'campaign_id': campaign_id,
-            'trial_bound_coverage': get_closest_covered_branches_at(time_df, campaign_id, row['time_to_execution_limit']),
-            'time_bound_coverage': get_closest_covered_branches_at(time_df, campaign_id, pd.Timedelta('1 days 00:00:00')),
-            'normalized_coverage': get_closest_covered_branches_at(time_df, campaign_id, row['normalized_execution_time']),
-        })
-    df = pd.DataFrame(rows)
+    index = CoverageTimeIndex(time_df)
+    campaign_ids = corpus_size_df['campaign_id'].to_numpy()
+    df = pd.DataFrame({
+        'subject': corpus_size_df['subject'].to_numpy(),
+        'fuzzer': [convert_id_to_fuzzer(campaign_id) for campaign_id in campaign_ids],
+        'campaign_id': campaign_ids,
+        'trial_bound_coverage': index.at(campaign_ids, corpus_size_df['time_to_execution_limit']),
+        'time_bound_coverage': index.at(campaign_ids, [pd.Timedelta('1 days 00:00:00')] * len(campaign_ids)),
+        'normalized_coverage': index.at(campaign_ids, corpus_size_df['normalized_execution_time']),
+    })
     df['fuzzer'] = df['fuzzer'].replace({
         'BeDiv-Struct': 'BeDivFuzz',
         'Zeugma-Link': 'Zeugma'
@@ -181,24 +260,42 @@ def process_cov_data(corpus_size_df, time_df):
 
 def get_aggregated_coverage(df):
     print("Aggregating time/trial-bounded coverage data...")
+    fuzzers = df['fuzzer'].unique()
+    subjects = df['subject'].unique()
+    sig_level = compute_sig_level(fuzzers)
+    groups = df.groupby(['fuzzer', 'subject'])[COVERAGE_KINDS]
+    medians = groups.median()
+    samples = {key: group for key, group in groups}
+    empty = df[COVERAGE_KINDS].iloc[:0]
+    significant = {}
+    for subject in subjects:
+        baseline = samples.get(('Zest', subject), empty)
+        for coverage in COVERAGE_KINDS:
+            p_values = mann_whitney_against(
+                baseline[coverage].values, [samples.get((fuzzer, subject), empty)[coverage].values for fuzzer in fuzzers])
+            for fuzzer, p_value in zip(fuzzers, p_values):
+                significant[(fuzzer, subject, coverage)] = p_value < sig_level
     aggregated = []
-    for fuzzer in tqdm(df['fuzzer'].unique()):
-        for subject in tqdm(df['subject'].unique()):
-            new_data = {
-                'fuzzer': fuzzer,
-                'subject': subject,
-                'trial_bound_coverage': df[(df['fuzzer'] == fuzzer) & (df['subject'] == subject)]['trial_bound_coverage'].median(),
-                'time_bound_coverage': df[(df['fuzzer'] == fuzzer) & (df['subject'] == subject)]['time_bound_coverage'].median(),
-                'normalized_coverage': df[(df['fuzzer'] == fuzzer) & (df['subject'] == subject)]['normalized_coverage'].median(),
-            }
-            for coverage in ['trial_bound_coverage', 'time_bound_coverage', 'normalized_coverage']:
-                baseline = df[(df['fuzzer'] == 'Zest') & (df['subject'] == subject)][coverage].values
-                values =df[(df['fuzzer'] == fuzzer) & (df['subject'] == subject)][coverage].values
-                sig_level = compute_sig_level(df['fuzzer'].unique())
-                if (mann_whitney(baseline, values) < sig_level):
-                    new_data[coverage + "_sig"] = 'color: red;'
-                else:
-                    new_data[coverage + "_sig"] = ''
+    for fuzzer in tqdm(fuzzers):
+        for subject in subjects:
+            new_data = {'fuzzer': fuzzer, 'subject': subject}
+            for coverage in COVERAGE_KINDS:
+                new_data[coverage] = medians[coverage].get((fuzzer, subject), np.nan)
+            baseline = samples.get(('Zest', subject), empty)
+            values = samples.get((fuzzer, subject), empty)
+            for coverage in COVERAGE_KINDS:
+                new_data[coverage + "_sig"] = 'color: red;' if significant[(fuzzer, subject, coverage)] else ''
+                new_data[coverage + "_low"], new_data[coverage + "_high"] = np.nan, np.nan
+                # batch_a12 is not folded like a12: it is the probability that the fuzzer beats Zest
+                new_data[coverage + "_a12_unfolded"] = np.nan
+                new_data[coverage + "_a12_unfolded_low"], new_data[coverage + "_a12_unfolded_high"] = np.nan, np.nan
+                if len(values) == 0:
+                    continue
+                rng = group_rng(fuzzer, subject, coverage)
+                new_data[coverage + "_low"], new_data[coverage + "_high"] = bootstrap_ci([values[coverage].values], batch_median, rng=rng)
+                if len(baseline) > 0:
+                    new_data[coverage + "_a12_unfolded"] = batch_a12(values[coverage].values.astype(float), baseline[coverage].values.astype(float))
+                    new_data[coverage + "_a12_unfolded_low"], new_data[coverage + "_a12_unfolded_high"] = bootstrap_ci([values[coverage].values, baseline[coverage].values], batch_a12, rng=rng)
             aggregated.append(new_data)
     return pd.DataFrame(aggregated)
 
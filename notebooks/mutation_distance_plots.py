@@ -1,3 +1,6 @@
+import hashlib
+import os
+import matplotlib.colors as mcolors
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
@@ -7,10 +10,27 @@ import tqdm
 from matplotlib.ticker import ScalarFormatter
 
 
-def plot_mut_distance_scatter(df, benchmark_name, labels=False):
+def mutation_distance_histogram(x, y, bins=200, chunk_size=1_000_000):
+    """
+    Bin (x, y) pairs in [0, 1] x [0, 1] into a bins x bins grid of counts.
+    Rows are binned in chunks, so memory use does not grow with the number of rows.
+    """
+    edges = np.linspace(0, 1, bins + 1)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    counts = np.zeros((bins, bins))
+    for start in range(0, len(x), chunk_size):
+        hist, _, _ = np.histogram2d(x[start:start + chunk_size], y[start:start + chunk_size], bins=[edges, edges])
+        counts += hist
+    return counts
+
+
+def plot_mut_distance_scatter(df, benchmark_name, labels=False, density=False, bins=200):
     """
     Create scatter plots of mutation distances arranged in 2 rows with 3 plots per row.
     Includes a y=x reference line instead of a regression line.
+    With density=True, each plot is a bins x bins 2D histogram on a log color scale instead,
+    so rendering time and file size do not depend on the number of mutations.
 
     Parameters:
     df (pandas.DataFrame): DataFrame containing mutation data with columns:
@@ -19,6 +39,9 @@ def plot_mut_distance_scatter(df, benchmark_name, labels=False):
         - algorithm
         - benchmark_name
     benchmark_name (str): Name of the benchmark to plot
+    labels (bool): Whether to add the annotations explaining the plot
+    density (bool): Whether to draw binned densities instead of individual points
+    bins (int): Number of bins per axis in density mode
 
     Returns:
     matplotlib.figure.Figure: The generated plot
@@ -52,14 +75,23 @@ def plot_mut_distance_scatter(df, benchmark_name, labels=False):
             ax = axes[i]
             algo_data = plot_data[plot_data['algorithm'] == algo]
             
-            # Plain scatter plot instead of regplot
-            ax.scatter(
-                algo_data['mutation_bytes'],
-                algo_data['mutation_string'],
-                s=1, 
-                alpha=0.5, 
-                color=color
-            )
+            if density:
+                counts = mutation_distance_histogram(algo_data['mutation_bytes'], algo_data['mutation_string'], bins)
+                cmap = mcolors.LinearSegmentedColormap.from_list(f'{algo}-density', ['#f7f7f7', color])
+                # Empty bins stay transparent; counts are shown on a log scale
+                image = ax.imshow(np.ma.masked_equal(counts.T, 0), origin='lower', extent=(0, 1, 0, 1),
+                                  aspect='auto', interpolation='nearest', cmap=cmap,
+                                  norm=mcolors.LogNorm(vmin=1, vmax=max(counts.max(), 1)))
+                fig.colorbar(image, ax=ax, pad=0.02).ax.tick_params(labelsize=12)
+            else:
+                # Plain scatter plot instead of regplot
+                ax.scatter(
+                    algo_data['mutation_bytes'],
+                    algo_data['mutation_string'],
+                    s=1, 
+                    alpha=0.5, 
+                    color=color
+                )
             
             # Add y=x line (slope=1, intercept=0)
             x_vals = np.array([0, 1])  # Create x values for the line
@@ -222,47 +254,127 @@ def plot_mutation_dist_heatmap(df, havoc_only=False, figsize=(12, 8), cmap='OrRd
     return fig
 
 
-def create_zero_mutation_plot(df):
-    # Set the style to match the example
-    sns.set_style("whitegrid")
+RATE_ALGORITHMS = ["Random", "Zest-Mini", "Zest", "EI", "BeDivFuzz", "Zeugma"]
+# Bump when the columns of the rate table change, so cached tables are rebuilt
+RATE_TABLE_VERSION = 1
 
-    # Filter to include only rows where parent_result == 'SUCCESS'
-    filtered_df = df[df['parent_result'] == 'SUCCESS']
 
-    # Calculate the percentage of zero mutations for each benchmark and algorithm
-    zero_rates = []
-    for benchmark in filtered_df['benchmark_name'].unique():
-        benchmark_df = filtered_df[filtered_df['benchmark_name'] == benchmark]
+def build_mutation_rate_table(df, path=None):
+    """
+    Compute every per (benchmark, algorithm) rate used by the mutation bar charts in one groupby:
+    - total_rows, zero_rows, zero_rate: mutations of valid parents, and how many have a string distance of 0
+    - nonzero_rows, success_rows, success_rate: mutations of valid parents with a non-zero string
+      distance, and how many of them produce a valid input
+    - all_success_rows, all_success_rate: the same, including zero-distance mutations
+    - median_all, median_saved, ratio: median string distance (in %) of all and of saved mutations
+    Rows are ordered by first appearance of the benchmark and then of the algorithm;
+    first_valid_row and first_nonzero_row are the positions in df of the first mutation of a valid parent
+    of the pair, and of the first such mutation with a non-zero string distance.
+    If path is given, the table is also written there as CSV.
+    """
+    parent_success = df['parent_result'] == 'SUCCESS'
+    zero = df['mutation_string'] == 0
+    success = df['result'] == 'SUCCESS'
+    mutation_string = df['mutation_string'] * 100
+    if 'saved' in df.columns:
+        saved_string = mutation_string.where(df['saved'] == True)
+    else:
+        saved_string = pd.Series(np.nan, index=df.index)
+    columns = pd.DataFrame({
+        'benchmark_name': df['benchmark_name'],
+        'algorithm': df['algorithm'],
+        'parent_success': parent_success,
+        'zero': parent_success & zero,
+        'nonzero': parent_success & ~zero,
+        'nonzero_success': parent_success & ~zero & success,
+        'all_success': parent_success & success,
+        'mutation_string': mutation_string,
+        'saved_string': saved_string,
+        'valid_row': pd.Series(np.arange(len(df)), index=df.index).where(parent_success),
+        'nonzero_row': pd.Series(np.arange(len(df)), index=df.index).where(parent_success & ~zero),
+    })
+    rates = columns.groupby(['benchmark_name', 'algorithm'], sort=False).agg(
+        total_rows=('parent_success', 'sum'),
+        zero_rows=('zero', 'sum'),
+        nonzero_rows=('nonzero', 'sum'),
+        success_rows=('nonzero_success', 'sum'),
+        all_success_rows=('all_success', 'sum'),
+        median_all=('mutation_string', 'median'),
+        median_saved=('saved_string', 'median'),
+        first_valid_row=('valid_row', 'min'),
+        first_nonzero_row=('nonzero_row', 'min'),
+    ).reset_index()
+
+    benchmark_order = {b: i for i, b in enumerate(rates['benchmark_name'].unique())}
+    rates = rates.sort_values('benchmark_name', key=lambda s: s.map(benchmark_order),
+                              kind='stable').reset_index(drop=True)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates['zero_rate'] = np.where(rates['total_rows'] > 0,
+                                      rates['zero_rows'] / rates['total_rows'] * 100, 0)
+        rates['success_rate'] = np.where(rates['nonzero_rows'] > 0,
+                                         rates['success_rows'] / rates['nonzero_rows'] * 100, 0)
+        rates['all_success_rate'] = np.where(rates['total_rows'] > 0,
+                                             rates['all_success_rows'] / rates['total_rows'] * 100, 0)
+        rates['ratio'] = np.where(rates['median_all'] > 0,
+                                  rates['median_saved'] / rates['median_all'], np.nan)
+
+    if path:
+        rates.to_csv(path, index=False)
+    return rates
+
+
+def load_mutation_rate_table(df, cache_dir):
+    """
+    Read the rate table of df from cache_dir, or build it and save it there.
+    Tables are keyed by a content hash of the columns they are built from, so a differently filtered
+    df gets its own table. cache_dir should not be tracked; delete it to drop old tables.
+    """
+    columns = [c for c in ['benchmark_name', 'algorithm', 'parent_result', 'result', 'mutation_string', 'saved']
+               if c in df.columns]
+    digest = hashlib.sha1(f'{RATE_TABLE_VERSION}:{columns}'.encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df[columns], index=False).to_numpy().tobytes())
+    path = os.path.join(cache_dir, f'mutation_rates-{digest.hexdigest()}.csv')
+    if os.path.exists(path):
+        return pd.read_csv(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    return build_mutation_rate_table(df, path)
+
+
+def order_by_first_row(table, column):
+    """
+    Rows of table with benchmarks in order of their first row in column, then in that order within each
+    benchmark, like the nested loops over a filtered df did. column is dropped.
+    """
+    benchmark_first = table.groupby('benchmark_name')[column].transform('min')
+    return table.assign(benchmark_first=benchmark_first) \
+        .sort_values(['benchmark_first', column], kind='stable') \
+        .drop(columns=['benchmark_first', column]).reset_index(drop=True)
 
-        for algorithm in benchmark_df['algorithm'].unique():
-            algo_df = benchmark_df[benchmark_df['algorithm'] == algorithm]
 
-            # Calculate zero mutation rate
-            total_rows = len(algo_df)
-            zero_rows = len(algo_df[algo_df['mutation_string'] == 0])
+def grouped_rate_values(rates, algorithm, benchmarks, column, fill=0):
+    """Values of column for algorithm, one per benchmark (fill where the pair has no row)."""
+    values = rates[rates['algorithm'] == algorithm].set_index('benchmark_name')[column]
+    return values.reindex(benchmarks, fill_value=fill).tolist()
 
-            if total_rows > 0:
-                zero_rate = zero_rows / total_rows * 100
-            else:
-                zero_rate = 0
 
-            zero_rates.append({
-                'benchmark_name': benchmark,
-                'algorithm': algorithm,
-                'zero_rate': zero_rate,
-                'total_rows': total_rows,
-                'zero_rows': zero_rows
-            })
+def create_zero_mutation_plot(df, rates=None):
+    # Set the style to match the example
+    sns.set_style("whitegrid")
 
-    # Convert to DataFrame
-    zero_df = pd.DataFrame(zero_rates)
+    # Zero mutation rate of each benchmark and algorithm, over mutations of valid parents
+    if rates is None:
+        rates = build_mutation_rate_table(df)
+    zero_df = rates.loc[rates['total_rows'] > 0,
+                        ['benchmark_name', 'algorithm', 'zero_rate', 'total_rows', 'zero_rows', 'first_valid_row']]
+    zero_df = order_by_first_row(zero_df, 'first_valid_row')
 
     # Create the plot
     fig, ax = plt.subplots(figsize=(14, 6))
 
     # Get unique benchmarks and use the specified algorithm order
     benchmarks = zero_df['benchmark_name'].unique()
-    algorithms = ["Random", "Zest-Mini", "Zest", "EI", "BeDivFuzz", "Zeugma"]
+    algorithms = RATE_ALGORITHMS
 
     # Set up the positions for grouped bars
     x = np.arange(len(benchmarks))
@@ -277,10 +389,7 @@ def create_zero_mutation_plot(df):
     # Plot each algorithm group
     for i, algorithm in enumerate(algorithms):
         if algorithm in zero_df['algorithm'].values:
-            mask = zero_df['algorithm'] == algorithm
-            values = [zero_df[mask & (zero_df['benchmark_name'] == b)]['zero_rate'].values[0]
-                     if any(mask & (zero_df['benchmark_name'] == b)) else 0
-                     for b in benchmarks]
+            values = grouped_rate_values(zero_df, algorithm, benchmarks, 'zero_rate')
 
             bars = ax.bar(x + (i - 2.5) * width, values, width,
                    label=algorithm, color=colors[i])
@@ -304,10 +413,7 @@ def create_zero_mutation_plot(df):
     ax.yaxis.set_tick_params(labelsize=18)
 
     # Add benchmark counts like in the example (ChocoPy (4856), etc.)
-    benchmark_counts = {}
-    for benchmark in benchmarks:
-        count = len(filtered_df[filtered_df['benchmark_name'] == benchmark])
-        benchmark_counts[benchmark] = count
+    benchmark_counts = zero_df.groupby('benchmark_name', sort=False)['total_rows'].sum()
 
     # labels_with_counts = [f"{b}\n({benchmark_counts[b]})" for b in benchmarks]
     # ax.set_xticklabels(labels_with_counts)
@@ -323,7 +429,7 @@ def create_zero_mutation_plot(df):
     return plt, zero_df
 
 
-def create_saved_all_ratio_plot(df, output_filename=None):
+def create_saved_all_ratio_plot(df, output_filename=None, rates=None):
     """
     Generate a bar plot comparing the ratio of Saved/All mutation distances
     for each technique and benchmark.
@@ -331,6 +437,7 @@ def create_saved_all_ratio_plot(df, output_filename=None):
     Parameters:
     df (pandas.DataFrame): DataFrame containing mutation data with 'saved' column
     output_filename (str, optional): If provided, save the plot to this filename
+    rates (pandas.DataFrame, optional): Table from build_mutation_rate_table, computed from df if not given
     
     Returns:
     matplotlib.pyplot: The plot object
@@ -339,53 +446,17 @@ def create_saved_all_ratio_plot(df, output_filename=None):
     # Set the style to match the example
     sns.set_style("whitegrid")
     
-    # Create a copy of the dataframe to avoid modifying the original
-    plot_df = df.copy()
-    
-    # Multiply mutation_string values by 100 to convert to percentages
-    plot_df['mutation_string'] = plot_df['mutation_string'] * 100
+    if rates is None:
+        rates = build_mutation_rate_table(df)
     
     # List of algorithms and benchmarks
-    algorithms = ['Random', 'Zest-Mini', 'Zest', 'EI', 'BeDivFuzz', 'Zeugma']
-    benchmarks = sorted(plot_df['benchmark_name'].unique())
-    
-    # Create a list to store the ratio data
-    ratio_data = []
-    
-    # Calculate ratio values for each combination
-    for benchmark in benchmarks:
-        for algorithm in algorithms:
-            # Filter for current algorithm and benchmark
-            algo_bench_data = plot_df[(plot_df['algorithm'] == algorithm) & 
-                                     (plot_df['benchmark_name'] == benchmark)]
-            
-            if algo_bench_data.empty:
-                continue
-                
-            # Calculate median for all data
-            median_all = algo_bench_data['mutation_string'].median()
-            
-            # Get saved data (where saved column is True)
-            saved_data = algo_bench_data[algo_bench_data['saved'] == True]
-            median_saved = saved_data['mutation_string'].median() if not saved_data.empty else np.nan
-            
-            # Calculate ratio (avoid division by zero)
-            if median_all > 0 and not np.isnan(median_saved):
-                ratio = median_saved / median_all
-            else:
-                ratio = np.nan
-            
-            # Store the results
-            ratio_data.append({
-                'benchmark_name': benchmark,
-                'algorithm': algorithm,
-                'median_all': median_all,
-                'median_saved': median_saved,
-                'ratio': ratio
-            })
-    
-    # Convert to DataFrame
-    ratio_df = pd.DataFrame(ratio_data)
+    algorithms = RATE_ALGORITHMS
+    benchmarks = sorted(rates['benchmark_name'].unique())
+    
+    # Median string distances (in %) of all and of saved mutations, and their ratio
+    ratio_df = rates.loc[rates['algorithm'].isin(algorithms),
+                         ['benchmark_name', 'algorithm', 'median_all', 'median_saved', 'ratio']]
+    ratio_df = ratio_df.sort_values('benchmark_name', kind='stable').reset_index(drop=True)
     
     # Create the plot
     fig, ax = plt.subplots(figsize=(14, 6))
@@ -403,10 +474,7 @@ def create_saved_all_ratio_plot(df, output_filename=None):
     # Plot each algorithm group
     for i, algorithm in enumerate(algorithms):
         if algorithm in ratio_df['algorithm'].values:
-            mask = ratio_df['algorithm'] == algorithm
-            values = [ratio_df[mask & (ratio_df['benchmark_name'] == b)]['ratio'].values[0]
-                     if any(mask & (ratio_df['benchmark_name'] == b)) else np.nan
-                     for b in benchmarks]
+            values = grouped_rate_values(ratio_df, algorithm, benchmarks, 'ratio', fill=np.nan)
             
             # Replace NaN with 0 for plotting
             plot_values = [0 if np.isnan(v) else v for v in values]
@@ -465,51 +533,32 @@ def create_saved_all_ratio_plot(df, output_filename=None):
     if output_filename:
         plt.savefig(output_filename, bbox_inches='tight')
     
-def create_success_rate_chart(df, filter_zero=True):
+def create_success_rate_chart(df, filter_zero=True, rates=None):
     # Set the style to match the example
     sns.set_style("whitegrid")
 
-    # Filter to include only rows where parent_result == 'SUCCESS'
-    filtered_df = df[df['parent_result'] == 'SUCCESS']
-
+    # Success rate of each benchmark and algorithm, over mutations of valid parents
+    # (with a non-zero string distance if filter_zero)
+    if rates is None:
+        rates = build_mutation_rate_table(df)
     if filter_zero:
-        filtered_df = filtered_df[filtered_df["mutation_string"] != 0]
-
-    # Calculate the success rate for each benchmark and algorithm
-    success_rates = []
-    for benchmark in filtered_df['benchmark_name'].unique():
-        benchmark_df = filtered_df[filtered_df['benchmark_name'] == benchmark]
-
-        for algorithm in benchmark_df['algorithm'].unique():
-            algo_df = benchmark_df[benchmark_df['algorithm'] == algorithm]
-
-            # Calculate success rate
-            total_rows = len(algo_df)
-            success_rows = len(algo_df[algo_df['result'] == 'SUCCESS'])
-
-            if total_rows > 0:
-                success_rate = success_rows / total_rows * 100
-            else:
-                success_rate = 0
-
-            success_rates.append({
-                'benchmark_name': benchmark,
-                'algorithm': algorithm,
-                'success_rate': success_rate,
-                'total_rows': total_rows,
-                'success_rows': success_rows
-            })
-
-    # Convert to DataFrame
-    success_df = pd.DataFrame(success_rates)
+        success_df = rates[['benchmark_name', 'algorithm', 'success_rate', 'nonzero_rows', 'success_rows',
+                            'first_nonzero_row']]
+        success_df = success_df.rename(columns={'nonzero_rows': 'total_rows', 'first_nonzero_row': 'first_row'})
+    else:
+        success_df = rates[['benchmark_name', 'algorithm', 'all_success_rate', 'total_rows', 'all_success_rows',
+                            'first_valid_row']]
+        success_df = success_df.rename(columns={'all_success_rate': 'success_rate',
+                                                'all_success_rows': 'success_rows', 'first_valid_row': 'first_row'})
+    success_df = order_by_first_row(success_df[success_df['total_rows'] > 0], 'first_row')
 
     # Create the plot
     fig, ax = plt.subplots(figsize=(14, 6))
 
     # Get unique benchmarks and algorithms
     # benchmarks = ['ant', 'maven', 'rhino', 'closure']
-    benchmarks = df['benchmark_name'].unique()
-    algorithms = ["Random", "Zest-Mini", "Zest", "EI", "BeDivFuzz", "Zeugma"]
+    benchmarks = rates['benchmark_name'].unique()
+    algorithms = RATE_ALGORITHMS
 
     # Set up the positions for grouped bars
     x = np.arange(len(benchmarks))
@@ -524,10 +573,7 @@ def create_success_rate_chart(df, filter_zero=True):
     # Plot each algorithm group
     for i, algorithm in enumerate(algorithms):
         if algorithm in success_df['algorithm'].values:
-            mask = success_df['algorithm'] == algorithm
-            values = [success_df[mask & (success_df['benchmark_name'] == b)]['success_rate'].values[0]
-                     if any(mask & (success_df['benchmark_name'] == b)) else 0
-                     for b in benchmarks]
+            values = grouped_rate_values(success_df, algorithm, benchmarks, 'success_rate')
 
             bars = ax.bar(x + (i - 2.5) * width, values, width,
                    label=algorithm, color=colors[i])
@@ -549,12 +595,9 @@ def create_success_rate_chart(df, filter_zero=True):
     ax.set_title('Validity Preserving Mutations of each Technique', fontsize=28)
 
     # Add benchmark counts like in the example (ChocoPy (4856), etc.)
-    benchmark_counts = {}
-    for benchmark in benchmarks:
-        count = len(filtered_df[filtered_df['benchmark_name'] == benchmark])
-        benchmark_counts[benchmark] = count
+    benchmark_counts = success_df.groupby('benchmark_name', sort=False)['total_rows'].sum()
 
-    labels_with_counts = [f"{b}\n({benchmark_counts[b]})" for b in benchmarks]
+    labels_with_counts = [f"{b}\n({benchmark_counts.get(b, 0)})" for b in benchmarks]
     ax.xaxis.set_tick_params(labelsize=18)
     ax.yaxis.set_tick_params(labelsize=18)
 
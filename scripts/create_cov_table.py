@@ -1,30 +1,53 @@
 #!/usr/bin/env python3
 from tabulate import tabulate
+import numpy as np
 import pandas as pd
 import argparse
 import report_util
 from scripts.extract import Campaign
 
-def get_closest_covered_branches_at(time_df, campaign_id, time_to_execution_limit):
-    campaign_time_data = time_df[time_df['campaign_id'] == campaign_id]
-    if len(campaign_time_data) == 0:
-        return 0
-            # Filter to only include times less than or equal to the execution limit
-    valid_times = campaign_time_data[campaign_time_data['time'] <= time_to_execution_limit]
-
-    if len(valid_times) == 0:
-        # If no valid times found (all times are after the limit)
-        return 0
-
-    # Get the maximum time that's still within the limit
-    max_valid_time = valid_times['time'].max()
-
-    # Get the row with that time
-    row_at_max_valid_time = valid_times[valid_times['time'] == max_valid_time]
-
-    # Return the covered branches at that time
-    return row_at_max_valid_time['covered_branches'].iloc[0]
-
+BASELINE_FUZZER = 'Zest'
+COVERAGE_KINDS = ['trial_bound_coverage', 'time_bound_coverage', 'normalized_coverage']
+
+class CoverageTimeIndex:
+    """
+    Coverage time series of all campaigns, sorted once by (campaign_id, time).
+    Answers as-of queries for many (campaign, time) pairs with one searchsorted call.
+    """
+
+    def __init__(self, time_df, value='covered_branches'):
+        codes, self.campaigns = pd.factorize(time_df['campaign_id'])
+        times = pd.to_timedelta(time_df['time']).to_numpy().astype(np.int64)
+        order = np.lexsort((times, codes))
+        self.codes = {campaign: code for code, campaign in enumerate(self.campaigns)}
+        self.min_time = times.min() if len(times) > 0 else 0
+        self.span = (times.max() - self.min_time + 1) if len(times) > 0 else 1
+        if len(self.campaigns) * float(self.span) >= 2 ** 62:
+            raise ValueError('Time range too large to index')
+        # Keys grow with (campaign, time), so one sorted array covers every campaign
+        self.keys = codes[order] * self.span + (times[order] - self.min_time)
+        self.offsets = np.searchsorted(codes[order], np.arange(len(self.campaigns) + 1))
+        self.values = time_df[value].to_numpy()[order]
+
+    def at(self, campaign_ids, times, default=0):
+        """
+        Returns the value of every campaign at the latest time at or before the matching time,
+        or default if the campaign has no data by then or the time is missing (NaT).
+        Ties take the first row of the original frame.
+        """
+        codes = np.array([self.codes.get(campaign, -1) for campaign in campaign_ids], dtype=np.int64)
+        times = pd.to_timedelta(pd.Series(times))
+        known = (codes >= 0) & times.notna().to_numpy()
+        # NaT is int64-min, so drop it before subtracting min_time would overflow it
+        times = np.where(known, times.to_numpy().astype(np.int64), self.min_time) - self.min_time
+        keys = np.maximum(codes, 0) * self.span + np.clip(times, -1, self.span - 1)
+        positions = np.searchsorted(self.keys, keys, side='right') - 1
+        found = known & (positions >= self.offsets[np.maximum(codes, 0)])
+        positions = np.searchsorted(self.keys, self.keys[np.maximum(positions, 0)], side='left') \
+            if len(self.keys) > 0 else positions
+        result = np.full(len(codes), default, dtype=np.result_type(self.values.dtype, type(default)))
+        result[found] = self.values[positions[found]]
+        return result
 
 
 def load_and_process_data(corpus_size, time_file):
@@ -37,20 +60,16 @@ def load_and_process_data(corpus_size, time_file):
 
     corpus_size_df['time_to_execution_limit'] = pd.to_timedelta(corpus_size_df['time_to_execution_limit'], unit='s')
     corpus_size_df['normalized_execution_time'] = pd.to_timedelta(corpus_size_df['normalized_execution_time'], unit='s')
-    rows = []
-
-    for _, row in corpus_size_df.iterrows():
-        campaign_id = row['campaign_id']
-
-        rows.append({
-            'subject': row['subject'],
-            'fuzzer': Campaign.convert_id_to_fuzzer(campaign_id),
-            'campaign_id': campaign_id,
-            'trial_bound_coverage': get_closest_covered_branches_at(time_df, campaign_id, row['time_to_execution_limit']),
-            'time_bound_coverage': get_closest_covered_branches_at(time_df, campaign_id, pd.Timedelta('1 days 00:00:00')),
-            'normalized_coverage': get_closest_covered_branches_at(time_df, campaign_id, row['normalized_execution_time']),
-        })
-    df = pd.DataFrame(rows)
+    index = CoverageTimeIndex(time_df)
+    campaign_ids = corpus_size_df['campaign_id'].to_numpy()
+    df = pd.DataFrame({
+        'subject': corpus_size_df['subject'].to_numpy(),
+        'fuzzer': [Campaign.convert_id_to_fuzzer(campaign_id) for campaign_id in campaign_ids],
+        'campaign_id': campaign_ids,
+        'trial_bound_coverage': index.at(campaign_ids, corpus_size_df['time_to_execution_limit']),
+        'time_bound_coverage': index.at(campaign_ids, [pd.Timedelta('1 days 00:00:00')] * len(campaign_ids)),
+        'normalized_coverage': index.at(campaign_ids, corpus_size_df['normalized_execution_time']),
+    })
     df['fuzzer'] = df['fuzzer'].replace({
         'BeDiv-Struct': 'BeDivFuzz',
         'Zeugma-Link': 'Zeugma'
@@ -59,22 +78,46 @@ def load_and_process_data(corpus_size, time_file):
     return df
 
 def get_aggregated_coverage(df):
+    fuzzers = df['fuzzer'].unique()
+    subjects = df['subject'].unique()
+    sig_level = report_util.compute_sig_level(fuzzers)
+    groups = df.groupby(['fuzzer', 'subject'])[COVERAGE_KINDS]
+    medians = groups.median()
+    samples = {key: group for key, group in groups}
+    empty = df[COVERAGE_KINDS].iloc[:0]
+    significant = {}
+    for subject in subjects:
+        baseline = samples.get((BASELINE_FUZZER, subject), empty)
+        for coverage in COVERAGE_KINDS:
+            p_values = report_util.mann_whitney_against(
+                baseline[coverage].values, [samples.get((fuzzer, subject), empty)[coverage].values for fuzzer in fuzzers])
+            for fuzzer, p_value in zip(fuzzers, p_values):
+                significant[(fuzzer, subject, coverage)] = p_value < sig_level
     aggregated = []
-    for fuzzer in df['fuzzer'].unique():
-        for subject in df['subject'].unique():
-            new_data = {
-                'fuzzer': fuzzer,
-                'subject': subject,
-                'trial_bound_coverage': df[(df['fuzzer'] == fuzzer) & (df['subject'] == subject)]['trial_bound_coverage'].median(),
-                'time_bound_coverage': df[(df['fuzzer'] == fuzzer) & (df['subject'] == subject)]['time_bound_coverage'].median(),
-                'normalized_coverage': df[(df['fuzzer'] == fuzzer) & (df['subject'] == subject)]['normalized_coverage'].median(),
-            }
-            for coverage in ['trial_bound_coverage', 'time_bound_coverage', 'normalized_coverage']:
-                baseline = df[(df['fuzzer'] == 'Zest') & (df['subject'] == subject)][coverage].values
-                values =df[(df['fuzzer'] == fuzzer) & (df['subject'] == subject)][coverage].values
-                sig_level = report_util.compute_sig_level(df['fuzzer'].unique())
-                if (report_util.mann_whitney(baseline, values) < sig_level):
-                    new_data[coverage + "_sig"] = 'color: red;'
+    for fuzzer in fuzzers:
+        for subject in subjects:
+            new_data = {'fuzzer': fuzzer, 'subject': subject}
+            for coverage in COVERAGE_KINDS:
+                new_data[coverage] = medians[coverage].get((fuzzer, subject), np.nan)
+            baseline = samples.get((BASELINE_FUZZER, subject), empty)
+            values = samples.get((fuzzer, subject), empty)
+            for coverage in COVERAGE_KINDS:
+                new_data[coverage + "_sig"] = 'color: red;' if significant[(fuzzer, subject, coverage)] else ''
+                new_data[coverage + "_low"], new_data[coverage + "_high"] = np.nan, np.nan
+                # batch_a12 is not folded like report_util.a12: it is the probability that the fuzzer beats the baseline
+                new_data[coverage + "_a12_unfolded"] = np.nan
+                new_data[coverage + "_a12_unfolded_low"], new_data[coverage + "_a12_unfolded_high"] = np.nan, np.nan
+                if len(values) == 0:
+                    continue
+                rng = report_util.group_rng(fuzzer, subject, coverage)
+                new_data[coverage + "_low"], new_data[coverage + "_high"] = report_util.bootstrap_ci(
+                    [values[coverage].values], report_util.batch_median, rng=rng)
+                if len(baseline) > 0:
+                    new_data[coverage + "_a12_unfolded"] = report_util.batch_a12(
+                        values[coverage].values.astype(float), baseline[coverage].values.astype(float))
+                    new_data[coverage + "_a12_unfolded_low"], new_data[coverage + "_a12_unfolded_high"] = \
+                        report_util.bootstrap_ci([values[coverage].values, baseline[coverage].values],
+                                                 report_util.batch_a12, rng=rng)
             aggregated.append(new_data)
     return pd.DataFrame(aggregated)
 
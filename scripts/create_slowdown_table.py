@@ -1,25 +1,25 @@
-from scipy.stats import gstd
 import pandas as pd
 import numpy as np
-import math
 import re
 
+# Technique shown in the slowdown table -> (technique, baseline) in the trials data
+SLOWDOWN_PAIRS = {
+    'EI': ('ei', 'zest'),
+    'BeDivFuzz': ('bedivfuzz', 'zest'),
+    'Zeugma': ('zeugma', 'zeugma-none'),
+}
+
 def extract_repetition(campaign_id):
     """Extract the repetition number from campaign_id."""
     return int(campaign_id.split('-')[-1])
 
-def geometric_mean(values):
-    """Calculate the geometric mean of a list of values."""
-    if not values:
-        return 0
-    return math.exp(sum(math.log(x) for x in values) / len(values))
-
-def analyze_fuzzer_slowdown(csv_file):
+def analyze_fuzzer_slowdown(csv_file, pairs=SLOWDOWN_PAIRS):
     """
     Analyze fuzzer runtime slowdown from campaign trials data.
 
     Args:
         csv_file: Path to the CSV file with campaign trials data
+        pairs: Mapping from the technique label to its (technique, baseline) columns
 
     Returns:
         DataFrame with geometric mean slowdowns and standard deviations
@@ -38,66 +38,30 @@ def analyze_fuzzer_slowdown(csv_file):
         aggfunc='first'
     )
 
-    # Calculate slowdowns for each benchmark and repetition
-    results = []
+    # Per-repetition slowdown of every technique against its baseline, one column per technique
+    pairs = {label: (technique, baseline) for label, (technique, baseline) in pairs.items()
+             if technique in pivot_df.columns and baseline in pivot_df.columns}
+    log_slowdowns = pd.DataFrame(
+        {label: np.log(pivot_df[technique] / pivot_df[baseline]) for label, (technique, baseline) in pairs.items()},
+        index=pivot_df.index, columns=list(pairs))
 
-    for benchmark, group in pivot_df.groupby(level=0):
-        # For each technique, calculate the slowdown against its baseline
-
-        # EI vs Zest
-        ei_slowdowns = []
-        for rep, row in group.iterrows():
-            if pd.notna(row.get('ei')) and pd.notna(row.get('zest')):
-                slowdown = row['ei'] / row['zest']
-                ei_slowdowns.append(slowdown)
-
-        # BeDivFuzz vs Zest
-        bedivfuzz_slowdowns = []
-        for rep, row in group.iterrows():
-            if pd.notna(row.get('bedivfuzz')) and pd.notna(row.get('zest')):
-                slowdown = row['bedivfuzz'] / row['zest']
-                bedivfuzz_slowdowns.append(slowdown)
-
-        # Zeugma vs zeugma-none
-        zeugma_slowdowns = []
-        for rep, row in group.iterrows():
-            if pd.notna(row.get('zeugma')) and pd.notna(row.get('zeugma-none')):
-                slowdown = row['zeugma'] / row['zeugma-none']
-                zeugma_slowdowns.append(slowdown)
-
-        # Calculate geometric means and standard deviations
-        if ei_slowdowns:
-            ei_geo_mean = geometric_mean(ei_slowdowns)
-            ei_std_dev = gstd(ei_slowdowns)
-            results.append({
-                'benchmark': benchmark,
-                'technique': 'EI',
-                'geo_mean': ei_geo_mean,
-                'std_dev': ei_std_dev,
-                'count': len(ei_slowdowns)
-            })
-
-        if bedivfuzz_slowdowns:
-            bedivfuzz_geo_mean = geometric_mean(bedivfuzz_slowdowns)
-            bedivfuzz_std_dev = gstd(bedivfuzz_slowdowns)
-            results.append({
-                'benchmark': benchmark,
-                'technique': 'BeDivFuzz',
-                'geo_mean': bedivfuzz_geo_mean,
-                'std_dev': bedivfuzz_std_dev,
-                'count': len(bedivfuzz_slowdowns)
-            })
-
-        if zeugma_slowdowns:
-            zeugma_geo_mean = geometric_mean(zeugma_slowdowns)
-            zeugma_std_dev = gstd(zeugma_slowdowns)
-            results.append({
-                'benchmark': benchmark,
-                'technique': 'Zeugma',
-                'geo_mean': zeugma_geo_mean,
-                'std_dev': zeugma_std_dev,
-                'count': len(zeugma_slowdowns)
-            })
+    # Geometric means and standard deviations are the exponentials of the log-space mean and std
+    grouped = log_slowdowns.groupby(level=0)
+    counts = grouped.count()
+    geo_means = np.exp(grouped.mean())
+    std_devs = np.exp(grouped.std(ddof=1))
+
+    results = []
+    for benchmark in counts.index:
+        for label in pairs:
+            if counts.loc[benchmark, label] > 0:
+                results.append({
+                    'benchmark': benchmark,
+                    'technique': label,
+                    'geo_mean': geo_means.loc[benchmark, label],
+                    'std_dev': std_devs.loc[benchmark, label],
+                    'count': int(counts.loc[benchmark, label])
+                })
 
     # Convert to DataFrame
     result_df = pd.DataFrame(results)
@@ -106,12 +70,13 @@ def analyze_fuzzer_slowdown(csv_file):
 
     return result_df
 
-def generate_latex_table(result_df):
+def generate_latex_table(result_df, pairs=SLOWDOWN_PAIRS):
     """
     Generate a LaTeX table from the analysis results with color coding.
 
     Args:
         result_df: DataFrame with analysis results
+        pairs: The mapping passed to analyze_fuzzer_slowdown, whose order is the column order
 
     Returns:
         String containing the LaTeX table with color-coded cells
@@ -125,6 +90,9 @@ def generate_latex_table(result_df):
 
     # Sort benchmarks alphabetically
     table_df = table_df.sort_index()
+    # Techniques in the order of the pairs, then any other technique in the results
+    techniques = list(pairs)
+    techniques += [t for t in result_df['technique'].unique() if t not in techniques]
 
     # Add LaTeX package requirements in a comment
     latex_requirements = "% Requires \\usepackage{xcolor} in the preamble"
@@ -136,9 +104,9 @@ def generate_latex_table(result_df):
         "\\centering",
         "\\scriptsize",
         "\\caption{Runtime Slowdown by Benchmark and Technique (compared to baseline)}",
-        "\\begin{tabular}{l|ccc}",
+        "\\begin{tabular}{l|" + "c" * len(techniques) + "}",
         "\\toprule",
-        "\\textbf{Benchmark} & \\textbf{EI} & \\textbf{BeDivFuzz} & \\textbf{Zeugma} \\\\",
+        "\\textbf{Benchmark} & " + " & ".join(f"\\textbf{{{technique}}}" for technique in techniques) + " \\\\",
         "\\midrule"
     ]
 
@@ -159,7 +127,7 @@ def generate_latex_table(result_df):
     for benchmark in table_df.index:
         row = f"{benchmark}"
 
-        for technique in ['EI', 'BeDivFuzz', 'Zeugma']:
+        for technique in techniques:
             if (technique in table_df['geo_mean'].columns and
                 pd.notna(table_df['geo_mean'][technique][benchmark])):
 
@@ -3,8 +3,15 @@
 
 import sys
 import os
+import pathlib
 import subprocess
 
+sys.path.append(os.path.join(pathlib.Path(__file__).resolve().parent.parent, "fuzzers", "JQF-ei", "scripts", "experiments", "ei"))
+from coverage_collector import ReproError, collect_coverage, repro_args, repro_env
+from coverage_matrix import BranchDictionary, format_cov_line
+
+JQF_DIR = "/Users/aoli/repos/JQF-ei"
+
 base = sys.argv[1]
 #  campaigns = {
     #  "zeugma": [242,902,572,407,187,1012,1067,682,517,792,957,462,627,77,297,737,352,132,847,22],
@@ -15,6 +22,7 @@ campaigns = {
     "zeugmax-24": [1,2,3,4,5]
 }
 
+branches = BranchDictionary()
 results = []
 for algo, indices in campaigns.items():
     for  campaign in indices:
@@ -30,29 +38,23 @@ for algo, indices in campaigns.items():
             "-Dmeringue.duration=P1DT0H0M",
             "-Dmeringue.outputDirectory=",
         ])
-        command = " ".join([
-            f"JVM_OPTS=\"-Djqf.repro.logUniqueBranches=true -Djqf.repro.traceDir={path}\"",
-            "./bin/jqf-repro",
-            "-i",
-            "-c",
-            "$(./scripts/examples_classpath.sh)",
-            "edu.berkeley.cs.jqf.examples.closure.CompilerTest",
-            "testWithInputStream",
-            os.path.join(path, "gen")
-        ])
-        subprocess.run(f"{command} 2> /dev/null | grep \"^# Cov\" | sort | uniq > {path}/cov-all.log",
-                       shell=True,
-                       cwd="/Users/aoli/repos/JQF-ei")
-        with open(os.path.join(path, "cov-all.log")) as f:
-            result = set()
-            for line in f:
-                result.add(line)
+        try:
+            result = collect_coverage(
+                repro_args("edu.berkeley.cs.jqf.examples.closure.CompilerTest", "testWithInputStream",
+                           os.path.join(path, "gen"), jqf_dir=JQF_DIR),
+                os.path.join(path, "cov-all.log"),
+                cwd=JQF_DIR,
+                env=repro_env(f"-Djqf.repro.logUniqueBranches=true -Djqf.repro.traceDir={path}"),
+                branches=branches)
+        except ReproError as e:
+            print(e)
+            continue
         results.append(result)
     if not results:
         continue
     total = sum(map(lambda it: len(it), results))
     print(algo, total / len(results))
     with open(os.path.join(base, f'{algo}-intersection.txt'), "w") as f:
-        f.write("".join(sorted(set.intersection(*results))))
+        f.write("".join(sorted(format_cov_line(branches[i]) for i in set.intersection(*results))))
     with open(os.path.join(base, f'{algo}-union.txt'), "w") as f:
-        f.write("".join(sorted(set.union(*results))))
+        f.write("".join(sorted(format_cov_line(branches[i]) for i in set.union(*results))))
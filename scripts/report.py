@@ -1,9 +1,12 @@
+import argparse
 import os
 import pathlib
-import sys
+import string
+from multiprocessing import Pool
 
-import matplotlib.colors as mcolors
+import matplotlib as mpl
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 
 import extract
@@ -99,58 +102,72 @@ def create_pairwise_subsection(frames, name=''):
     return f'<div><h3>{name}Pairwise P-Values and Effect Sizes</h3><div class="wrapper">{content}</div></div>'
 
 
-def plot_coverage(data, subject, cmap=None, output_dir=None):
-    # Define the specific order and colors
-    fuzzers = sorted(data['fuzzer'].unique())
-    plot_fuzzers = [f for f in fuzzers if 'Simple' not in f]
-    plot_fuzzers = [fuzzer_map[f] for f in plot_fuzzers]
-    legend_order = ["Random", "Zest-Mini", "Zest", "EI", "BeDivFuzz", "Zeugma"]
-    colors = ['#4878CF', '#EE854A', '#D65F5F', '#59A14F', '#B279A2', '#BAB0AC']
-
-    # Define different line styles for grayscale distinction
-    line_styles = ['-.', (0, (3, 1, 1, 1)), ":", '--', (0, (5, 1)), '-']
-
-    # Create custom color map
-    custom_cmap = {k: v for k, v in zip(legend_order, colors)}
-
-    cmap = custom_cmap
-    lmap = {k: v for k, v in zip(legend_order, line_styles)}
-
-
-    data = report_util.select(data, subject=subject)
-    plt.rcParams["font.family"] = 'sans-serif'
-    fig, ax = plt.subplots(figsize=(8, 4))
-
-    stats = data.groupby(by=['time', 'fuzzer'])['covered_branches'] \
-        .agg([min, max, 'median']) \
-        .reset_index() \
-        .sort_values('time')
-
-    # Only include fuzzers that are in our legend order
-
-    # Plot each fuzzer with its specific color and line style
-    for i, fuzzer in enumerate(plot_fuzzers):
-        color = cmap[fuzzer]
-        linestyle = lmap[fuzzer]
-
-        selected = stats[stats['fuzzer'] == fuzzer]
-        times = (selected['time'] / pd.to_timedelta(1, 'm')).tolist()
+LEGEND_ORDER = ["Random", "Zest-Mini", "Zest", "EI", "BeDivFuzz", "Zeugma"]
+COLORS = ['#4878CF', '#EE854A', '#D65F5F', '#59A14F', '#B279A2', '#BAB0AC']
+# Define different line styles for grayscale distinction
+LINE_STYLES = ['-.', (0, (3, 1, 1, 1)), ":", '--', (0, (5, 1)), '-']
 
-        ax.plot(times, selected['median'], color=color, linestyle=linestyle,
-                label=fuzzer, linewidth=2)
-        ax.fill_between(times, selected['min'], selected['max'], color=color, alpha=0.2)
 
-    # Add legend with custom order
-    handles, labels = ax.get_legend_handles_labels()
-    by_label = dict(zip(labels, handles))
-    ordered_labels = [label for label in legend_order if label in labels]
+def get_plot_fuzzers(data):
+    fuzzers = sorted(data['fuzzer'].unique())
+    plot_fuzzers = [f for f in fuzzers if 'Simple' not in f]
+    return [fuzzer_map[f] for f in plot_fuzzers]
+
+
+def compute_coverage_bands(data):
+    # Min, max and median coverage of every (subject, fuzzer, time), shared by all subject plots
+    return data.groupby(by=['subject', 'fuzzer', 'time'])['covered_branches'] \
+        .agg(['min', 'max', 'median']) \
+        .sort_index()
+
+
+def downsample_bands(bands, max_points, times=()):
+    """
+    Downsamples the band series of every (subject, fuzzer) to about max_points times with LTTB,
+    keeping the points selected for the median, min and max series and every time in times.
+    """
+    frames = []
+    for _, group in bands.groupby(level=['subject', 'fuzzer'], sort=False):
+        group_times = group.index.get_level_values('time')
+        x = group_times / pd.to_timedelta(1, 'm')
+        keep = np.nonzero(group_times.isin(times))[0]
+        selected = np.unique(np.concatenate(
+            [report_util.lttb(x, group[column], max_points, keep) for column in ['median', 'min', 'max']]))
+        frames.append(group.iloc[selected])
+    return pd.concat(frames) if frames else bands
+
+
+def bands_to_json_html(subject, bands, plot_fuzzers):
+    lmap = {k: v for k, v in zip(LEGEND_ORDER, LINE_STYLES)}
+    cmap = {k: v for k, v in zip(LEGEND_ORDER, COLORS)}
+    series = []
+    for fuzzer in plot_fuzzers:
+        try:
+            selected = bands.loc[(subject, fuzzer)].reset_index()
+        except KeyError:
+            selected = bands.iloc[:0].reset_index()
+        series.append({
+            'label': fuzzer,
+            'color': cmap[fuzzer],
+            'dash': report_util.dash_array(lmap[fuzzer]),
+            'x': (selected['time'] / pd.to_timedelta(1, 'm')).round(3).tolist(),
+            'median': selected['median'].tolist(),
+            'min': selected['min'].tolist(),
+            'max': selected['max'].tolist(),
+        })
+    return report_util.json_plot_html(subject.title(), series, xlabel='Time (Minutes)', ylabel='Covered Branches')
+
+
+def save_legend(plot_fuzzers, output_dir):
+    cmap = {k: v for k, v in zip(LEGEND_ORDER, COLORS)}
+    lmap = {k: v for k, v in zip(LEGEND_ORDER, LINE_STYLES)}
     # Save just the legend as a separate file
     # Create a new figure for the legend
     figlegend = plt.figure(figsize=(6, 6))
 
     # Create a list of artists and labels for the legend
     legend_handles = []
-    for i, label in enumerate(legend_order):
+    for i, label in enumerate(LEGEND_ORDER):
         if label in plot_fuzzers:
             color = cmap[label]
             linestyle = lmap[label]
@@ -169,6 +186,44 @@ def plot_coverage(data, subject, cmap=None, output_dir=None):
     figlegend.savefig(os.path.join(output_dir, 'legend.pdf'), bbox_inches='tight')
     plt.close(figlegend)
 
+
+def plot_coverage(data, subject, cmap=None, output_dir=None, bands=None, plot_fuzzers=None):
+    # Define the specific order and colors
+    if plot_fuzzers is None:
+        plot_fuzzers = get_plot_fuzzers(data)
+    if bands is None:
+        bands = compute_coverage_bands(data)
+
+    # Create custom color map
+    custom_cmap = {k: v for k, v in zip(LEGEND_ORDER, COLORS)}
+
+    cmap = custom_cmap
+    lmap = {k: v for k, v in zip(LEGEND_ORDER, LINE_STYLES)}
+
+
+    plt.rcParams["font.family"] = 'sans-serif'
+    fig, ax = plt.subplots(figsize=(8, 4))
+
+    # Only include fuzzers that are in our legend order
+
+    # Plot each fuzzer with its specific color and line style
+    for i, fuzzer in enumerate(plot_fuzzers):
+        color = cmap[fuzzer]
+        linestyle = lmap[fuzzer]
+
+        try:
+            selected = bands.loc[(subject, fuzzer)].reset_index()
+        except KeyError:
+            selected = bands.iloc[:0].reset_index()
+        times = (selected['time'] / pd.to_timedelta(1, 'm')).tolist()
+
+        ax.plot(times, selected['median'], color=color, linestyle=linestyle,
+                label=fuzzer, linewidth=2)
+        ax.fill_between(times, selected['min'], selected['max'], color=color, alpha=0.2)
+
+    if output_dir is not None:
+        save_legend(plot_fuzzers, output_dir)
+
     ax.set_xlabel('Time (Minutes)', fontsize=18)
     ax.set_ylabel('Covered Branches', fontsize=18)
     ax.xaxis.get_major_locator().set_params(integer=True)
@@ -182,27 +237,54 @@ def plot_coverage(data, subject, cmap=None, output_dir=None):
 
     return fig
 
-def create_plots_subsection(data, output_dir):
+
+def render_coverage_plot(args):
+    subject, bands, plot_fuzzers, cov_output_dir, html_format = args
+    # Workers render headless, independent of the backend of the parent process
+    mpl.use('Agg')
+    fig = plot_coverage(None, subject, bands=bands, plot_fuzzers=plot_fuzzers)
+    # Save the figure to a file in scripts/figs/cov/
+    fig_file = os.path.join(cov_output_dir, f"{subject.title()}.pdf")
+    fig.savefig(fig_file, bbox_inches='tight')
+    if html_format == 'json':
+        plt.close(fig)
+        return bands_to_json_html(subject, bands, plot_fuzzers)
+    if html_format is not None:
+        return report_util.fig_to_html(format=html_format)
+    plt.close(fig)
+    return fig_file
+
+
+def create_plots_subsection(data, output_dir, processes=None, max_points=None, times=(), html_format=None):
+    """
+    Renders one coverage plot per subject into output_dir/cov.
+    With max_points, the bands are downsampled with LTTB first, keeping the times checkpoints.
+    With html_format ('png', 'svg' or 'json'), also returns the plots as an HTML subsection.
+    """
     subjects = sorted(data['subject'].unique())
-    fuzzers = sorted(data['fuzzer'].unique())
-    fuzzers = [fuzzer_map[f] for f in fuzzers]
-    cmap = {k[0]: k[1] for k in zip(fuzzers, [k for k in mcolors.TABLEAU_COLORS])}
-    content = ''
     cov_output_dir = os.path.join(output_dir, 'cov')
     if not os.path.exists(cov_output_dir):
         os.makedirs(cov_output_dir)
-    for subject in subjects:
-        plot_coverage(data, subject, cmap, cov_output_dir)
-        # Save the figure to a file in scripts/figs/cov/
-        fig_file = os.path.join(cov_output_dir, f"{subject.title()}.pdf")
-        plt.savefig(fig_file, bbox_inches='tight')
+    plot_fuzzers = get_plot_fuzzers(data)
+    bands = compute_coverage_bands(data)
+    if max_points is not None:
+        bands = downsample_bands(bands, max_points, times)
+    save_legend(plot_fuzzers, cov_output_dir)
+    tasks = [(subject, bands.loc[[subject]], plot_fuzzers, cov_output_dir, html_format) for subject in subjects]
+    with Pool(processes) as pool:
+        plots = pool.map(render_coverage_plot, tasks)
+    if html_format is None:
+        return None
+    script = report_util.JSON_PLOT_SCRIPT if html_format == 'json' else ''
+    return f'<div><h2>Coverage</h2><div class="wrapper">{"".join(plots)}</div>{script}</div>'
 
 
-def create_coverage_content(data, times, output_dir):
-    create_plots_subsection(data, output_dir)
+def create_coverage_content(data, times, output_dir, html_format=None, max_points=None):
+    content = create_plots_subsection(data, output_dir, max_points=max_points, times=times, html_format=html_format)
     cov_table = tables.create_coverage_table(data, times, output_dir)
+    return content
 
-def create_report(input_dir, output_dir):
+def create_report(input_dir, output_dir, html_format=None, max_points=None):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     times = [pd.to_timedelta(5, 'm'), pd.to_timedelta(24, 'h')]
@@ -213,10 +295,23 @@ def create_report(input_dir, output_dir):
         "BeDiv-Struct": "BeDivFuzz",
         "Zeugma-Link": "Zeugma",
     })
-    create_coverage_content(coverage, times, output_dir)
+    content = create_coverage_content(coverage, times, output_dir, html_format, max_points)
+    if html_format is not None:
+        file = os.path.join(output_dir, 'report.html')
+        with open(file, 'w') as f:
+            f.write(string.Template(TEMPLATE).substitute(content=content))
+        print(f'Wrote report to {file}.')
 
 def main():
-    create_report(sys.argv[1], sys.argv[2])
+    parser = argparse.ArgumentParser(description='Create coverage plots and tables from extracted data.')
+    parser.add_argument('input_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--html', choices=['png', 'svg', 'json'], default=None,
+                        help='also write report.html with plots embedded in this format')
+    parser.add_argument('--max-points', type=int, default=None,
+                        help='downsample each coverage series to about this many points with LTTB')
+    args = parser.parse_args()
+    create_report(args.input_dir, args.output_dir, args.html, args.max_points)
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,11 @@
+import atexit
 import base64
+import hashlib
+import html
+import json
 from io import BytesIO
 import os
+import pathlib
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
@@ -11,6 +16,97 @@ from matplotlib.backends.backend_pgf import PdfPages
 
 A12_BOUNDS = [0.56, 0.64, 0.71]
 ODDS_RATIO_BOUNDS = [1.25, 1.5, 2.0]
+BOOTSTRAP_RESAMPLES = 10000
+BOOTSTRAP_SEED = 0
+CONFIDENCE_LEVEL = 0.95
+# Set to an empty string to keep the statistics cache in memory only
+STATS_CACHE_FILE = os.environ.get('STATS_CACHE_FILE',
+                                  os.path.join(pathlib.Path(__file__).parent.parent, 'data', 'stats_cache.json'))
+# Bump when a cached test changes its implementation or result layout, so stale entries are not reused
+STATS_CACHE_VERSION = 1
+# The least recently used entries beyond this many are dropped when the cache is saved
+STATS_CACHE_MAX_ENTRIES = int(os.environ.get('STATS_CACHE_MAX_ENTRIES', 200000))
+
+
+def to_builtin(value):
+    if isinstance(value, (tuple, list, np.ndarray)):
+        return [to_builtin(v) for v in value]
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    return float(value)
+
+
+class StatsCache:
+    """
+    Results of statistical tests keyed by a content hash of the test name, its parameters and its samples.
+    Samples with equal values give equal keys, so only groups whose data changed are recomputed.
+    Keys also include STATS_CACHE_VERSION and the scipy version, so results of other implementations are not reused.
+    Entries are persisted as JSON at exit, keeping the max_entries most recently used ones; entries of old versions
+    age out that way. Delete the file to clear the cache.
+    """
+
+    def __init__(self, path, max_entries=STATS_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = {}
+        self.dirty = False
+        if path and os.path.isfile(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(name, samples, params):
+        digest = hashlib.sha1(f'{STATS_CACHE_VERSION}:{scipy.__version__}:{name}'.encode('utf-8'))
+        digest.update(repr(sorted(params.items())).encode('utf-8'))
+        for sample in samples:
+            sample = np.ascontiguousarray(sample)
+            digest.update(f'{sample.dtype.str}{sample.shape}'.encode('utf-8'))
+            digest.update(sample.tobytes())
+        return digest.hexdigest()
+
+    def compute(self, name, function, samples, **params):
+        """Returns function(*samples, **params), converted to JSON-compatible builtins, computing it at most once."""
+        key = StatsCache.key(name, samples, params)
+        # Entries are kept in order of last use
+        value = self.entries.pop(key, None)
+        if value is None:
+            value = to_builtin(function(*samples, **params))
+            self.dirty = True
+        self.entries[key] = value
+        return value
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        # Keep entries saved by other processes in the meantime, behind the ones used here
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                saved = json.load(f)
+            for key in self.entries:
+                saved.pop(key, None)
+            self.entries = {**saved, **self.entries}
+        if len(self.entries) > self.max_entries:
+            self.entries = dict(list(self.entries.items())[len(self.entries) - self.max_entries:])
+        temp = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(temp, self.path)
+        self.dirty = False
+
+
+_stats_cache = None
+
+
+def get_stats_cache():
+    global _stats_cache
+    if _stats_cache is None:
+        _stats_cache = StatsCache(STATS_CACHE_FILE)
+        atexit.register(_stats_cache.save)
+    return _stats_cache
+
+
+def as_sample(values, dtype=float):
+    return np.asarray(values, dtype=dtype)
 
 
 def a12(values1, values2):
@@ -26,13 +122,19 @@ def a12(values1, values2):
 
 
 def mann_whitney(values1, values2):
-    return scipy.stats.mannwhitneyu(values1, values2, alternative='two-sided', use_continuity=True)[1]
+    return get_stats_cache().compute(
+        'mann_whitney',
+        lambda v1, v2: scipy.stats.mannwhitneyu(v1, v2, alternative='two-sided', use_continuity=True)[1],
+        [as_sample(values1), as_sample(values2)])
 
 
 def fisher_exact(truth_values1, truth_values2):
     table = [[truth_values1.sum(), truth_values2.sum()],
              [(~truth_values1).sum(), (~truth_values2).sum()]]
-    return scipy.stats.fisher_exact(table, alternative='two-sided')[1]
+    return get_stats_cache().compute(
+        'fisher_exact',
+        lambda t: scipy.stats.fisher_exact(t, alternative='two-sided')[1],
+        [as_sample(table, dtype=np.int64)])
 
 
 def odds_ratio(truth_values1, truth_values2):
@@ -53,6 +155,80 @@ def odds_ratio(truth_values1, truth_values2):
     return odds0 / odds1 if odds0 > odds1 else odds1 / odds0
 
 
+def batch_median(values):
+    return np.median(values, axis=-1)
+
+
+def batch_mean(values):
+    return np.mean(values, axis=-1)
+
+
+def batch_a12(values1, values2):
+    """
+    Returns the (unfolded) Vargha-Delaney A12 statistic of every row of values1 against the same row of values2,
+    i.e., the probability that a value of values1 is larger than a value of values2, counting ties as one half.
+    """
+    greater = (values1[..., :, np.newaxis] > values2[..., np.newaxis, :]).mean(axis=(-2, -1))
+    equal = (values1[..., :, np.newaxis] == values2[..., np.newaxis, :]).mean(axis=(-2, -1))
+    return greater + 0.5 * equal
+
+
+def jackknife(samples, statistic):
+    """Returns the leave-one-out values of a batched statistic, leaving out each element of each sample in turn."""
+    values = []
+    for i, sample in enumerate(samples):
+        n = len(sample)
+        leave_one_out = ~np.eye(n, dtype=bool)
+        batch = [np.broadcast_to(s, (n, len(s))) for s in samples]
+        batch[i] = np.broadcast_to(sample, (n, n))[leave_one_out].reshape(n, n - 1)
+        values.append(statistic(*batch))
+    return np.concatenate(values)
+
+
+def group_rng(*key):
+    """
+    Returns a bootstrap generator seeded from BOOTSTRAP_SEED and the key of a group (e.g. its fuzzer, subject and
+    column), so the resamples of a group do not depend on which other groups were bootstrapped before it.
+    """
+    digest = hashlib.sha1('\0'.join(str(k) for k in key).encode('utf-8')).digest()
+    return np.random.default_rng([BOOTSTRAP_SEED, int.from_bytes(digest[:8], 'little')])
+
+
+def bootstrap_ci(samples, statistic, method='percentile', resamples=BOOTSTRAP_RESAMPLES,
+                 confidence_level=CONFIDENCE_LEVEL, rng=None):
+    """
+    Returns the (low, high) bootstrap confidence interval of a statistic of one or more samples.
+    The statistic must be batched: it is called once with one (resamples, n) array per sample, where every
+    sample is resampled with its own index matrix, and must return one value per row.
+    Method is either 'percentile' or 'BCa' (bias-corrected and accelerated).
+    """
+    rng = rng if rng is not None else np.random.default_rng(BOOTSTRAP_SEED)
+    samples = [np.asarray(sample, dtype=float) for sample in samples]
+    if any(len(sample) == 0 for sample in samples):
+        return np.nan, np.nan
+    batch = [sample[rng.integers(0, len(sample), size=(resamples, len(sample)))] for sample in samples]
+    distribution = statistic(*batch)
+    alpha = (1 - confidence_level) / 2
+    quantiles = np.array([alpha, 1 - alpha])
+    if method == 'BCa' and all(len(sample) > 1 for sample in samples):
+        observed = statistic(*[sample[np.newaxis, :] for sample in samples])[0]
+        # Ties with the observed value count as one half, which matters for discrete statistics like the median
+        z0 = scipy.stats.norm.ppf(((distribution < observed).mean() + (distribution <= observed).mean()) / 2)
+        theta = jackknife(samples, statistic)
+        deviations = theta.mean() - theta
+        with np.errstate(divide='ignore', invalid='ignore'):
+            acceleration = (deviations ** 3).sum() / (6 * ((deviations ** 2).sum()) ** 1.5)
+            z = scipy.stats.norm.ppf(quantiles)
+            adjusted = scipy.stats.norm.cdf(z0 + (z0 + z) / (1 - acceleration * (z0 + z)))
+        # Degenerate distributions (e.g. all values equal) fall back to percentile intervals
+        if np.all(np.isfinite(adjusted)):
+            quantiles = adjusted
+    elif method not in ['percentile', 'BCa']:
+        raise ValueError(method)
+    low, high = np.quantile(distribution, quantiles)
+    return low, high
+
+
 def compute_bucket(value, bounds):
     for i, bound in enumerate(bounds):
         if value < bound:
@@ -67,26 +243,149 @@ def to_props(text_colors, background_colors):
     return pd.DataFrame(props)
 
 
+def mann_whitney_sorted(values1, values2):
+    """
+    Returns the Mann-Whitney U statistic and the two-sided p-value for two sorted samples (see
+    compute_mann_whitney_sorted), cached by the content of the samples.
+    """
+    return tuple(get_stats_cache().compute('mann_whitney_sorted', compute_mann_whitney_sorted,
+                                           [as_sample(values1), as_sample(values2)]))
+
+
+def compute_mann_whitney_sorted(values1, values2):
+    """
+    Returns the Mann-Whitney U statistic of values1 against values2 and the two-sided p-value for two sorted
+    samples. U is the number of pairs in which the value from values1 is larger, with ties counted as one half.
+    P-values match scipy.stats.mannwhitneyu(alternative='two-sided', use_continuity=True).
+    """
+    n1, n2 = len(values1), len(values2)
+    if n1 == 0 or n2 == 0:
+        return np.nan, np.nan
+    less = np.searchsorted(values2, values1, side='left')
+    less_equal = np.searchsorted(values2, values1, side='right')
+    u = less.sum() + 0.5 * (less_equal - less).sum()
+    _, ties = np.unique(np.concatenate([values1, values2]), return_counts=True)
+    if (n1 <= 8 or n2 <= 8) and len(ties) == n1 + n2:
+        # Small samples without ties use the exact distribution
+        return u, scipy.stats.mannwhitneyu(values1, values2, alternative='two-sided', use_continuity=True)[1]
+    n = n1 + n2
+    tie_term = (ties ** 3 - ties).sum()
+    s = np.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (max(u, n1 * n2 - u) - n1 * n2 / 2 - 0.5) / s
+    return u, np.clip(2 * scipy.stats.norm.sf(z), 0, 1)
+
+
+def mann_whitney_matrix(samples):
+    """
+    Returns the matrices of Mann-Whitney U statistics and two-sided p-values for every pair of samples,
+    where u[i][j] is the U statistic of samples[i] against samples[j] (see mann_whitney_sorted).
+    Each sample is sorted once and the statistics of a pair are read off with binary searches.
+    """
+    sorted_samples = [np.sort(np.asarray(sample, dtype=float)) for sample in samples]
+    k = len(sorted_samples)
+    u = np.zeros((k, k))
+    p = np.ones((k, k))
+    for i in range(k):
+        for j in range(i + 1, k):
+            u[i, j], p[i, j] = mann_whitney_sorted(sorted_samples[i], sorted_samples[j])
+            u[j, i] = len(sorted_samples[i]) * len(sorted_samples[j]) - u[i, j]
+            p[j, i] = p[i, j]
+    return u, p
+
+
+def mann_whitney_against(baseline, samples):
+    """Returns the two-sided Mann-Whitney U test p-values of every sample against the baseline sample."""
+    baseline = np.sort(np.asarray(baseline, dtype=float))
+    return np.array([mann_whitney_sorted(baseline, np.sort(np.asarray(sample, dtype=float)))[1]
+                     for sample in samples])
+
+
+def a12_matrix(samples, u):
+    """Returns the matrix of Vargha-Delaney A12 statistics (see a12) derived from the U statistics."""
+    sizes = np.array([len(sample) for sample in samples], dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = u / np.outer(sizes, sizes)
+    return np.where(a < 0.5, 1 - a, a)
+
+
+def contingency_tensor(samples):
+    """Returns a (2, k) array with the number of true and false values of every boolean sample."""
+    trues = np.array([np.asarray(sample, dtype=bool).sum() for sample in samples])
+    totals = np.array([len(sample) for sample in samples])
+    return np.stack([trues, totals - trues])
+
+
+def fisher_exact_matrix(counts):
+    """
+    Returns the two-sided Fisher's exact test p-values for every pair of columns of a contingency tensor,
+    i.e., the p-value of fisher_exact for the samples behind columns i and j.
+    """
+    return np.array(get_stats_cache().compute('fisher_exact_matrix', compute_fisher_exact_matrix,
+                                              [as_sample(counts, dtype=np.int64)]))
+
+
+def compute_fisher_exact_matrix(counts):
+    t1, t2 = counts[0][:, np.newaxis], counts[0][np.newaxis, :]
+    f1, f2 = counts[1][:, np.newaxis], counts[1][np.newaxis, :]
+    total = t1 + t2 + f1 + f2
+    trues = t1 + t2
+    column = t1 + f1
+    support = np.arange(total.max() + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pmf = np.nan_to_num(scipy.stats.hypergeom.pmf(support, total[..., np.newaxis], trues[..., np.newaxis],
+                                                      column[..., np.newaxis]))
+        observed = scipy.stats.hypergeom.pmf(t1, total, trues, column)
+    # Same relative tolerance as scipy.stats.fisher_exact when comparing probabilities
+    p = np.where(pmf <= observed[..., np.newaxis] * (1 + 1e-7), pmf, 0).sum(axis=-1)
+    degenerate = (trues == 0) | (trues == total) | (column == 0) | (column == total)
+    return np.where(degenerate, 1.0, np.clip(p, 0, 1))
+
+
+def odds_ratio_matrix(counts):
+    """Returns the odds ratios (see odds_ratio) for every pair of columns of a contingency tensor."""
+    t1, t2 = counts[0][:, np.newaxis], counts[0][np.newaxis, :]
+    f1, f2 = counts[1][:, np.newaxis], counts[1][np.newaxis, :]
+    correction = np.where((t1 == 0) | (t2 == 0) | (f1 == 0) | (f2 == 0), 0.5, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        odds0 = (t1 + correction) / (t2 + correction)
+        odds1 = (f1 + correction) / (f2 + correction)
+        return np.where(odds0 > odds1, odds0 / odds1, odds1 / odds0)
+
+
+def pairwise_stats(samples, boolean):
+    """
+    Returns the matrices of test p-values and effect sizes for every pair of samples, together with the
+    bounds used to bucket the effect sizes: Fisher's exact test and odds ratios for boolean samples,
+    Mann-Whitney U tests and A12 otherwise.
+    """
+    if boolean:
+        counts = contingency_tensor(samples)
+        return fisher_exact_matrix(counts), odds_ratio_matrix(counts), ODDS_RATIO_BOUNDS
+    u, p = mann_whitney_matrix(samples)
+    return p, a12_matrix(samples, u), A12_BOUNDS
+
+
 def compute_pairwise(data, x, y):
-    f1, f2, bounds2, _ = get_stat_functions(data, y)
-    unique_x = sorted(data[x].unique())
+    boolean = data[y].dtypes == bool
+    if not boolean and not pd.api.types.is_numeric_dtype(data[y]):
+        raise ValueError
+    groups = {k: v.to_numpy() for k, v in data.groupby(x)[y]}
+    unique_x = sorted(groups.keys())
+    p, e, bounds2 = pairwise_stats([groups[x1] for x1 in unique_x], boolean)
     sig_level = compute_sig_level(unique_x)
     text = [[x2 for x2 in unique_x] for _ in unique_x]
     text_colors = [['black' for _ in unique_x] for _ in unique_x]
     background_colors = [['white' for _ in unique_x] for _ in unique_x]
-    for r, x1 in enumerate(unique_x):
-        for c, x2 in enumerate(unique_x):
-            values1 = data[data[x] == x1][y]
-            values2 = data[data[x] == x2][y]
+    for r in range(len(unique_x)):
+        for c in range(len(unique_x)):
             if r > c:
-                p = f1(values1, values2)
-                text[r][c] = f'{p:.2E}'
+                text[r][c] = f'{p[r][c]:.2E}'
                 text_colors[r][c] = 'black'
-                background_colors[r][c] = '#8080ff' if p < sig_level else '#e6e6f0'
+                background_colors[r][c] = '#8080ff' if p[r][c] < sig_level else '#e6e6f0'
             elif r < c:
-                e = f2(values1, values2)
-                text[r][c] = f'{e:.3f}'
-                bucket = compute_bucket(e, bounds2)
+                text[r][c] = f'{e[r][c]:.3f}'
+                bucket = compute_bucket(e[r][c], bounds2)
                 text_colors[r][c] = ['black', 'black', 'black', 'white'][bucket]
                 background_colors[r][c] = ['#f0e6e6', '#ff8080', '#ff0000', '#800000'][bucket]
     return text, text_colors, background_colors
@@ -110,13 +409,118 @@ def format_time_delta(time_delta):
     return f'{round(value, 3)}M'
 
 
-def fig_to_html(bbox_inches='tight'):
+def fig_to_html(bbox_inches='tight', format='png'):
+    """Embeds the current figure as a 600-dpi PNG or, with format='svg', as compact inline SVG."""
     buffer = BytesIO()
+    if format == 'svg':
+        # Keep text as text instead of converting every glyph into a path
+        with mpl.rc_context({'svg.fonttype': 'none'}):
+            plt.savefig(buffer, bbox_inches=bbox_inches, format='svg')
+        plt.close()
+        svg = buffer.getvalue().decode('utf-8')
+        return svg[svg.index('<svg'):]
     plt.savefig(buffer, dpi=600, bbox_inches=bbox_inches, format='png')
     plt.close()
     return f'<img src="data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode("utf-8")}">'
 
 
+# Minimal client-side renderer for plots embedded with json_plot_html
+JSON_PLOT_SCRIPT = """
+<script>
+document.querySelectorAll('div.json-plot').forEach(function (div) {
+    var plot = JSON.parse(div.dataset.plot), w = 800, h = 400, m = 50, xs = [], ys = [0];
+    plot.series.forEach(function (s) { xs = xs.concat(s.x); ys = ys.concat(s.max); });
+    var xMax = Math.max.apply(null, xs.concat([1])), yMax = Math.max.apply(null, ys.concat([1]));
+    var sx = function (v) { return m + v / xMax * (w - 2 * m); };
+    var sy = function (v) { return h - m - v / yMax * (h - 2 * m); };
+    var points = function (x, y) { return x.map(function (v, i) { return sx(v) + ',' + sy(y[i]); }).join(' '); };
+    var svg = '<svg viewBox="0 0 ' + w + ' ' + h + '" width="' + w + '">';
+    svg += '<text x="' + w / 2 + '" y="20" text-anchor="middle" font-weight="bold">' + plot.title + '</text>';
+    svg += '<path d="M' + m + ',' + m + 'V' + (h - m) + 'H' + (w - m) + '" fill="none" stroke="black"/>';
+    svg += '<text x="' + m + '" y="' + (h - m + 15) + '" text-anchor="middle">0</text>';
+    svg += '<text x="' + (w - m) + '" y="' + (h - m + 15) + '" text-anchor="middle">' + Math.round(xMax) + '</text>';
+    svg += '<text x="' + (m - 5) + '" y="' + m + '" text-anchor="end">' + Math.round(yMax) + '</text>';
+    svg += '<text x="' + w / 2 + '" y="' + (h - 10) + '" text-anchor="middle">' + plot.xlabel + '</text>';
+    svg += '<text transform="rotate(-90)" x="' + -h / 2 + '" y="15" text-anchor="middle">' + plot.ylabel + '</text>';
+    plot.series.forEach(function (s, i) {
+        svg += '<polygon points="' + points(s.x, s.max) + ' ' + points(s.x.slice().reverse(), s.min.slice().reverse()) +
+            '" fill="' + s.color + '" fill-opacity="0.2"/>';
+        svg += '<polyline points="' + points(s.x, s.median) + '" fill="none" stroke-width="2" stroke="' + s.color +
+            '" stroke-dasharray="' + s.dash + '"/>';
+        svg += '<text x="' + (w - m + 5) + '" y="' + (m + 15 * i) + '" font-size="10" fill="' + s.color + '">' +
+            s.label + '</text>';
+    });
+    div.innerHTML = svg + '</svg>';
+});
+</script>
+"""
+
+
+def dash_array(line_style):
+    """Converts a matplotlib line style into an SVG stroke-dasharray."""
+    named = {'-': '', 'solid': '', '--': '6,3', 'dashed': '6,3', ':': '1,3', 'dotted': '1,3',
+             '-.': '6,3,1,3', 'dashdot': '6,3,1,3'}
+    if isinstance(line_style, str):
+        return named[line_style]
+    return ','.join(str(v) for v in line_style[1])
+
+
+def finite_points(series, columns):
+    """Copy of series keeping only the points whose values in all columns are finite."""
+    keep = np.isfinite(np.array([series[c] for c in columns], dtype=float)).all(axis=0)
+    return {**series, **{c: [v for v, k in zip(series[c], keep) if k] for c in columns}}
+
+
+def json_plot_html(title, series, xlabel='', ylabel=''):
+    """
+    Embeds a band plot as JSON data, drawn by JSON_PLOT_SCRIPT when the page is opened.
+    Each series is a dict with label, color, dash, and equally long x, median, min and max lists.
+    Points with a missing (NaN) value are dropped, since JSON.parse rejects NaN.
+    """
+    series = [finite_points(s, ['x', 'median', 'min', 'max']) for s in series]
+    plot = json.dumps({'title': title, 'xlabel': xlabel, 'ylabel': ylabel, 'series': series}, separators=(',', ':'),
+                      allow_nan=False)
+    return f'<div class="json-plot" data-plot="{html.escape(plot)}"></div>'
+
+
+def lttb(x, y, threshold, keep=None):
+    """
+    Returns the sorted indices of the points kept by Largest-Triangle-Three-Buckets downsampling.
+    Steinarsson, S. (2013). Downsampling Time Series for Visual Representation. University of Iceland.
+    Indices in keep are always retained: the series is split at them and every segment gets a share of
+    the threshold proportional to its length.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    keep = np.unique(np.concatenate([[0, n - 1], np.asarray(keep if keep is not None else [], dtype=int)])) \
+        if n > 0 else np.zeros(0, dtype=int)
+    if threshold >= n or n <= 2:
+        return np.arange(n)
+    budget = max(threshold - len(keep), 0)
+    selected = [keep]
+    for start, end in zip(keep[:-1], keep[1:]):
+        # Interior points of the segment, between two retained points
+        interior = end - start - 1
+        if interior <= 0:
+            continue
+        buckets = min(int(round(budget * interior / (n - len(keep)))), interior)
+        if buckets == 0:
+            continue
+        edges = start + 1 + np.floor(np.arange(buckets + 1) * interior / buckets).astype(int)
+        a = start
+        for i in range(buckets):
+            lo, hi = edges[i], edges[i + 1]
+            # Average of the next bucket, or the segment end for the last bucket
+            next_lo, next_hi = (edges[i + 1], edges[i + 2]) if i + 1 < buckets else (end, end + 1)
+            avg_x = x[next_lo:next_hi].mean()
+            avg_y = y[next_lo:next_hi].mean()
+            area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+            a = lo + int(np.argmax(area))
+            selected.append([a])
+    return np.unique(np.concatenate(selected))
+
+
 def fig_to_pdf(path, fig):
     plt.rcParams.update({
         "pgf.texsystem": "pdflatex",
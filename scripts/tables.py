@@ -1,10 +1,12 @@
 import os
+import numpy as np
 import pandas as pd
 
 import report_util
 
 BASELINE_FUZZER = 'Zest'
 FUZZER_ORDER = ['Random', 'Zest-Mini', 'Zest', 'EI', 'BeDivFuzz', 'Zeugma']
+BOOTSTRAP_CI_LABEL = f'{report_util.CONFIDENCE_LEVEL:.0%} CI'
 
 
 def highlight_max(data, props):
@@ -33,26 +35,42 @@ def pivot(data, col, row, value, col2='time'):
     return data
 
 
-def create_stat_table_frame(data, x, baseline_x, y):
+def create_stat_table_frame(data, x, baseline_x, y, ci_method='percentile', key=()):
+    """
+    Statistic of y for every treatment with its bootstrap CI, and the unfolded A12 (the probability that the
+    treatment beats the baseline, see report_util.batch_a12) with its CI.
+    key identifies the group of data, and seeds the bootstrap of every treatment together with the treatment.
+    """
     treatments = sorted(data[x].unique())
     rows = []
     baseline_values = data[data[x] == baseline_x][y]
     sig_level = report_util.compute_sig_level(treatments)
     test, _, _, stat = report_util.get_stat_functions(data, y)
+    batch_stat = report_util.batch_mean if stat is np.mean else report_util.batch_median
     for treatment in treatments:
         values = data[data[x] == treatment][y]
         sig = ''
         if len(baseline_values) > 0 and test(baseline_values, values) < sig_level:
             sig = 'color: red;'
-        rows.append([treatment, stat(values), sig])
-    return pd.DataFrame(rows, columns=[x, 'stat', 'sig'])
-
-
-def create_stat_table(data, x, baseline_x, y, columns):
+        rng = report_util.group_rng(*key, y, treatment)
+        stat_low, stat_high = report_util.bootstrap_ci([values], batch_stat, ci_method, rng=rng)
+        if len(baseline_values) > 0:
+            a12 = report_util.batch_a12(values.to_numpy(dtype=float), baseline_values.to_numpy(dtype=float))
+            a12_low, a12_high = report_util.bootstrap_ci([values, baseline_values], report_util.batch_a12, ci_method,
+                                                         rng=rng)
+        else:
+            a12, a12_low, a12_high = np.nan, np.nan, np.nan
+        rows.append([treatment, stat(values), sig, stat_low, stat_high, a12, a12_low, a12_high])
+    return pd.DataFrame(rows, columns=[x, 'stat', 'sig', 'stat_low', 'stat_high',
+                                       'a12_unfolded', 'a12_unfolded_low', 'a12_unfolded_high'])
+
+
+def create_stat_table(data, x, baseline_x, y, columns, ci_method='percentile'):
     groups = data[columns].drop_duplicates().to_dict(orient='records')
     frames = []
     for group in groups:
-        frame = create_stat_table_frame(report_util.select(data, **group), x=x, baseline_x=baseline_x, y=y)
+        frame = create_stat_table_frame(report_util.select(data, **group), x=x, baseline_x=baseline_x, y=y,
+                                        ci_method=ci_method, key=tuple(group.values()))
         for k, v in group.items():
             frame[k] = v
         frames.append(frame)
@@ -80,10 +98,13 @@ def times_to_detected(data, times):
 def create_defect_table(data, times):
     data = times_to_detected(data, times)
     table = create_stat_table(data, x='fuzzer', baseline_x=BASELINE_FUZZER, y='detected', columns=['time', 'defect'])
+    table['ci'] = [f'{BOOTSTRAP_CI_LABEL}: [{low:.2f}, {high:.2f}]' for low, high in zip(table['stat_low'], table['stat_high'])]
     stats = pivot(table, 'defect', 'fuzzer', 'stat').reindex(FUZZER_ORDER)
     sigs = pivot(table, 'defect', 'fuzzer', 'sig')
+    cis = pivot(table, 'defect', 'fuzzer', 'ci').reindex(FUZZER_ORDER)
     return style_table(stats, precision=2, axis=0) \
         .apply(lambda _: sigs, axis=None) \
+        .set_tooltips(cis) \
         .set_caption('Defect Detection Rates.')
 
 
@@ -141,9 +162,8 @@ def create_ir_pairwise(data):
 
 
 def create_pairwise(data, x, y, columns, caption_f):
-    groups = data[columns] \
-        .drop_duplicates() \
-        .sort_values(by=columns) \
-        .to_dict(orient='records')
-    return [report_util.pairwise_heatmap(report_util.select(data, **group), x, y, caption_f(**group)) for group in
-            groups]
+    heatmaps = []
+    for key, group in data.groupby(columns, sort=True):
+        group_values = dict(zip(columns, key if isinstance(key, tuple) else (key,)))
+        heatmaps.append(report_util.pairwise_heatmap(group, x, y, caption_f(**group_values)))
+    return heatmaps